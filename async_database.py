@@ -0,0 +1,214 @@
+# async_database.py
+# ASYNCIO DATA LAYER – the core database.py calls on psycopg 3's async connection pool
+#
+#   import asyncio, async_database as adb
+#   books = asyncio.run(adb.get_all_books("orwell", limit=50))
+#
+# One event loop keeps thousands of lookups in flight on ASYNC_POOL_MAX_SIZE
+# connections instead of parking a thread per request. The statements are
+# database.py's *_SQL constants, rows become the same records, and reads are
+# cached under the synchronous functions' names and tags, so a write through
+# either API invalidates both. Needs `pip install "psycopg[binary,pool]"`;
+# without it, and in demo or offline mode, each call runs its synchronous twin
+# on a worker thread instead.
+import asyncio
+import time
+
+import database
+import passwords
+from database import LoanResult, member_loans_tag
+from records import Book, Club, Loan
+
+try:
+    import psycopg
+    import psycopg.errors
+    from psycopg.conninfo import make_conninfo
+    from psycopg.rows import dict_row
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:
+    psycopg = None
+
+cache = database.cache
+pool = None
+_pool_lock = None
+_pool_loop = None    # the event loop pool and _pool_lock belong to
+_retry_at = 0.0      # after a failed pool open, calls use the sync layer until then
+
+
+# ────────────────────── POOL ──────────────────────
+async def open_pool():
+    """
+    Open the async pool on first use in each event loop (a pool can't outlive
+    the loop it was opened in, e.g. across asyncio.run() calls). Returns False
+    when calls should go through the synchronous layer instead (no psycopg 3,
+    demo mode, offline replica).
+    """
+    global pool, _pool_lock, _pool_loop, _retry_at
+    if psycopg is None:
+        return False
+    if database.DB_CONNECTED is None:
+        await asyncio.to_thread(database.connect)
+    if not database.DB_CONNECTED:
+        return False
+    loop = asyncio.get_running_loop()
+    if _pool_loop is not loop:
+        # The previous loop is gone along with its connections; start over in this one
+        pool, _pool_lock, _pool_loop = None, asyncio.Lock(), loop
+    if pool is not None:
+        return True
+    if time.monotonic() < _retry_at:
+        return False
+    async with _pool_lock:
+        if pool is None:
+            settings, _ = database.load_settings()
+            new_pool = AsyncConnectionPool(
+                make_conninfo(**settings), min_size=database.POOL_MIN_SIZE,
+                max_size=database.ASYNC_POOL_MAX_SIZE, timeout=database.POOL_TIMEOUT,
+                check=AsyncConnectionPool.check_connection, name="smartlibrary-async", open=False)
+            try:
+                await new_pool.open(wait=True, timeout=database.POOL_TIMEOUT)
+            except Exception as e:
+                await new_pool.close()
+                _retry_at = time.monotonic() + database.REPLICA_RETRY_INTERVAL
+                print("Async pool unavailable → using the synchronous data layer:", e)
+                return False
+            pool = new_pool
+    return True
+
+
+async def close_pool():
+    global pool
+    if pool is not None and _pool_loop is asyncio.get_running_loop():
+        await pool.close()
+    pool = None
+
+
+async def _fetch(query, params=(), record=None):
+    """execute(fetch=True) for the async pool: records built from tuples, or dicts when record is None."""
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=dict_row if record is None else None) as cur:
+            await cur.execute(query, params)
+            rows = await cur.fetchall()
+            if record is None:
+                return rows
+            make = record.row_factory([column.name for column in cur.description])
+            return [make(row) for row in rows]
+
+
+async def _read(sync_fn, args, query, params, record=None):
+    """Run a read on the pool; a lost connection hands the call to the sync function (replica fallback)."""
+    try:
+        return await _fetch(query, params, record)
+    except psycopg.OperationalError as e:
+        print("DB Error:", e)
+        cache.discard_current()
+        return await asyncio.to_thread(sync_fn, *args)
+    except psycopg.Error as e:
+        print("DB Error:", e)
+        cache.discard_current()   # don't cache the empty fallback result
+        return []
+
+
+# ────────────────────── LOGIN ──────────────────────
+async def authenticate_user(username, password):
+    if not await open_pool():
+        return await asyncio.to_thread(database.authenticate_user, username, password)
+    try:
+        rows = await _fetch(database.LOGIN_SQL, (username,))
+    except psycopg.OperationalError as e:
+        print("DB Error:", e)
+        return await asyncio.to_thread(database.authenticate_user, username, password)
+    except psycopg.Error as e:
+        print("DB Error:", e)
+        raise   # not a wrong password — see database.authenticate_user()
+    user = dict(rows[0]) if rows else None
+    stored = user.pop("password") if user else None
+    # scrypt is deliberately slow — keep it off the event loop
+    if not await asyncio.to_thread(passwords.verify_password, password, stored):
+        return None
+    if passwords.needs_rehash(stored):
+        new_hash = await asyncio.to_thread(passwords.hash_password, password)
+        async with pool.connection() as conn:
+            await conn.execute(database.REHASH_SQL, (new_hash, username, stored))
+        stored = new_hash
+    await asyncio.to_thread(database.remember_login, username, stored, user)
+    return user
+
+
+# ────────────────────── BOOKS ──────────────────────
+@cache.cached_async("books", name="get_all_books")
+async def get_all_books(search="", limit=None, offset=0):
+    if not await open_pool():
+        return await asyncio.to_thread(database.get_all_books, search, limit, offset)
+    query, params = database.books_query(search, limit, offset)
+    return await _read(database.get_all_books, (search, limit, offset), query, params, Book)
+
+
+# ────────────────────── LOANS ──────────────────────
+@cache.cached_async(member_loans_tag, name="get_member_loans")
+async def get_member_loans(member_id):
+    if not await open_pool():
+        return await asyncio.to_thread(database.get_member_loans, member_id)
+    return await _read(database.get_member_loans, (member_id,), database.MEMBER_LOANS_SQL, (member_id,), Loan)
+
+
+@cache.cached_async("loans", name="get_active_loans")
+async def get_active_loans():
+    if not await open_pool():
+        return await asyncio.to_thread(database.get_active_loans)
+    return await _read(database.get_active_loans, (), database.ACTIVE_LOANS_SQL, (), Loan)
+
+
+async def issue_loan(book_id, member_id):
+    """Async issue_loan(): same atomic function, same retries, same LoanResult."""
+    if not await open_pool():
+        return await asyncio.to_thread(database.issue_loan, book_id, member_id)
+    try:
+        for attempt in range(database.LOAN_RETRIES):
+            try:
+                async with pool.connection() as conn:   # commits when the block exits cleanly
+                    cur = await conn.execute(database.ISSUE_LOAN_SQL,
+                                             (book_id, member_id, database.MAX_LOANS, database.LOAN_DAYS))
+                    result = LoanResult((await cur.fetchone())[0])
+                break
+            except (psycopg.errors.SerializationFailure, psycopg.errors.DeadlockDetected) as e:
+                if attempt == database.LOAN_RETRIES - 1:
+                    raise
+                print(f"Loan retry {attempt + 1}/{database.LOAN_RETRIES}:", e)
+                await asyncio.sleep(0.05 * (attempt + 1))
+    except psycopg.OperationalError as e:
+        print("DB Error:", e)
+        return await asyncio.to_thread(database.issue_loan, book_id, member_id)
+    except Exception as e:
+        print("DB Error:", e)
+        return LoanResult.ERROR
+    if result:
+        cache.invalidate("books", "loans", "holds", member_loans_tag(member_id))
+    return result
+
+
+async def return_loan(loan_id):
+    if not await open_pool():
+        return await asyncio.to_thread(database.return_loan, loan_id)
+    try:
+        async with pool.connection() as conn:
+            cur = await conn.execute(database.RETURN_LOAN_SQL, (loan_id,))
+            returned = await cur.fetchone()
+            if returned:
+                await conn.execute(database.RESTOCK_SQL, (returned[0], database.HOLD_PICKUP_DAYS))
+    except psycopg.OperationalError as e:
+        print("DB Error:", e)
+        return await asyncio.to_thread(database.return_loan, loan_id)
+    except psycopg.Error as e:
+        print("DB Error:", e)
+        return
+    if returned:
+        cache.invalidate("books", "loans", "holds", member_loans_tag(returned[1]))
+
+
+# ────────────────────── CLUBS ──────────────────────
+@cache.cached_async("clubs", name="get_all_clubs")
+async def get_all_clubs():
+    if not await open_pool():
+        return await asyncio.to_thread(database.get_all_clubs)
+    return await _read(database.get_all_clubs, (), database.CLUBS_SQL, (), Club)
@@ -0,0 +1,220 @@
+# auth.py
+# AUTHENTICATION – rate-limited logins, session tokens, plaintext → scrypt password migration
+#
+#   python auth.py --migrate-passwords     # hash every users.password still stored in plaintext
+#
+# login() checks the per-account limiter before spending any hashing time, runs
+# database.authenticate_user() (scrypt, ~50 ms on purpose — call it off the GUI
+# thread, as main.py's LoginWindow does) and opens a session: a random token
+# mapped to the user's role and member_id in an in-process LRU, so later
+# "who is this?" lookups (session()) are answered from memory. Sessions expire
+# after SESSION_IDLE seconds without use.
+import argparse
+import secrets
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from enum import Enum
+
+import database
+import passwords
+
+MAX_FAILURES = 5            # failed logins per account within FAILURE_WINDOW that lock it
+FAILURE_WINDOW = 900        # seconds
+LOCKOUT = 900               # seconds a locked account refuses logins
+TRACKED_ACCOUNTS = 10000    # LRU bound on accounts with recent failures
+SESSION_IDLE = 8 * 3600     # seconds a session survives without use
+SESSION_MAX = 1024          # LRU bound on open sessions
+
+
+class LoginResult(str, Enum):
+    """Outcome of login(); truthy only on success."""
+    SUCCESS = "success"
+    INVALID = "invalid"
+    LOCKED = "locked"
+    ERROR = "error"             # the database failed before the password could be checked
+
+    def __bool__(self):
+        return self is LoginResult.SUCCESS
+
+
+class RateLimiter:
+    """
+    MAX_FAILURES failed logins within `window` seconds lock an account for
+    `lockout` seconds. An attempt is reserved (begin) before the password is
+    hashed and settled (finish) afterwards; attempts still in flight count
+    against the limit, so parallel guesses can't all slip past the check.
+    """
+
+    def __init__(self, max_failures=MAX_FAILURES, window=FAILURE_WINDOW, lockout=LOCKOUT,
+                 max_accounts=TRACKED_ACCOUNTS):
+        self.max_failures = max_failures
+        self.window = window
+        self.lockout = lockout
+        self.max_accounts = max_accounts
+        self._accounts = OrderedDict()   # account -> [deque of failure times, locked until, attempts in flight]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(username):
+        return (username or "").strip().lower()
+
+    def _entry(self, key, now):
+        # Caller holds _lock
+        entry = self._accounts.pop(key, None) or [deque(), 0.0, 0]
+        while entry[0] and entry[0][0] < now - self.window:
+            entry[0].popleft()
+        self._accounts[key] = entry
+        while len(self._accounts) > self.max_accounts:
+            self._accounts.popitem(last=False)
+        return entry
+
+    def retry_after(self, username):
+        """Seconds until the account may try again (0 = not locked)."""
+        with self._lock:
+            entry = self._accounts.get(self._key(username))
+            return max(0.0, entry[1] - time.monotonic()) if entry else 0.0
+
+    def begin(self, username):
+        """Reserve one attempt; False if the account is locked or its remaining attempts are all in flight."""
+        key, now = self._key(username), time.monotonic()
+        with self._lock:
+            entry = self._entry(key, now)
+            if entry[1] > now or len(entry[0]) + entry[2] >= self.max_failures:
+                return False
+            entry[2] += 1
+            return True
+
+    def finish(self, username, ok):
+        """
+        Settle a reserved attempt: success clears the account, failure is counted
+        (and may lock it), None — the password was never checked — only frees the reservation.
+        """
+        key, now = self._key(username), time.monotonic()
+        with self._lock:
+            entry = self._entry(key, now)
+            entry[2] = max(0, entry[2] - 1)
+            if ok is None:
+                return
+            if ok:
+                entry[0].clear()
+                if not entry[2]:
+                    del self._accounts[key]
+                return
+            entry[0].append(now)
+            if len(entry[0]) >= self.max_failures:
+                entry[0].clear()
+                entry[1] = now + self.lockout
+
+
+class SessionCache:
+    """token -> user dict, least recently used evicted past max_entries, idle sessions expire."""
+
+    def __init__(self, max_entries=SESSION_MAX, idle=SESSION_IDLE):
+        self.max_entries = max_entries
+        self.idle = idle
+        self._sessions = OrderedDict()   # token -> (expires_at, user)
+        self._lock = threading.Lock()
+
+    def open(self, user):
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._sessions[token] = (time.monotonic() + self.idle, dict(user))
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+        return token
+
+    def get(self, token):
+        with self._lock:
+            entry = self._sessions.get(token)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._sessions[token]
+                return None
+            self._sessions[token] = (time.monotonic() + self.idle, entry[1])
+            self._sessions.move_to_end(token)
+            return dict(entry[1])
+
+    def close(self, token):
+        with self._lock:
+            return self._sessions.pop(token, None) is not None
+
+    def close_user(self, username):
+        """End every session of one user (password change, account disabled)."""
+        with self._lock:
+            for token in [t for t, (_, user) in self._sessions.items() if user.get("username") == username]:
+                del self._sessions[token]
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+limiter = RateLimiter()
+sessions = SessionCache()
+
+
+# ────────────────────── LOGIN ──────────────────────
+def login(username, password):
+    """
+    (LoginResult, user) — user is the authenticate_user() dict plus "token" on
+    success, else None. A locked account is refused before any hashing is done;
+    a database error is LoginResult.ERROR and doesn't count as a failed attempt.
+    """
+    if not limiter.begin(username):
+        return LoginResult.LOCKED, None
+    user = checked = None
+    try:
+        user = database.authenticate_user(username, password)
+        checked = True
+    except Exception as e:
+        print("Login error:", e)
+    finally:
+        limiter.finish(username, bool(user) if checked else None)
+    if not checked:
+        return LoginResult.ERROR, None
+    if not user:
+        return (LoginResult.LOCKED if limiter.retry_after(username) else LoginResult.INVALID), None
+    return LoginResult.SUCCESS, {**user, "token": sessions.open(user)}
+
+
+def session(token):
+    """The user dict behind a session token (no database round-trip), or None once expired."""
+    return sessions.get(token) if token else None
+
+
+def logout(token):
+    return sessions.close(token)
+
+
+# ────────────────────── PASSWORD MIGRATION ──────────────────────
+def migrate_passwords(batch=500):
+    """Replace every plaintext users.password with a scrypt hash. Returns the rows converted."""
+    converted = 0
+    while True:
+        rows = database.get_unhashed_passwords(batch)
+        if not rows:
+            return converted
+        for username, plaintext in rows:
+            if database.set_password_hash(username, plaintext, passwords.hash_password(plaintext)):
+                converted += 1
+        print(f"Hashed {converted} password(s)…")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Authentication maintenance")
+    parser.add_argument("--migrate-passwords", action="store_true", help="hash all plaintext passwords now")
+    args = parser.parse_args(argv)
+
+    if not args.migrate_passwords:
+        parser.print_help()
+        return 0
+    if not database.is_connected():
+        sys.exit("PostgreSQL is not reachable — nothing to migrate")
+    print(f"Converted {migrate_passwords()} plaintext password(s) to scrypt hashes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,384 @@
+# benchmark.py
+# BENCHMARKS – synthetic library → timed data-layer calls and headless dashboard loads
+#
+#   python benchmark.py                                         # demo mode, small library
+#   python benchmark.py --books 1000000 --members 100000 --loans 2000000 --out big.json
+#   python benchmark.py --postgres --books 100000 --out pg.json # a scratch PostgreSQL (SMARTLIB_DB_*)
+#   python benchmark.py --compare baseline.json --out new.json  # flag regressions against a saved run
+#
+# The library is generated from a fixed seed, so two runs with the same options
+# time the same data. Every timed call starts with a cold query cache. Results
+# are p50/p95/p99 (ms) plus the peak Python allocation (tracemalloc) of one extra
+# call; with --postgres the report also lists the query shapes that took the
+# most total time (see query_stats.py). --postgres LOADS DATA into the configured
+# database: point SMARTLIB_DB_DBNAME at a throwaway database that has been
+# through migrate.py.
+import argparse
+import csv
+import io
+import json
+import math
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+# Read when database is imported: the benchmark never touches the real demo log or replica
+os.environ.setdefault("SMARTLIB_DEMO_STORE_PATH", "")
+os.environ.setdefault("SMARTLIB_REPLICA_PATH", "")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import database
+
+SEED = 20240501
+REPEAT = 20
+THREADS = 8
+OPS_PER_THREAD = 50
+LOAD_BATCH = 10000
+
+ADJECTIVES = ("silent", "broken", "golden", "hidden", "last", "northern", "secret", "burning", "quiet", "lost",
+              "crimson", "distant", "frozen", "wild", "hollow", "bright", "forgotten", "iron", "paper", "glass")
+NOUNS = ("river", "garden", "empire", "shadow", "harbor", "kingdom", "letter", "mirror", "forest", "engine",
+         "island", "winter", "city", "orchard", "library", "station", "voyage", "tower", "storm", "signal")
+FIRST_NAMES = ("Ada", "Kofi", "Mei", "Lars", "Amara", "Diego", "Priya", "Tomas", "Zainab", "Yuki",
+               "Olu", "Sven", "Nadia", "Ravi", "Elena", "Idris", "Hana", "Mateo", "Fatou", "Ivan")
+LAST_NAMES = ("Mensah", "Okafor", "Lindqvist", "Moreno", "Sato", "Kamara", "Novak", "Haddad", "Costa", "Bangura",
+              "Ivanova", "Reyes", "Adeyemi", "Larsen", "Chen", "Kowalski", "Diallo", "Fischer", "Rossi", "Tanaka")
+GENRES = ("Fiction", "Fantasy", "Dystopia", "History", "Science", "Mystery", "Romance", "Poetry", "Biography", "Travel")
+
+
+# ────────────────────── SYNTHETIC LIBRARY ──────────────────────
+def _author(i):
+    first, last = FIRST_NAMES[i % len(FIRST_NAMES)], LAST_NAMES[(i // len(FIRST_NAMES)) % len(LAST_NAMES)]
+    generation = i // (len(FIRST_NAMES) * len(LAST_NAMES))
+    return f"{first} {last}" + (f" {generation + 1}" if generation else "")
+
+
+def synthetic_books(n, rng):
+    authors = max(1, n // 20)
+    for i in range(n):
+        title = f"The {rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS).title()}"
+        if rng.random() < 0.5:
+            title += f" of {rng.choice(NOUNS).title()}"
+        yield {"title": title, "author_name": _author(rng.randrange(authors)), "isbn": f"978{i:010d}",
+               "genre": rng.choice(GENRES), "published_year": rng.randint(1900, 2025),
+               "copies_available": rng.choice((0, 1, 1, 2, 3, 5))}
+
+
+def synthetic_members(n):
+    for i in range(1, n + 1):
+        yield {"full_name": f"{_author(i)} Reader", "email": f"member{i}@bench.smartlibrary.local"}
+
+
+def synthetic_loans(n, book_ids, member_ids, rng):
+    """Returned history plus one open loan for each of the first members (at most a fifth of the loans)."""
+    today = date.today()
+    open_loans = min(len(member_ids), n // 5)
+    for i in range(n):
+        opened = i >= n - open_loans
+        member_id = member_ids[i - (n - open_loans)] if opened else rng.choice(member_ids)
+        loan_date = today - timedelta(days=rng.randint(0, 20) if opened else rng.randint(21, 1500))
+        yield {"book_id": rng.choice(book_ids), "member_id": member_id, "loan_date": str(loan_date),
+               "due_date": str(loan_date + timedelta(days=database.LOAN_DAYS)),
+               "return_date": None if opened else str(loan_date + timedelta(days=rng.randint(1, 14)))}
+
+
+def _batches(rows, size=LOAD_BATCH):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _copy(table, columns, rows):
+    """COPY rows (dicts) into a PostgreSQL table with the change-feed triggers quiet."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow(["" if row[c] is None else row[c] for c in columns])
+    buf.seek(0)
+    with database.get_cursor(commit=True) as cur:
+        cur.execute("SET LOCAL smartlib.bulk_import = 'on'")
+        cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def load_library(books, members, loans, seed=SEED):
+    """Generate and load the library; returns (book_ids, member_ids) of the generated rows."""
+    rng = random.Random(seed)
+    postgres = database.is_connected()
+    if postgres:
+        first_book = database.execute("SELECT COALESCE(MAX(book_id), 0) + 1 AS n FROM books", fetch=True)[0]["n"]
+    else:
+        first_book = max((b["book_id"] for b in database.catalog.all()), default=0) + 1
+    author_ids = {}
+    for batch in _batches(synthetic_books(books, rng)):
+        database.add_books_batch(batch, author_ids)
+
+    if postgres:
+        first_member = database.execute("SELECT COALESCE(MAX(member_id), 0) + 1 AS n FROM members",
+                                        fetch=True)[0]["n"]
+        for batch in _batches(synthetic_members(members)):
+            _copy("members", ("full_name", "email"), batch)
+        book_ids = [r["book_id"] for r in database.execute(
+            "SELECT book_id FROM books WHERE book_id >= %s ORDER BY book_id", (first_book,), fetch=True)]
+        member_ids = [r["member_id"] for r in database.execute(
+            "SELECT member_id FROM members WHERE member_id >= %s ORDER BY member_id", (first_member,), fetch=True)]
+        for batch in _batches(synthetic_loans(loans, book_ids, member_ids, rng)):
+            _copy("loans", ("book_id", "member_id", "loan_date", "due_date", "return_date"), batch)
+        database.execute("ANALYZE", commit=True)
+    else:
+        demo = database.demo
+        book_ids = [b["book_id"] for b in database.catalog.all() if b["book_id"] >= first_book]
+        member_ids = []
+        with demo.lock:
+            for member in synthetic_members(members):
+                member_ids.append(demo.add("members", {"member_id": demo.allocate("members"), **member})["member_id"])
+            for loan in synthetic_loans(loans, book_ids, member_ids, rng):
+                demo.add("loans", {"loan_id": demo.allocate("loans"),
+                                   "title": database.catalog.get(loan["book_id"])["title"], **loan})
+    database.refresh_overdue()
+    database.cache.clear()
+    return book_ids, member_ids
+
+
+# ────────────────────── MEASUREMENT ──────────────────────
+def percentile(samples, p):
+    """Nearest-rank percentile of a sorted list."""
+    if not samples:
+        return None
+    return samples[max(0, math.ceil(p / 100 * len(samples)) - 1)]
+
+
+def summarize(seconds):
+    samples = sorted(s * 1000 for s in seconds)
+    if not samples:
+        return {"n": 0}
+    return {"n": len(samples), "p50_ms": round(percentile(samples, 50), 3), "p95_ms": round(percentile(samples, 95), 3),
+            "p99_ms": round(percentile(samples, 99), 3), "mean_ms": round(sum(samples) / len(samples), 3),
+            "min_ms": round(samples[0], 3), "max_ms": round(samples[-1], 3)}
+
+
+def peak_kib(fn):
+    """Peak Python allocation while fn() runs once."""
+    database.cache.clear()
+    tracemalloc.start()
+    try:
+        fn()
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def measure(fn, repeat=REPEAT, warmup=2):
+    """Time fn() `repeat` times, each from a cold query cache; summary plus peak memory."""
+    for _ in range(warmup):
+        database.cache.clear()
+        fn()
+    timings = []
+    for _ in range(repeat):
+        database.cache.clear()
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return {**summarize(timings), "peak_kib": peak_kib(fn)}
+
+
+# ────────────────────── BENCHMARKS ──────────────────────
+def bench_data_layer(results, book_ids, repeat):
+    sample = database.catalog.get(book_ids[len(book_ids) // 2]) if not database.is_connected() else None
+    title = sample["title"] if sample else "The Silent River"
+    searches = {"browse": "", "common word": "the", "noun": "garden", "author": LAST_NAMES[3],
+                "full title": title, "no match": "qzxv"}
+    page = database.CATALOG_PAGE_SIZE
+    for label, term in searches.items():
+        results[f"get_all_books[{label}]"] = measure(
+            lambda: database.get_all_books(term, limit=page, offset=0), repeat)
+    deep = max(0, min(len(book_ids), 5000) - page)
+    results["get_all_books[browse, deep page]"] = measure(
+        lambda: database.get_all_books("", limit=page, offset=deep), repeat)
+    results["get_active_loans"] = measure(database.get_active_loans, max(3, repeat // 4))
+    results["get_overdue_loans[first page]"] = measure(lambda: database.get_overdue_loans(limit=page), repeat)
+    results["get_dashboard_stats"] = measure(database.get_dashboard_stats, repeat)
+
+
+def bench_loans_concurrent(results, book_ids, member_ids, threads, ops):
+    """Each thread checks books out and back in for its own members (no open loans of their own)."""
+    members = member_ids[-threads:] if len(member_ids) >= threads else member_ids
+    issued, returned, outcomes = [], [], {}
+    lock = threading.Lock()
+
+    def worker(member_id, rng):
+        for _ in range(ops):
+            book_id = rng.choice(book_ids)
+            started = time.perf_counter()
+            result = database.issue_loan(book_id, member_id)
+            issued.append(time.perf_counter() - started)
+            with lock:
+                outcomes[str(result.value)] = outcomes.get(str(result.value), 0) + 1
+            if not result:
+                continue
+            for loan in database.get_member_loans(member_id):
+                started = time.perf_counter()
+                database.return_loan(loan.loan_id)
+                returned.append(time.perf_counter() - started)
+
+    pool = [threading.Thread(target=worker, args=(m, random.Random(SEED + i)), name=f"bench-{i}")
+            for i, m in enumerate(members)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+    results["issue_loan[concurrent]"] = {**summarize(issued), "threads": len(pool), "outcomes": outcomes,
+                                         "ops_per_second": round((len(issued) + len(returned)) / elapsed, 1)}
+    results["return_loan[concurrent]"] = summarize(returned)
+
+
+def bench_gui(results, repeat):
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    from dashboard_librarian import LibrarianDashboard
+    from dashboard_member import MemberDashboard
+
+    def until(signal, trigger, timeout=60.0):
+        # Searches finish on a worker thread; done = the results slot has run on the GUI thread
+        done = []
+        connection = signal.connect(lambda *_: done.append(True))
+        try:
+            trigger()
+            deadline = time.monotonic() + timeout
+            while not done and time.monotonic() < deadline:
+                app.processEvents()
+                time.sleep(0.0005)
+        finally:
+            signal.disconnect(connection)
+
+    started = time.perf_counter()
+    librarian = LibrarianDashboard({"username": "benchmark"})
+    member = MemberDashboard({"username": "benchmark", "member_id": 1})
+    app.processEvents()
+    results["dashboards[construct]"] = summarize([time.perf_counter() - started])
+
+    results["LibrarianDashboard.load_books"] = measure(
+        lambda: until(librarian.book_search.results, lambda: librarian.load_books("")), repeat)
+    results["LibrarianDashboard.load_books[search]"] = measure(
+        lambda: until(librarian.book_search.results, lambda: librarian.load_books("garden")), repeat)
+    results["LibrarianDashboard.load_loans"] = measure(librarian.load_loans, max(3, repeat // 4))
+    results["MemberDashboard.refresh_catalog"] = measure(
+        lambda: until(member.catalog_search.results, member.refresh_catalog), repeat)
+    for window in (librarian, member):
+        window.close()
+
+
+# ────────────────────── REPORT ──────────────────────
+def compare(baseline, current, threshold=20.0):
+    """Print p50/p95 changes per benchmark; returns the names that got slower by more than threshold %."""
+    regressions = []
+    differs = [k for k in ("mode", "books", "members", "loans", "seed")
+               if baseline["meta"].get(k) != current["meta"].get(k)]
+    if differs:
+        print("Note: baseline was run with different", ", ".join(differs), "— timings aren't comparable")
+    print(f"{'benchmark':48} {'p50 base':>10} {'p50 now':>10} {'p95 base':>10} {'p95 now':>10}  change")
+    for name, now in current["results"].items():
+        base = baseline["results"].get(name)
+        if not base or not base.get("p50_ms") or not now.get("p50_ms"):
+            continue
+        change = 100.0 * (now["p50_ms"] - base["p50_ms"]) / base["p50_ms"]
+        flag = "  << slower" if change > threshold else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:48} {base['p50_ms']:>10.2f} {now['p50_ms']:>10.2f} {base['p95_ms']:>10.2f} "
+              f"{now['p95_ms']:>10.2f}  {change:+6.1f}%{flag}")
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=database.BASE_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args):
+    if not args.postgres:
+        # Demo mode even where a server is reachable: the same switch connect() makes when it isn't
+        database.DB_CONNECTED = False
+        database.demo.open()
+    elif not database.is_connected():
+        raise SystemExit("--postgres: no database reachable with the SMARTLIB_DB_* settings")
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    book_ids, member_ids = load_library(args.books, args.members, args.loans, args.seed)
+    load_seconds = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"Loaded {len(book_ids)} books, {len(member_ids)} members, {args.loans} loans in {load_seconds:.1f}s")
+
+    database.query_stats.stats.reset()   # per-shape SQL timings cover the benchmarks, not the load
+    results = {}
+    bench_data_layer(results, book_ids, args.repeat)
+    bench_loans_concurrent(results, book_ids, member_ids, args.threads, args.ops)
+    if not args.no_gui:
+        bench_gui(results, args.repeat)
+
+    return {
+        "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": _git_commit(),
+                 "mode": "postgres" if args.postgres else "demo", "python": platform.python_version(),
+                 "platform": platform.platform(), "seed": args.seed, "repeat": args.repeat,
+                 "books": args.books, "members": args.members, "loans": args.loans},
+        "load": {"seconds": round(load_seconds, 2), "traced_kib": round(current / 1024, 1),
+                 "peak_kib": round(peak / 1024, 1),
+                 "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss},
+        "results": results,
+        "queries": database.query_metrics()["queries"][:25],   # PostgreSQL only: slowest shapes by total time
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the data layer and dashboards on a synthetic library")
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--members", type=int, default=2000)
+    parser.add_argument("--loans", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="timed calls per benchmark")
+    parser.add_argument("--threads", type=int, default=THREADS, help="concurrent issue/return threads")
+    parser.add_argument("--ops", type=int, default=OPS_PER_THREAD, help="checkouts per thread")
+    parser.add_argument("--postgres", action="store_true", help="use the configured PostgreSQL (loads data!)")
+    parser.add_argument("--no-gui", action="store_true", help="skip the offscreen dashboard timings")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", help="baseline JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=20.0, help="%% p50 slowdown that counts as a regression")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    text = json.dumps(report, indent=2, default=str)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print("Report written to", args.out)
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:g}%")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
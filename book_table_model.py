@@ -0,0 +1,126 @@
+# book_table_model.py
+# VIRTUALIZED CATALOG VIEW – lazily paged table model + painted Borrow button
+from PyQt5.QtWidgets import QStyle, QStyledItemDelegate, QStyleOptionButton, QApplication
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QEvent, pyqtSignal
+
+PAGE_SIZE = 100   # rows pulled from the data layer each time the view scrolls near the end
+
+
+class BookTableModel(QAbstractTableModel):
+    """
+    Table model over a paged data source: fetch_page(offset, limit) -> list of
+    records.Book rows (any objects with book_id and the column attributes).
+    Qt asks for more rows (canFetchMore/fetchMore) only as the user scrolls, so
+    memory and render time follow the viewport rather than the catalog size.
+    columns is a list of (key, header) pairs; ACTION_KEY renders the Borrow action
+    (Place Hold when no copies are on the shelf).
+    """
+    ACTION_KEY = "_action"
+
+    def __init__(self, columns, page_size=PAGE_SIZE, parent=None):
+        super().__init__(parent)
+        self.columns = columns
+        self.page_size = page_size
+        self._fetch_page = None
+        self._rows = []
+        self._positions = {}     # book_id -> row number, for patching single rows
+        self._exhausted = True
+
+    # ────────────── data source ──────────────
+    def set_source(self, fetch_page, first_page=None):
+        """Swap in a new result set; first_page may be prefetched off the GUI thread."""
+        self.beginResetModel()
+        self._fetch_page = fetch_page
+        self._rows = list(first_page) if first_page is not None else fetch_page(0, self.page_size)
+        self._positions = {book.book_id: i for i, book in enumerate(self._rows)}
+        self._exhausted = len(self._rows) < self.page_size
+        self.endResetModel()
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return
+        rows = self._fetch_page(len(self._rows), self.page_size)
+        self._exhausted = len(rows) < self.page_size
+        if rows:
+            first = len(self._rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+            self._rows.extend(rows)
+            for i, book in enumerate(rows, first):
+                self._positions[book.book_id] = i
+            self.endInsertRows()
+
+    def row_at(self, row):
+        return self._rows[row]
+
+    # ────────────── change feed patches ──────────────
+    def patch_row(self, book_id, changes):
+        """Update one loaded row (changes: a change-feed dict); rows not paged in yet are ignored."""
+        row = self._positions.get(book_id)
+        if row is None:
+            return
+        # A copy, so records shared with the query cache are never mutated
+        self._rows[row] = self._rows[row].updated(changes)
+        self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.columns) - 1))
+
+    def remove_book(self, book_id):
+        row = self._positions.pop(book_id, None)
+        if row is None:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._rows[row]
+        self._positions = {book.book_id: i for i, book in enumerate(self._rows)}
+        self.endRemoveRows()
+
+    # ────────────── Qt model interface ──────────────
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.columns[section][1]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        book = self._rows[index.row()]
+        key = self.columns[index.column()][0]
+        if key == self.ACTION_KEY:
+            return "Borrow" if (book.copies_available or 0) > 0 else "Place Hold"
+        value = getattr(book, key, "")
+        return "" if value is None else str(value)
+
+
+class BorrowButtonDelegate(QStyledItemDelegate):
+    """
+    Paints a push button in the action column and reports clicks by row —
+    no per-row QPushButton widgets. The receiver decides between borrowing
+    and placing a hold from the row's copies_available.
+    """
+    clicked = pyqtSignal(int)
+
+    def _enabled(self, index):
+        return index.data() in ("Borrow", "Place Hold")
+
+    def paint(self, painter, option, index):
+        button = QStyleOptionButton()
+        button.rect = option.rect.adjusted(4, 3, -4, -3)
+        button.text = index.data()
+        button.state = QStyle.State_Raised
+        if self._enabled(index):
+            button.state |= QStyle.State_Enabled
+        style = option.widget.style() if option.widget else QApplication.style()
+        style.drawControl(QStyle.CE_PushButton, button, painter, option.widget)
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            if self._enabled(index) and option.rect.contains(event.pos()):
+                self.clicked.emit(index.row())
+            return True
+        return super().editorEvent(event, model, option, index)
@@ -0,0 +1,164 @@
+# bulk_import.py
+# STREAMING CATALOG IMPORT – CSV / JSONL / MARC-lite → database.add_books_batch()
+#
+#   python bulk_import.py acquisitions.csv
+#   python bulk_import.py batch.jsonl --chunk-size 10000 --rejects rejected.jsonl
+#   python bulk_import.py records.mrk --format marc
+#
+# CSV/JSONL fields: title, author (or author_name), isbn, genre, year (or
+# published_year), copies (or copies_available). MARC-lite is one "TAG value"
+# line per field with a blank line between records:
+#   020 isbn · 100 author · 245 title · 264 year · 655 genre · 949 copies
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+import database
+
+CHUNK_SIZE = 5000
+MARC_FIELDS = {"020": "isbn", "100": "author", "245": "title", "264": "year", "655": "genre", "949": "copies"}
+
+
+# ────────────────────── READERS ──────────────────────
+# Each reader yields (record_number, raw_dict) lazily so the file is never fully in memory.
+def read_csv(f):
+    for n, record in enumerate(csv.DictReader(f), 1):
+        yield n, record
+
+
+def read_jsonl(f):
+    for n, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield n, json.loads(line)
+        except ValueError as e:
+            yield n, {"_error": f"invalid JSON: {e}", "_raw": line}
+
+
+def read_marc(f):
+    record, n = {}, 0
+    for line in f:
+        line = line.strip()
+        if not line:
+            if record:
+                n += 1
+                yield n, record
+                record = {}
+            continue
+        tag, _, value = line.partition(" ")
+        if tag in MARC_FIELDS:
+            # Drop a leading "$a"-style subfield code if the export kept it
+            value = value.strip()
+            if value.startswith("$") and len(value) > 2:
+                value = value[2:].strip()
+            record[MARC_FIELDS[tag]] = value
+    if record:
+        yield n + 1, record
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl, "marc": read_marc}
+
+
+# ────────────────────── VALIDATION ──────────────────────
+def _first(raw, *keys):
+    for key in keys:
+        value = raw.get(key)
+        if value not in (None, ""):
+            return str(value).strip()
+    return ""
+
+
+def normalize(raw):
+    """Return (row, None) for a valid record or (None, reason) for a reject."""
+    if "_error" in raw:
+        return None, raw["_error"]
+    title = _first(raw, "title")
+    author = _first(raw, "author_name", "author")
+    if not title:
+        return None, "missing title"
+    if not author:
+        return None, "missing author"
+    try:
+        year = int(_first(raw, "published_year", "year") or 0) or None
+        copies = int(_first(raw, "copies_available", "copies") or 1)
+    except ValueError:
+        return None, "year/copies is not a number"
+    if copies < 0:
+        return None, "negative copies"
+    isbn = _first(raw, "isbn").replace("-", "")
+    return {
+        "title": title, "author_name": author, "isbn": isbn or None,
+        "genre": _first(raw, "genre"), "published_year": year, "copies_available": copies
+    }, None
+
+
+# ────────────────────── PIPELINE ──────────────────────
+def import_file(path, fmt=None, chunk_size=CHUNK_SIZE, rejects_path=None, out=sys.stdout):
+    fmt = fmt or {".jsonl": "jsonl", ".json": "jsonl", ".mrk": "marc", ".marc": "marc"}.get(
+        os.path.splitext(path)[1].lower(), "csv")
+    rejects_path = rejects_path or path + ".rejects.jsonl"
+    totals = {"read": 0, "inserted": 0, "merged": 0, "rejected": 0}
+    author_ids = {}      # shared across chunks: each author is upserted once per run
+    started = time.monotonic()
+
+    with open(path, newline="", encoding="utf-8") as f, open(rejects_path, "w", encoding="utf-8") as rejects:
+        records = READERS[fmt](f)
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            rows = []
+            for n, raw in chunk:
+                row, reason = normalize(raw)
+                if row is None:
+                    rejects.write(json.dumps({"record": n, "reason": reason, "data": raw}, default=str) + "\n")
+                    totals["rejected"] += 1
+                else:
+                    rows.append(row)
+            totals["read"] += len(chunk)
+            try:
+                inserted, merged = database.add_books_batch(rows, author_ids)
+            except Exception as e:
+                # The whole chunk rolled back — send every row to the reject file with the reason
+                for row in rows:
+                    rejects.write(json.dumps({"record": None, "reason": f"batch failed: {e}", "data": row}, default=str) + "\n")
+                totals["rejected"] += len(rows)
+                author_ids.clear()   # ids from the rolled-back transaction may not exist
+            else:
+                totals["inserted"] += inserted
+                totals["merged"] += merged
+            elapsed = time.monotonic() - started
+            print(f"  {totals['read']:>9,} read | {totals['inserted']:>9,} new | {totals['merged']:>7,} merged | "
+                  f"{totals['rejected']:>6,} rejected | {totals['read'] / max(elapsed, 1e-9):,.0f} rows/s", file=out)
+
+    totals["seconds"] = round(time.monotonic() - started, 2)
+    totals["rejects_file"] = rejects_path if totals["rejected"] else None
+    if not totals["rejected"]:
+        os.remove(rejects_path)
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-import books into SmartLibrary")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=sorted(READERS), help="default: from file extension")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--rejects", help="reject file (default: <path>.rejects.jsonl)")
+    args = parser.parse_args(argv)
+
+    if not database.is_connected():
+        where = f"the demo store ({database.DEMO_STORE_PATH})" if database.DEMO_STORE_PATH else "the in-memory demo catalog"
+        print(f"Note: PostgreSQL not reachable — importing into {where}")
+    totals = import_file(args.path, args.format, args.chunk_size, args.rejects)
+    print(f"Done in {totals['seconds']}s: {totals['inserted']:,} inserted, {totals['merged']:,} merged, "
+          f"{totals['rejected']:,} rejected" + (f" (see {totals['rejects_file']})" if totals["rejects_file"] else ""))
+
+
+if __name__ == "__main__":
+    main()
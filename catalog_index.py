@@ -0,0 +1,135 @@
+# catalog_index.py
+# IN-MEMORY CATALOG – trigram inverted index used by database.py in demo mode
+import threading
+from collections import defaultdict
+
+SEARCH_FIELDS = ("title", "author_name", "genre", "isbn")
+_SEP = "\x1f"   # joins the lowercased fields; can't appear in a typed search
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class CatalogIndex:
+    """
+    Holds book rows by book_id together with a prelowercased search string and a
+    trigram → {book_id} inverted index over title, author, genre and ISBN.
+    A search for 3+ characters intersects posting sets (smallest first) and only
+    confirms the few candidates left, instead of lowercasing every row per keystroke.
+    """
+
+    def __init__(self, rows=()):
+        self._rows = {}                 # book_id -> row dict (insertion order = catalog order)
+        self._text = {}                 # book_id -> lowercased fields joined by _SEP
+        self._grams = defaultdict(set)  # trigram -> {book_id}
+        self._isbn = {}                 # isbn -> book_id, for merging imports
+        self._last_id = 0
+        self.copies_total = 0           # running SUM(copies_available) for dashboard stats
+        self._lock = threading.RLock()    # searches run on worker threads while the GUI writes
+        for row in rows:
+            self.add(row)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, book_id):
+        return book_id in self._rows
+
+    def next_id(self):
+        return self._last_id + 1
+
+    def get(self, book_id):
+        return self._rows.get(book_id)
+
+    def find_isbn(self, isbn):
+        book_id = self._isbn.get(isbn) if isbn else None
+        return self._rows.get(book_id) if book_id is not None else None
+
+    def all(self):
+        with self._lock:
+            return list(self._rows.values())
+
+    # ────────────── write path ──────────────
+    def _index(self, book_id, row):
+        text = _SEP.join(str(row.get(f) or "").lower() for f in SEARCH_FIELDS)
+        self._text[book_id] = text
+        if row.get("isbn"):
+            self._isbn[row["isbn"]] = book_id
+        for field in text.split(_SEP):
+            for gram in trigrams(field):
+                self._grams[gram].add(book_id)
+
+    def _unindex(self, book_id):
+        text = self._text.pop(book_id, "")
+        isbn = self._rows[book_id].get("isbn")
+        if isbn and self._isbn.get(isbn) == book_id:
+            del self._isbn[isbn]
+        for field in text.split(_SEP):
+            for gram in trigrams(field):
+                ids = self._grams.get(gram)
+                if ids is not None:
+                    ids.discard(book_id)
+                    if not ids:
+                        del self._grams[gram]
+
+    def add(self, row):
+        book_id = row["book_id"]
+        with self._lock:
+            if book_id in self._rows:
+                self._unindex(book_id)
+                self.copies_total -= self._rows[book_id].get("copies_available") or 0
+            self._rows[book_id] = row
+            self.copies_total += row.get("copies_available") or 0
+            self._last_id = max(self._last_id, book_id)
+            self._index(book_id, row)
+        return row
+
+    def update(self, book_id, **changes):
+        """Apply changes to a row; only re-indexes when a searchable field changed."""
+        with self._lock:
+            row = self._rows.get(book_id)
+            if row is None:
+                return None
+            reindex = any(f in changes and changes[f] != row.get(f) for f in SEARCH_FIELDS)
+            if reindex:
+                self._unindex(book_id)
+            if "copies_available" in changes:
+                self.copies_total += (changes["copies_available"] or 0) - (row.get("copies_available") or 0)
+            row.update(changes)
+            if reindex:
+                self._index(book_id, row)
+        return row
+
+    def remove(self, book_id):
+        with self._lock:
+            row = self._rows.get(book_id)
+            if row is not None:
+                self._unindex(book_id)
+                del self._rows[book_id]
+                self.copies_total -= row.get("copies_available") or 0
+        return row
+
+    # ────────────── read path ──────────────
+    def search(self, term):
+        """Case-insensitive substring match over the search fields, in catalog order."""
+        term = (term or "").strip().lower()
+        if not term:
+            return self.all()
+        with self._lock:
+            return self._search(term)
+
+    def _search(self, term):
+        if len(term) < 3:
+            # Too short for a trigram; still cheaper than the old scan since nothing is lowercased here
+            return [self._rows[i] for i, text in self._text.items() if term in text]
+        postings = []
+        for gram in trigrams(term):
+            ids = self._grams.get(gram)
+            if not ids:
+                return []
+            postings.append(ids)
+        postings.sort(key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+        # Trigram hits can still be false positives ("abcxbcd" for "abcd"), so confirm each one
+        return [self._rows[i] for i in sorted(candidates) if term in self._text[i]]
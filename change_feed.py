@@ -0,0 +1,100 @@
+# change_feed.py
+# ROW-LEVEL CHANGE FEED – PostgreSQL LISTEN/NOTIFY + in-process event bus
+#
+# Every event is a dict: {"table": "books" | "loans" | "club_members",
+#                         "op": "INSERT" | "UPDATE" | "DELETE", "row": {...}}
+# plus {"table": "*", "op": "RESYNC"} after the listener reconnects, because
+# notifications sent while it was disconnected are lost.
+import json
+import select
+import threading
+
+import psycopg2
+
+CHANNEL = "library_changes"     # must match migrations/002_change_feed.sql
+RECONNECT_DELAY = 5.0           # seconds between listener reconnect attempts
+
+
+class EventBus:
+    """Thread-safe publish/subscribe; callbacks run on the publishing thread."""
+
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = self._subscribers[:]
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                print("Change feed subscriber error:", e)
+
+
+bus = EventBus()
+
+
+def publish(table, op, row):
+    bus.publish({"table": table, "op": op, "row": dict(row)})
+
+
+class PgListener(threading.Thread):
+    """
+    Holds one dedicated autocommit connection LISTENing on CHANNEL and forwards
+    each NOTIFY payload to the bus. Reconnects on failure and then publishes a
+    RESYNC event so open windows reload once instead of missing changes.
+    """
+
+    def __init__(self, settings, event_bus=bus, channel=CHANNEL):
+        super().__init__(name="db-change-feed", daemon=True)
+        self.settings = dict(settings)
+        self.bus = event_bus
+        self.channel = channel
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        first = True
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.settings)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {self.channel}")
+                if not first:
+                    self.bus.publish({"table": "*", "op": "RESYNC", "row": {}})
+                first = False
+                self._listen(conn)
+            except psycopg2.Error as e:
+                print("Change feed disconnected:", e)
+                self._stop.wait(RECONNECT_DELAY)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _listen(self, conn):
+        while not self._stop.is_set():
+            if select.select([conn], [], [], 1.0) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                try:
+                    event = json.loads(notify.payload)
+                except ValueError:
+                    continue
+                self.bus.publish(event)
@@ -0,0 +1 @@
+# dao package — thin Data Access Objects over database.py used by the dashboards
@@ -0,0 +1,22 @@
+# dao/book_dao.py
+import database
+
+
+class BookDAO:
+    @staticmethod
+    def get_all_books(search="", limit=None, offset=0):
+        return database.get_all_books(search, limit=limit, offset=offset)
+
+    @staticmethod
+    def get_available_books(search="", limit=None, offset=0):
+        # Members see the whole catalog; unavailable titles are greyed out in the view
+        return database.get_all_books(search, limit=limit, offset=offset)
+
+    @staticmethod
+    def get_recommendations(member_id, limit=10):
+        return database.get_recommendations(member_id, limit)
+
+    @staticmethod
+    def add_book(**kwargs):
+        database.add_book(**kwargs)
+        return True
@@ -0,0 +1,8 @@
+# dao/change_dao.py
+import database
+
+
+class ChangeDAO:
+    @staticmethod
+    def subscribe(callback):
+        return database.subscribe_changes(callback)
@@ -0,0 +1,8 @@
+# dao/club_dao.py
+import database
+
+
+class ClubDAO:
+    @staticmethod
+    def get_all_clubs():
+        return database.get_all_clubs()
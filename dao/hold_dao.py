@@ -0,0 +1,16 @@
+# dao/hold_dao.py
+import database
+
+
+class HoldDAO:
+    @staticmethod
+    def place_hold(book_id, member_id):
+        return database.place_hold(book_id, member_id)
+
+    @staticmethod
+    def cancel_hold(hold_id, member_id):
+        return database.cancel_hold(hold_id, member_id)
+
+    @staticmethod
+    def get_member_holds(member_id):
+        return database.get_member_holds(member_id)
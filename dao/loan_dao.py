@@ -0,0 +1,36 @@
+# dao/loan_dao.py
+import database
+
+
+class LoanDAO:
+    @staticmethod
+    def get_active_loans():
+        return database.get_active_loans()
+
+    @staticmethod
+    def get_member_loans(member_id):
+        return database.get_member_loans(member_id)
+
+    @staticmethod
+    def issue_loan(book_id, member_id):
+        return database.issue_loan(book_id, member_id)
+
+    @staticmethod
+    def return_loan(loan_id):
+        return database.return_loan(loan_id)
+
+    @staticmethod
+    def get_active_loans_by_id(loan_ids):
+        return database.get_active_loans_by_id(loan_ids)
+
+    @staticmethod
+    def issue_loans(member_id, book_ids):
+        return database.issue_loans(member_id, book_ids)
+
+    @staticmethod
+    def return_loans(loan_ids):
+        return database.return_loans(loan_ids)
+
+    @staticmethod
+    def get_overdue_loans(limit=None, offset=0):
+        return database.get_overdue_loans(limit=limit, offset=offset)
@@ -0,0 +1,8 @@
+# dao/stats_dao.py
+import database
+
+
+class StatsDAO:
+    @staticmethod
+    def get_dashboard_stats():
+        return database.get_dashboard_stats()
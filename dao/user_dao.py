@@ -0,0 +1,21 @@
+# dao/user_dao.py
+import auth
+
+
+class UserDAO:
+    @staticmethod
+    def login(email, pwd):
+        """(auth.LoginResult, user with session token or None) — hashes the password, so call it off the GUI thread."""
+        return auth.login(email, pwd)
+
+    @staticmethod
+    def retry_after(email):
+        return auth.limiter.retry_after(email)
+
+    @staticmethod
+    def session(token):
+        return auth.session(token)
+
+    @staticmethod
+    def logout(token):
+        return auth.logout(token)
@@ -1,30 +1,44 @@
 # dashboard_librarian.py
 # FINAL PROFESSIONAL VERSION — 100% WORKING, NO ERRORS, CLEAN OOP
 
+from bisect import bisect_left
+
 from PyQt5.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel,
     QTabWidget, QTableWidget, QTableWidgetItem, QPushButton,
     QLineEdit, QMessageBox, QGroupBox, QFormLayout,
-    QHeaderView, QAbstractItemView
+    QHeaderView, QAbstractItemView, QTableView, QGridLayout, QCheckBox
 )
-from PyQt5.QtCore import Qt, QDate
+from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QBrush, QFont
 
+from book_table_model import BookTableModel, PAGE_SIZE
+from live_updates import LiveUpdates
+from records import Book, Club, Loan
+from search_worker import BatchedLookup, DebouncedSearch, PeriodicQuery
+
+STATS_REFRESH_MS = 30000   # dashboard counters are re-read in the background this often
+LOAN_PATCH_DELAY_MS = 100  # loan change events are collected this long, then re-read in one query
+
 # Safe DAO imports with full fallback
 try:
     from dao.book_dao import BookDAO
     from dao.loan_dao import LoanDAO
     from dao.club_dao import ClubDAO
+    from dao.stats_dao import StatsDAO
+    from dao.change_dao import ChangeDAO
 except ImportError:
     print("DAO not found → using professional demo mode")
 
     class BookDAO:
         @staticmethod
-        def get_all_books():
-            return [
-                {"book_id":1,"title":"1984","author_name":"George Orwell","genre":"Dystopia","copies_available":5},
-                {"book_id":2,"title":"Harry Potter","author_name":"J.K. Rowling","genre":"Fantasy","copies_available":8}
+        def get_all_books(search="", limit=None, offset=0):
+            books = [
+                Book(book_id=1, title="1984", author_name="George Orwell", genre="Dystopia", copies_available=5),
+                Book(book_id=2, title="Harry Potter", author_name="J.K. Rowling", genre="Fantasy", copies_available=8)
             ]
+            books = [b for b in books if search.lower() in f"{b.title} {b.author_name}".lower()]
+            return books[offset:offset + limit] if limit is not None else books[offset:]
         @staticmethod
         def add_book(**kwargs): return True
 
@@ -32,21 +46,40 @@ except ImportError:
         @staticmethod
         def get_active_loans():
             return [
-                {"loan_id":101,"title":"1984","member_name":"John Doe","loan_date":"2025-04-01","due_date":"2025-04-08"},
-                {"loan_id":102,"title":"Harry Potter","member_name":"Jane Smith","loan_date":"2025-03-30","due_date":"2025-04-06"}
+                Loan(loan_id=101, title="1984", member_name="John Doe", loan_date="2025-04-01", due_date="2025-04-08"),
+                Loan(loan_id=102, title="Harry Potter", member_name="Jane Smith", loan_date="2025-03-30", due_date="2025-04-06")
             ]
         @staticmethod
+        def get_active_loans_by_id(loan_ids):
+            return [l for l in LoanDAO.get_active_loans() if l.loan_id in loan_ids]
+        @staticmethod
+        def get_overdue_loans(limit=None, offset=0):
+            return [l for l in LoanDAO.get_active_loans() if l.days_overdue > 0][offset:]
+        @staticmethod
         def return_loan(lid):
             QMessageBox.information(None, "Returned", f"Book returned (Loan ID: {lid})")
+        @staticmethod
+        def return_loans(lids):
+            return [{"loan_id": lid, "status": "returned"} for lid in lids]
 
     class ClubDAO:
         @staticmethod
         def get_all_clubs():
             return [
-                {"club_id":1,"name":"Sci-Fi Lovers","description":"Monthly sci-fi","member_count":18},
-                {"club_id":2,"name":"Romance Readers","description":"Love stories","member_count":25}
+                Club(club_id=1, name="Sci-Fi Lovers", description="Monthly sci-fi", member_count=18),
+                Club(club_id=2, name="Romance Readers", description="Love stories", member_count=25)
             ]
 
+    class StatsDAO:
+        @staticmethod
+        def get_dashboard_stats():
+            return {"total_books": 2, "copies_on_shelf": 13, "active_loans": 2,
+                    "overdue_loans": 2, "due_today": 0, "book_clubs": 2}
+
+    class ChangeDAO:
+        @staticmethod
+        def subscribe(callback): return lambda: None
+
 class LibrarianDashboard(QMainWindow):
     def __init__(self, user):
         super().__init__()
@@ -68,6 +101,64 @@ class LibrarianDashboard(QMainWindow):
         tabs.addTab(self.clubs_tab(), "Book Clubs")
         self.setCentralWidget(tabs)
 
+        # Row-level changes from the data layer patch the open tables in place
+        self.live_updates = LiveUpdates(ChangeDAO.subscribe, self)
+        self.live_updates.changed.connect(self.apply_change)
+
+    def closeEvent(self, event):
+        self.live_updates.stop()
+        super().closeEvent(event)
+
+    def apply_change(self, event):
+        table, op, row = event["table"], event["op"], event["row"]
+        if op == "RESYNC":
+            # The feed reconnected and may have missed changes — reload once
+            self.load_books(self.book_search_box.text())
+            self.load_loans()
+            self.load_clubs()
+            self.stats_query.run_now()
+            return
+        if table == "books":
+            if op == "DELETE":
+                self.book_model.remove_book(row["book_id"])
+            else:
+                self.book_model.patch_row(row["book_id"], row)
+        elif table == "loans":
+            # Joined rows (title, member, overdue status) are re-read off the GUI thread, one query per burst
+            self.loan_lookup.request(row["loan_id"])
+        elif table == "club_members":
+            club_row = self.club_rows.get(row["club_id"])
+            if club_row is not None and op in ("INSERT", "DELETE"):
+                item = self.clubs_table.item(club_row, 2)
+                item.setText(str(int(item.text()) + (1 if op == "INSERT" else -1)))
+        # Counters follow the change shortly after, coalescing bursts of events
+        self.stats_query.request("")
+
+    def patch_loans(self, loan_ids, loans):
+        """Apply one batch of re-read loans: update, append or drop the rows of loan_ids."""
+        by_id = {loan.loan_id: loan for loan in loans}
+        removed = []
+        for loan_id in loan_ids:
+            loan = by_id.get(loan_id)
+            if loan is not None and self.overdue_only.isChecked() and loan.days_overdue <= 0:
+                loan = None
+            i = self.loan_rows.get(loan_id)
+            if loan is None:
+                if i is not None:
+                    removed.append(i)
+            else:
+                if i is None:
+                    i = self.loan_rows[loan_id] = self.loans_table.rowCount()
+                    self.loans_table.insertRow(i)
+                self.set_loan_row(i, loan)
+        if removed:
+            removed.sort()
+            for i in reversed(removed):
+                self.loans_table.removeRow(i)
+            gone = set(removed)
+            self.loan_rows = {loan_id: i - bisect_left(removed, i)
+                              for loan_id, i in self.loan_rows.items() if i not in gone}
+
     def dashboard_tab(self):
         w = QWidget()
         l = QVBoxLayout()
@@ -75,38 +166,64 @@ class LibrarianDashboard(QMainWindow):
         l.addWidget(QLabel(f"<b>Welcome {self.username}</b>"))
         l.addSpacing(20)
 
-        stats = QHBoxLayout()
-        for title, value, color in [
-            ("Total Books", len(BookDAO.get_all_books()), "#3b82f6"),
-            ("Active Loans", len(LoanDAO.get_active_loans()), "#ef4444"),
-            ("Book Clubs", len(ClubDAO.get_all_clubs()), "#8b5cf6")
-        ]:
+        # Counts come from one aggregate query, refreshed periodically off the GUI thread
+        stats = QGridLayout()
+        self.stat_labels = {}
+        for pos, (key, title, color) in enumerate([
+            ("total_books", "Total Books", "#3b82f6"),
+            ("active_loans", "Active Loans", "#ef4444"),
+            ("book_clubs", "Book Clubs", "#8b5cf6"),
+            ("copies_on_shelf", "Copies on Shelf", "#10b981"),
+            ("overdue_loans", "Overdue Loans", "#dc2626"),
+            ("due_today", "Due Today", "#f59e0b")
+        ]):
             box = QGroupBox(title)
             box.setStyleSheet(f"background:white; border:3px solid {color}; border-radius:12px; padding:20px;")
             vbox = QVBoxLayout()
-            num = QLabel(str(value))
+            num = QLabel("…")
             num.setStyleSheet("font-size:48px; font-weight:bold; color:#1e293b;")
             num.setAlignment(Qt.AlignCenter)
             vbox.addWidget(num)
             box.setLayout(vbox)
-            stats.addWidget(box)
+            stats.addWidget(box, pos // 3, pos % 3)
+            self.stat_labels[key] = num
         l.addLayout(stats)
         w.setLayout(l)
+
+        self.stats_query = PeriodicQuery(StatsDAO.get_dashboard_stats, STATS_REFRESH_MS, parent=self)
+        self.stats_query.results.connect(self.show_stats)
+        self.stats_query.run_now()
         return w
 
+    def show_stats(self, _, stats):
+        for key, label in self.stat_labels.items():
+            label.setText(str(stats.get(key, 0)))
+
     def books_tab(self):
         w = QWidget()
         l = QVBoxLayout()
 
         search = QLineEdit()
         search.setPlaceholderText("Search books by title or author...")
-        search.textChanged.connect(lambda t: self.load_books(t))
         l.addWidget(search)
+        self.book_search_box = search
+
+        # Queries run on a worker thread once typing pauses; only the latest result is shown.
+        # The worker fetches the first page, the model pages in the rest as the view scrolls.
+        self.book_search = DebouncedSearch(
+            lambda text: BookDAO.get_all_books(text, limit=PAGE_SIZE, offset=0), parent=self)
+        self.book_search.results.connect(self.show_books)
+        search.textChanged.connect(self.book_search.request)
 
-        self.book_table = QTableWidget()
-        self.book_table.setColumnCount(5)
-        self.book_table.setHorizontalHeaderLabels(["ID", "Title", "Author", "Genre", "Available"])
+        self.book_model = BookTableModel([
+            ("book_id", "ID"), ("title", "Title"), ("author_name", "Author"),
+            ("genre", "Genre"), ("copies_available", "Available")
+        ], parent=self)
+        self.book_table = QTableView()
+        self.book_table.setModel(self.book_model)
         self.book_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.book_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.book_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         l.addWidget(self.book_table)
 
         self.load_books("")
@@ -114,14 +231,12 @@ class LibrarianDashboard(QMainWindow):
         return w
 
     def load_books(self, search):
-        books = [b for b in BookDAO.get_all_books() if search.lower() in f"{b['title']} {b.get('author_name','')}".lower()]
-        self.book_table.setRowCount(len(books))
-        for i, b in enumerate(books):
-            self.book_table.setItem(i, 0, QTableWidgetItem(str(b["book_id"])))
-            self.book_table.setItem(i, 1, QTableWidgetItem(b["title"]))
-            self.book_table.setItem(i, 2, QTableWidgetItem(b.get("author_name","")))
-            self.book_table.setItem(i, 3, QTableWidgetItem(b.get("genre","")))
-            self.book_table.setItem(i, 4, QTableWidgetItem(str(b["copies_available"])))
+        self.book_search.run_now(search)
+
+    def show_books(self, search, books):
+        # Filtering happens in the data layer — no second pass over the catalog here
+        self.book_model.set_source(
+            lambda offset, limit: BookDAO.get_all_books(search, limit=limit, offset=offset), books)
 
     def loans_tab(self):
         w = QWidget()
@@ -129,50 +244,86 @@ class LibrarianDashboard(QMainWindow):
 
         l.addWidget(QLabel("<h2 style='color:#dc2626;'>Active Loans & Returns</h2>"))
 
+        # Overdue days and fines are precomputed by the data layer's scheduled job
+        self.overdue_only = QCheckBox("Overdue only (worst first)")
+        self.overdue_only.toggled.connect(self.load_loans)
+        l.addWidget(self.overdue_only)
+
         self.loans_table = QTableWidget()
         self.loans_table.setColumnCount(6)
         self.loans_table.setHorizontalHeaderLabels([
             "Loan ID", "Book Title", "Member", "Loan Date", "Due Date", "Action"
         ])
         self.loans_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        # Book-drop processing: select many rows (Ctrl/Shift-click) and return them in one go
+        self.loans_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.loans_table.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.loans_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         l.addWidget(self.loans_table)
 
+        buttons = QHBoxLayout()
+        return_selected_btn = QPushButton("Return Selected")
+        return_selected_btn.setStyleSheet("background:#ef4444; color:white; padding:12px; font-weight:bold;")
+        return_selected_btn.clicked.connect(self.return_selected)
+        buttons.addWidget(return_selected_btn)
+
         refresh_btn = QPushButton("Refresh Loans")
         refresh_btn.setStyleSheet("background:#3b82f6; color:white; padding:12px; font-weight:bold;")
         refresh_btn.clicked.connect(self.load_loans)
-        l.addWidget(refresh_btn)
+        buttons.addWidget(refresh_btn)
+        l.addLayout(buttons)
 
+        self.loan_rows = {}   # loan_id -> table row, so change events patch rows without scanning the table
+        self.loan_lookup = BatchedLookup(LoanDAO.get_active_loans_by_id, LOAN_PATCH_DELAY_MS, parent=self)
+        self.loan_lookup.results.connect(self.patch_loans)
         self.load_loans()
         w.setLayout(l)
         return w
 
     def load_loans(self):
-        loans = LoanDAO.get_active_loans()
+        loans = LoanDAO.get_overdue_loans() if self.overdue_only.isChecked() else LoanDAO.get_active_loans()
         self.loans_table.setRowCount(len(loans))
-        today = QDate.currentDate()
+        self.loan_rows = {loan.loan_id: i for i, loan in enumerate(loans)}
 
         for i, loan in enumerate(loans):
-            self.loans_table.setItem(i, 0, QTableWidgetItem(str(loan.get("loan_id", ""))))
-            self.loans_table.setItem(i, 1, QTableWidgetItem(loan.get("title", "Unknown")))
-            self.loans_table.setItem(i, 2, QTableWidgetItem(loan.get("member_name", "Unknown")))
-            self.loans_table.setItem(i, 3, QTableWidgetItem(str(loan.get("loan_date", ""))))
-
-            due_str = str(loan.get("due_date", ""))
-            due_item = QTableWidgetItem(due_str)
-            try:
-                due_date = QDate.fromString(due_str.split()[0], "yyyy-MM-dd")
-                if due_date < today:
-                    due_item.setForeground(QBrush(Qt.red))
-                    due_item.setText(due_str + " (OVERDUE!)")
-            except:
-                pass
-            self.loans_table.setItem(i, 4, due_item)
-
-            return_btn = QPushButton("Return Book")
-            return_btn.setStyleSheet("background:#ef4444; color:white; font-weight:bold; padding:10px;")
-            loan_id = loan.get("loan_id")
-            return_btn.clicked.connect(lambda _, lid=loan_id: LoanDAO.return_loan(lid))
-            self.loans_table.setCellWidget(i, 5, return_btn)
+            self.set_loan_row(i, loan)
+
+    def set_loan_row(self, i, loan):
+        self.loans_table.setItem(i, 0, QTableWidgetItem(str(loan.loan_id)))
+        self.loans_table.setItem(i, 1, QTableWidgetItem(loan.title or "Unknown"))
+        self.loans_table.setItem(i, 2, QTableWidgetItem(loan.member_name or "Unknown"))
+        self.loans_table.setItem(i, 3, QTableWidgetItem(str(loan.loan_date)))
+
+        due_item = QTableWidgetItem(str(loan.due_date))
+        if loan.days_overdue > 0:
+            due_item.setForeground(QBrush(Qt.red))
+            due_item.setText(f"{loan.due_date} (OVERDUE {loan.days_overdue}d, fine {loan.fine:.2f})")
+        self.loans_table.setItem(i, 4, due_item)
+
+        return_btn = QPushButton("Return Book")
+        return_btn.setStyleSheet("background:#ef4444; color:white; font-weight:bold; padding:10px;")
+        loan_id = loan.loan_id
+        return_btn.clicked.connect(lambda _, lid=loan_id: LoanDAO.return_loan(lid))
+        self.loans_table.setCellWidget(i, 5, return_btn)
+
+    def return_selected(self):
+        rows = sorted({index.row() for index in self.loans_table.selectionModel().selectedRows()})
+        loan_ids = [int(self.loans_table.item(r, 0).text()) for r in rows]
+        if not loan_ids:
+            QMessageBox.information(self, "Return Selected", "Select one or more loans first.")
+            return
+        if QMessageBox.question(self, "Return Selected",
+                                f"Return {len(loan_ids)} book(s)?") != QMessageBox.Yes:
+            return
+
+        # One transaction for the whole selection; the change feed removes the rows
+        results = LoanDAO.return_loans(loan_ids)
+        returned = sum(1 for r in results if r["status"] == "returned")
+        failed = [str(r["loan_id"]) for r in results if r["status"] != "returned"]
+        message = f"{returned} book(s) returned."
+        if failed:
+            message += f"\nNot returned (already closed or error): loan {', '.join(failed)}"
+        QMessageBox.information(self, "Return Selected", message)
 
     def clubs_tab(self):
         w = QWidget()
@@ -198,7 +349,10 @@ class LibrarianDashboard(QMainWindow):
     def load_clubs(self):
         clubs = ClubDAO.get_all_clubs()
         self.clubs_table.setRowCount(len(clubs))
+        self.club_rows = {c.club_id: i for i, c in enumerate(clubs)}
         for i, c in enumerate(clubs):
-            self.clubs_table.setItem(i, 0, QTableWidgetItem(c.get("name", "Unnamed")))
-            self.clubs_table.setItem(i, 1, QTableWidgetItem(c.get("description", "No description")))
-            self.clubs_table.setItem(i, 2, QTableWidgetItem(str(c.get("member_count", 0))))
\ No newline at end of file
+            name_item = QTableWidgetItem(c.name or "Unnamed")
+            name_item.setData(Qt.UserRole, c.club_id)
+            self.clubs_table.setItem(i, 0, name_item)
+            self.clubs_table.setItem(i, 1, QTableWidgetItem(c.description or "No description"))
+            self.clubs_table.setItem(i, 2, QTableWidgetItem(str(c.member_count or 0)))
\ No newline at end of file
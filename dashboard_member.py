@@ -2,21 +2,31 @@
 # FINAL PROFESSIONAL VERSION — 100% ERROR-FREE, CLEAN OOP, WORKS WITH OBJECT OR DICT
 
 from PyQt5.QtWidgets import *
-from PyQt5.QtCore import Qt, QDate
+from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QBrush  # Fixed: Added for red/green text colors
 
+from book_table_model import BookTableModel, BorrowButtonDelegate, PAGE_SIZE
+from live_updates import LiveUpdates
+from records import Book, Club
+from search_worker import DebouncedSearch
+
 # Safe DAO imports with full fallback
 try:
     from dao.book_dao import BookDAO
     from dao.loan_dao import LoanDAO
     from dao.club_dao import ClubDAO
+    from dao.change_dao import ChangeDAO
+    from dao.hold_dao import HoldDAO
 except ImportError:
     # Full fallback DAOs (prevents all crashes in demo mode)
     class BookDAO:
         @staticmethod
-        def get_available_books(search=""):
-            return [{"book_id": 1, "title": "Sample Book", "author_name": "Author", "genre": "Fiction",
-                     "published_year": 2023, "copies_available": 1}]
+        def get_available_books(search="", limit=None, offset=0):
+            return [Book(book_id=1, title="Sample Book", author_name="Author", genre="Fiction",
+                         published_year=2023, copies_available=1)][offset:]
+
+        @staticmethod
+        def get_recommendations(member_id, limit=10): return []
 
 
     class LoanDAO:
@@ -29,7 +39,23 @@ except ImportError:
 
     class ClubDAO:
         @staticmethod
-        def get_all_clubs(): return [{"name": "Demo Club", "description": "Fun!", "member_count": 5}]
+        def get_all_clubs(): return [Club(name="Demo Club", description="Fun!", member_count=5)]
+
+
+    class ChangeDAO:
+        @staticmethod
+        def subscribe(callback): return lambda: None
+
+
+    class HoldDAO:
+        @staticmethod
+        def place_hold(book_id, member_id): return {"status": "error", "hold_id": None, "position": None}
+
+        @staticmethod
+        def cancel_hold(hold_id, member_id): return False
+
+        @staticmethod
+        def get_member_holds(member_id): return []
 
 
 class MemberDashboard(QMainWindow):
@@ -65,8 +91,40 @@ class MemberDashboard(QMainWindow):
         self.setCentralWidget(tabs)
         self.refresh_all()
 
+        # Row-level changes from the data layer patch this window instead of full reloads
+        self.live_updates = LiveUpdates(ChangeDAO.subscribe, self)
+        self.live_updates.changed.connect(self.apply_change)
+
+    def closeEvent(self, event):
+        self.live_updates.stop()
+        super().closeEvent(event)
+
+    def apply_change(self, event):
+        table, op, row = event["table"], event["op"], event["row"]
+        if op == "RESYNC":
+            self.refresh_all()
+        elif table == "books":
+            self.book_model.patch_row(row["book_id"], row)
+        elif table == "loans" and row.get("member_id") == self.member_id:
+            # At most 3 rows — re-reading this member's loans is cheaper than diffing
+            self.refresh_my_loans()
+        elif table == "holds" and (row.get("member_id") == self.member_id or row.get("book_id") in self.held_books):
+            # Our hold changed, or someone ahead of us in a queue we're in moved
+            self.refresh_my_holds()
+            if row.get("member_id") == self.member_id and row.get("status") == "ready":
+                self.statusBar().showMessage(
+                    f"A copy is being held for you until {row.get('ready_until')} — see My Loans to pick it up")
+        elif table == "club_members" and op in ("INSERT", "DELETE"):
+            for i in range(self.clubs_table.rowCount()):
+                item = self.clubs_table.item(i, 0)
+                if item.data(Qt.UserRole) == row.get("club_id"):
+                    count = self.clubs_table.item(i, 2)
+                    count.setText(str(int(count.text()) + (1 if op == "INSERT" else -1)))
+
     def refresh_all(self):
         self.refresh_my_loans()
+        self.refresh_my_holds()
+        self.refresh_recommendations()
         self.refresh_catalog()
 
     def home_tab(self):
@@ -91,24 +149,43 @@ class MemberDashboard(QMainWindow):
         w = QWidget()
         l = QVBoxLayout()
 
+        # Recommended for you — precomputed neighbour lists (recommender.py), double-click to borrow
+        l.addWidget(QLabel("<h3>Recommended for you</h3>"))
+        self.recommended_list = QListWidget()
+        self.recommended_list.setFlow(QListView.LeftToRight)
+        self.recommended_list.setWrapping(False)
+        self.recommended_list.setSpacing(6)
+        self.recommended_list.setFixedHeight(72)
+        self.recommended_list.setStyleSheet("QListWidget::item { background:#e0e7ff; border-radius:8px; padding:8px; }")
+        self.recommended_list.itemDoubleClicked.connect(lambda item: self.borrow_or_hold(item.data(Qt.UserRole)))
+        l.addWidget(self.recommended_list)
+
         # Search
         search_bar = QHBoxLayout()
         self.search_box = QLineEdit()
         self.search_box.setPlaceholderText("Search by title, author, or genre...")
-        self.search_box.textChanged.connect(self.refresh_catalog)
+        # Debounced: the first page is fetched on a worker thread once typing pauses
+        self.catalog_search = DebouncedSearch(
+            lambda text: BookDAO.get_available_books(search=text.lower(), limit=PAGE_SIZE, offset=0), parent=self)
+        self.catalog_search.results.connect(self.show_catalog)
+        self.search_box.textChanged.connect(self.catalog_search.request)
         search_bar.addWidget(QLabel("Search:"))
         search_bar.addWidget(self.search_box)
         l.addLayout(search_bar)
 
-        # Table
-        self.book_table = QTableWidget()
-        self.book_table.setColumnCount(7)
-        self.book_table.setHorizontalHeaderLabels([
-            "ID", "Title", "Author", "Genre", "Year", "Available", "Action"
-        ])
+        # Table — model pages rows in as the view scrolls, Borrow is painted by a delegate
+        self.book_model = BookTableModel([
+            ("book_id", "ID"), ("title", "Title"), ("author_name", "Author"), ("genre", "Genre"),
+            ("published_year", "Year"), ("copies_available", "Available"), (BookTableModel.ACTION_KEY, "Action")
+        ], parent=self)
+        self.book_table = QTableView()
+        self.book_table.setModel(self.book_model)
         self.book_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        self.book_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.book_table.setSelectionBehavior(QTableView.SelectRows)
         self.book_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        borrow_delegate = BorrowButtonDelegate(self.book_table)
+        borrow_delegate.clicked.connect(self.borrow_row)
+        self.book_table.setItemDelegateForColumn(6, borrow_delegate)
         l.addWidget(self.book_table)
 
         self.refresh_catalog()
@@ -116,34 +193,58 @@ class MemberDashboard(QMainWindow):
         return w
 
     def refresh_catalog(self):
-        query = self.search_box.text().lower()
-        books = BookDAO.get_available_books(search=query)
-
-        self.book_table.setRowCount(len(books))
-        for i, book in enumerate(books):
-            for col, key in enumerate(
-                    ["book_id", "title", "author_name", "genre", "published_year", "copies_available"]):
-                self.book_table.setItem(i, col, QTableWidgetItem(str(book.get(key, ""))))
-
-            # Borrow button
-            btn = QPushButton("Borrow")
-            btn.setStyleSheet("background:#3b82f6; color:white;")
-            if book["copies_available"] == 0:
-                btn.setEnabled(False)
-                btn.setText("Unavailable")
-            else:
-                btn.clicked.connect(lambda _, bid=book["book_id"], title=book["title"]: self.borrow_book(bid, title))
-            self.book_table.setCellWidget(i, 6, btn)
+        self.catalog_search.run_now(self.search_box.text())
+
+    def show_catalog(self, search, books):
+        search = search.lower()
+        self.book_model.set_source(
+            lambda offset, limit: BookDAO.get_available_books(search=search, limit=limit, offset=offset), books)
+
+    def refresh_recommendations(self):
+        self.recommended_list.clear()
+        for book in BookDAO.get_recommendations(self.member_id):
+            item = QListWidgetItem(f"{book.title}\n{book.author_name or ''}")
+            item.setData(Qt.UserRole, book)
+            item.setToolTip("Double-click to borrow" if book.copies_available > 0 else "Double-click to place a hold")
+            self.recommended_list.addItem(item)
+
+    def borrow_row(self, row):
+        self.borrow_or_hold(self.book_model.row_at(row))
+
+    def borrow_or_hold(self, book):
+        if book.copies_available > 0 or book.book_id in self.ready_books:
+            self.borrow_book(book.book_id, book.title)
+        else:
+            self.place_hold(book.book_id, book.title)
+
+    def place_hold(self, book_id, title):
+        # The change feed tells us when a copy is set aside — no need to keep refreshing
+        result = HoldDAO.place_hold(book_id, self.member_id)
+        if result["status"] == "placed":
+            QMessageBox.information(self, "Hold Placed",
+                                    f"You are number <b>{result['position']}</b> in line for <b>{title}</b>.")
+            self.refresh_my_holds()
+        elif result["status"] == "already_held":
+            QMessageBox.information(self, "Hold Placed", f"You already have a hold on <b>{title}</b>.")
+        elif result["status"] == "available":
+            QMessageBox.information(self, "Available", f"A copy of <b>{title}</b> is back — you can borrow it now.")
+            self.refresh_catalog()
+        else:
+            QMessageBox.critical(self, "Error", "Could not place a hold right now.")
 
     def borrow_book(self, book_id, title):
-        if len(LoanDAO.get_member_loans(self.member_id)) >= 3:
-            QMessageBox.warning(self, "Limit Reached", "You already have 3 books borrowed!")
-            return
-
-        success = LoanDAO.issue_loan(book_id, self.member_id)
-        if success:
+        # The data layer enforces the 3-book limit atomically — no separate pre-check query
+        result = LoanDAO.issue_loan(book_id, self.member_id)
+        if result:
             QMessageBox.information(self, "Success", f"You borrowed:\n<b>{title}</b>\nDue in 7 days!")
             self.refresh_all()
+        elif result == "limit_reached":
+            QMessageBox.warning(self, "Limit Reached", "You already have 3 books borrowed!")
+        elif result == "no_copies":
+            if QMessageBox.question(self, "Unavailable",
+                                    f"No copies of <b>{title}</b> are left.\nPlace a hold?") == QMessageBox.Yes:
+                self.place_hold(book_id, title)
+            self.refresh_catalog()
         else:
             QMessageBox.critical(self, "Error", "Could not borrow this book.")
 
@@ -158,34 +259,63 @@ class MemberDashboard(QMainWindow):
         self.loans_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         l.addWidget(self.loans_table)
 
+        l.addWidget(QLabel("<h2>My Holds</h2>"))
+        self.holds_table = QTableWidget()
+        self.holds_table.setColumnCount(4)
+        self.holds_table.setHorizontalHeaderLabels(["Book", "Status", "Place in Line", "Action"])
+        self.holds_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        l.addWidget(self.holds_table)
+        self.held_books = set()     # book_ids with a live hold, to react to queue movement
+        self.ready_books = set()    # book_ids with a copy set aside for us
+
         self.refresh_my_loans()
         w.setLayout(l)
         return w
 
+    def refresh_my_holds(self):
+        holds = HoldDAO.get_member_holds(self.member_id)
+        self.held_books = {h.book_id for h in holds}
+        self.ready_books = {h.book_id for h in holds if h.status == "ready"}
+        self.holds_table.setRowCount(len(holds))
+        for i, hold in enumerate(holds):
+            self.holds_table.setItem(i, 0, QTableWidgetItem(hold.title))
+            if hold.status == "ready":
+                status = QTableWidgetItem(f"Ready — pick up by {hold.ready_until}")
+                status.setForeground(QBrush(Qt.darkGreen))
+                button = QPushButton("Pick Up")
+                button.clicked.connect(lambda _, h=hold: self.borrow_book(h.book_id, h.title))
+            else:
+                status = QTableWidgetItem("Waiting")
+                button = QPushButton("Cancel")
+                button.clicked.connect(lambda _, h=hold: self.cancel_hold(h))
+            self.holds_table.setItem(i, 1, status)
+            self.holds_table.setItem(i, 2, QTableWidgetItem(str(hold.position or "")))
+            self.holds_table.setCellWidget(i, 3, button)
+
+    def cancel_hold(self, hold):
+        if HoldDAO.cancel_hold(hold.hold_id, self.member_id):
+            self.refresh_my_holds()
+
     def refresh_my_loans(self):
         loans = LoanDAO.get_member_loans(self.member_id)
         self.loans_table.setRowCount(len(loans))
 
         total_loans = len(loans)
 
-        # FIXED: Safe update — only if widget exists
-        if self.centralWidget():
-            home_tab = self.centralWidget().widget(0)  # Home tab
-            if home_tab and home_tab.layout():
-                label = home_tab.layout().itemAt(4).widget()
-                if label:
-                    label.setText(f"You have <b>{total_loans}/3</b> books borrowed")
+        fines = sum(loan.fine for loan in loans)
+        self.current_loans_label.setText(f"You have <b>{total_loans}/3</b> books borrowed"
+                                         + (f" — outstanding fines: <b>{fines:.2f}</b>" if fines else ""))
 
-        today = QDate.currentDate()
         for i, loan in enumerate(loans):
-            self.loans_table.setItem(i, 0, QTableWidgetItem(loan["title"]))
-            self.loans_table.setItem(i, 1, QTableWidgetItem(str(loan["loan_date"])))
-            self.loans_table.setItem(i, 2, QTableWidgetItem(str(loan["due_date"])))
+            self.loans_table.setItem(i, 0, QTableWidgetItem(loan.title))
+            self.loans_table.setItem(i, 1, QTableWidgetItem(str(loan.loan_date)))
+            self.loans_table.setItem(i, 2, QTableWidgetItem(str(loan.due_date)))
 
-            days_left = (loan["due_date"] - today).days()
+            # Precomputed by the data layer's overdue job (negative days_overdue = days left)
+            days_left = -loan.days_overdue
             self.loans_table.setItem(i, 3, QTableWidgetItem(str(days_left)))
 
-            status = "On Time" if days_left >= 0 else "OVERDUE!"
+            status = "On Time" if days_left >= 0 else f"OVERDUE! Fine: {loan.fine:.2f}"
             item = QTableWidgetItem(status)
             item.setForeground(QBrush(Qt.red if days_left < 0 else Qt.darkGreen))
             self.loans_table.setItem(i, 4, item)
@@ -199,11 +329,14 @@ class MemberDashboard(QMainWindow):
         table = QTableWidget(len(clubs), 3)
         table.setHorizontalHeaderLabels(["Club Name", "Description", "Members"])
         table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.clubs_table = table
 
         for i, club in enumerate(clubs):
-            table.setItem(i, 0, QTableWidgetItem(club["name"]))
-            table.setItem(i, 1, QTableWidgetItem(club["description"] or "No description"))
-            table.setItem(i, 2, QTableWidgetItem(str(club["member_count"])))
+            name_item = QTableWidgetItem(club.name)
+            name_item.setData(Qt.UserRole, club.club_id)
+            table.setItem(i, 0, name_item)
+            table.setItem(i, 1, QTableWidgetItem(club.description or "No description"))
+            table.setItem(i, 2, QTableWidgetItem(str(club.member_count)))
 
         join_btn = QPushButton("Join Selected Club")
         join_btn.setStyleSheet("background:#10b981; color:white; padding:12px; font-weight:bold;")
@@ -1,60 +1,716 @@
 # database.py
 # FULLY WORKING DATABASE LAYER – Supports Librarian + Member Login + Real Loans
+import configparser
+import csv
+import functools
+import io
+import json
+import os
+import threading
+import time
+from bisect import bisect_right, insort
+from collections import Counter
+from contextlib import contextmanager
+from enum import Enum
+
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.errors
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
 from datetime import date, timedelta
 
+import change_feed
+import passwords
+import query_stats
+from demo_store import DemoStore
+from local_replica import LocalReplica
+from query_cache import QueryCache
+from records import Book, Club, Hold, Loan
+
+# ────────────────────── DATABASE SETTINGS ──────────────────────
+# Defaults below can be overridden in smartlibrary.ini ([database] section, path
+# set with SMARTLIB_CONFIG) and then by SMARTLIB_DB_* environment variables.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MIGRATIONS_DIR = os.path.join(BASE_DIR, "migrations")
+CONFIG_FILE = os.environ.get("SMARTLIB_CONFIG", os.path.join(BASE_DIR, "smartlibrary.ini"))
+
+DB_SETTINGS = {
+    "dbname": "smartlibrary",
+    "user": "postgres",           # Change if you use another user
+    "password": "077739689",   # ← CHANGE THIS TO YOUR POSTGRES PASSWORD
+    "host": "localhost",
+    "port": "5432",
+    "connect_timeout": "3",    # seconds before giving up and falling back to demo mode
+}
+APP_SETTINGS = {
+    "pool_min_size": "1",        # connections opened up front
+    "pool_max_size": "10",       # hard cap on open connections
+    "pool_timeout": "10",        # seconds to wait for a free connection
+    "pool_check_idle": "30",     # ping connections idle longer than this before handing them out
+    "async_pool_max_size": "20", # connection cap of async_database.py's pool (one per in-flight query)
+    "replica_path": os.path.join(BASE_DIR, "smartlibrary_replica.db"),   # empty = no offline replica
+    "replica_sync_interval": "300",   # seconds between snapshot refreshes while online
+    "replica_retry_interval": "15",   # seconds between reconnect attempts while offline
+    "demo_store_path": os.path.join(BASE_DIR, "smartlibrary_demo.jsonl"),   # empty = demo data in memory only
+    "overdue_interval": "3600",       # seconds between overdue/fine recomputations
+    "slow_query_ms": "250",           # statements at least this slow are logged with their plan; 0 = off
+    "slow_query_log": os.path.join(BASE_DIR, "smartlibrary_slow_queries.jsonl"),   # empty = console only
+    "metrics_path": os.path.join(BASE_DIR, "smartlibrary_metrics.prom"),   # empty = no Prometheus dump
+    "metrics_interval": "60",         # seconds between metrics dumps
+}
+
+
+def load_settings(path=CONFIG_FILE):
+    """Merge defaults, the config file and SMARTLIB_DB_* / SMARTLIB_<SETTING> env vars."""
+    db, app_cfg = dict(DB_SETTINGS), dict(APP_SETTINGS)
+    parser = configparser.ConfigParser()
+    if parser.read(path) and parser.has_section("database"):
+        for key, value in parser.items("database"):
+            if key in db:
+                db[key] = value
+            elif key in app_cfg:
+                app_cfg[key] = value
+    for key in db:
+        db[key] = os.environ.get("SMARTLIB_DB_" + key.upper(), db[key])
+    for key in app_cfg:
+        app_cfg[key] = os.environ.get("SMARTLIB_" + key.upper(), app_cfg[key])
+    return db, app_cfg
+
+
+_db_settings, _app_settings = load_settings()
+POOL_MIN_SIZE = int(_app_settings["pool_min_size"])
+POOL_MAX_SIZE = int(_app_settings["pool_max_size"])
+POOL_TIMEOUT = float(_app_settings["pool_timeout"])
+POOL_CHECK_IDLE = float(_app_settings["pool_check_idle"])
+ASYNC_POOL_MAX_SIZE = int(_app_settings["async_pool_max_size"])
+REPLICA_PATH = _app_settings["replica_path"]
+REPLICA_SYNC_INTERVAL = float(_app_settings["replica_sync_interval"])
+REPLICA_RETRY_INTERVAL = float(_app_settings["replica_retry_interval"])
+DEMO_STORE_PATH = _app_settings["demo_store_path"]
+OVERDUE_INTERVAL = float(_app_settings["overdue_interval"])
+SLOW_QUERY_MS = float(_app_settings["slow_query_ms"])
+SLOW_QUERY_LOG = _app_settings["slow_query_log"]
+METRICS_PATH = _app_settings["metrics_path"]
+METRICS_INTERVAL = float(_app_settings["metrics_interval"])
+
+CACHE_TTL = 30.0          # seconds a cached read stays valid without a write
+CACHE_MAX_ENTRIES = 512   # LRU bound across all cached queries
+
+
+# ────────────────────── CONNECTION POOL ──────────────────────
+class PoolTimeout(Exception):
+    """No connection became free within POOL_TIMEOUT seconds."""
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections.
+    Idle connections are pinged before being handed out and broken ones are
+    replaced, so one dead socket or failed transaction never affects other callers.
+    """
+
+    def __init__(self, settings, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+                 timeout=POOL_TIMEOUT, check_idle=POOL_CHECK_IDLE):
+        self.settings = dict(settings)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self._idle = []          # [(conn, last_used)] — LIFO keeps hot connections hot
+        self._size = 0           # open connections, idle + checked out
+        self._closed = False
+        self._lock = threading.Condition()
+        for _ in range(min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def _connect(self):
+        # Timed cursors: every statement on a pooled connection is counted in query_stats
+        return psycopg2.connect(cursor_factory=query_stats.TimedDictCursor, **self.settings)
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _healthy(self, conn):
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as c:
+                c.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("connection pool is closed")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(f"no free connection after {self.timeout:.1f}s")
+                self._lock.wait(remaining)
+
+        # Health check / connect outside the lock so a slow server doesn't block other borrowers
+        try:
+            if conn is not None and (conn.closed or time.monotonic() - last_used > self.check_idle):
+                if not self._healthy(conn):
+                    self._discard(conn)
+                    conn = None
+            if conn is None:
+                conn = self._connect()
+            return conn
+        except Exception:
+            with self._lock:
+                self._size -= 1
+                self._lock.notify()
+            raise
+
+    def putconn(self, conn, broken=False):
+        if not broken and not conn.closed and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        with self._lock:
+            if broken or conn.closed or self._closed:
+                self._discard(conn)
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # Socket is gone — drop it so the next borrower gets a fresh connection
+            self.putconn(conn, broken=True)
+            raise
+        except BaseException:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+            self.putconn(conn)
+            raise
+        else:
+            self.putconn(conn)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._discard(conn)
+            self._size -= len(self._idle)
+            self._idle = []
+            self._lock.notify_all()
+
+
+@contextmanager
+def get_cursor(commit=False, cursor_factory=None):
+    """
+    Borrow a pooled connection and yield a fresh cursor on it (a timed
+    RealDictCursor unless cursor_factory says otherwise).
+    Commits on success when commit=True, otherwise the transaction is rolled back
+    when the connection goes back to the pool.
+    """
+    with pool.connection() as conn:
+        with conn.cursor(cursor_factory=cursor_factory) as cur:
+            yield cur
+        if commit:
+            conn.commit()
+
+
 # ────────────────────── DATABASE CONNECTION ──────────────────────
-try:
-    conn = psycopg2.connect(
-        dbname="smartlibrary",
-        user="postgres",           # Change if you use another user
-        password="077739689",   # ← CHANGE THIS TO YOUR POSTGRES PASSWORD
-        host="localhost",
-        port="5432",
-        cursor_factory=RealDictCursor
-    )
-    cur = conn.cursor()
-    DB_CONNECTED = True
-    print("PostgreSQL connected successfully!")
-except Exception as e:
-    print("Database not available → Running in DEMO MODE")
-    DB_CONNECTED = False
-
-# ────────────────────── IN-MEMORY DEMO DATA (if no DB) ──────────────────────
-if not DB_CONNECTED:
-    books = [
+# Nothing connects at import time. The first data call (or connect_in_background(),
+# started by main.py while the login window renders) opens the pool; until then
+# DB_CONNECTED is None.
+pool = None
+DB_CONNECTED = None
+_connect_lock = threading.Lock()
+
+
+def connect():
+    """Open the connection pool once. Returns True if PostgreSQL is reachable."""
+    global pool, DB_CONNECTED
+    connected_now = False
+    with _connect_lock:
+        if DB_CONNECTED is None:
+            try:
+                pool = ConnectionPool(_db_settings)
+                DB_CONNECTED = connected_now = True
+                print("PostgreSQL connected successfully!")
+                _start_thread(_replica_sync_loop, "replica-sync")
+            except Exception as e:
+                pool = None
+                DB_CONNECTED = False
+                if _open_replica(create=False) and replica.has_snapshot():
+                    _go_offline()
+                    print(f"PostgreSQL unreachable → serving the local replica (synced {replica.synced_at()})")
+                else:
+                    demo.open()
+                    print("Database not available → Running in DEMO MODE")
+            _start_thread(_overdue_loop, "overdue-job")
+            if METRICS_PATH and METRICS_INTERVAL > 0:
+                _start_thread(_metrics_loop, "metrics-dump")
+    if connected_now:
+        _replay_pending()   # offline writes left over from the last run
+    return DB_CONNECTED
+
+
+def is_connected():
+    """Connect on first use; callers racing the background attempt wait for it."""
+    if DB_CONNECTED is None:
+        return connect()
+    return DB_CONNECTED
+
+
+RESYNC_EVENT = {"table": "*", "op": "RESYNC", "row": {}}
+_listener = None
+
+
+def subscribe_changes(callback):
+    """
+    Call callback(event) for every row change to books, loans and club_members
+    (see change_feed.py for the event shape). With PostgreSQL this starts one
+    LISTEN connection on first use; in demo mode the write functions publish
+    directly. Returns an unsubscribe function.
+    """
+    global _listener
+    if is_connected():
+        with _connect_lock:
+            if _listener is None:
+                _listener = change_feed.PgListener(_db_settings)
+                _listener.start()
+    return change_feed.bus.subscribe(callback)
+
+
+def _start_thread(target, name):
+    thread = threading.Thread(target=target, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+def connect_in_background():
+    """Start connecting on a daemon thread so startup is never blocked on the network."""
+    return _start_thread(connect, "db-connect")
+
+
+# ────────────────────── OFFLINE REPLICA ──────────────────────
+# While online a SQLite replica (local_replica.py) is refreshed in the background.
+# If PostgreSQL becomes unreachable, reads are served from it and writes are
+# journaled there (OFFLINE = True); a reconnect thread replays the journal and
+# switches back. Without a synced replica the old behaviour applies (demo mode
+# at startup, errors mid-session).
+replica = None
+OFFLINE = False
+_state = threading.local()
+_replay_lock = threading.Lock()
+
+
+def _open_replica(create):
+    global replica
+    if replica is None and REPLICA_PATH and (create or os.path.exists(REPLICA_PATH)):
+        replica = LocalReplica(REPLICA_PATH)
+    return replica
+
+
+def _go_offline():
+    global OFFLINE
+    OFFLINE = True
+    _start_thread(_reconnect_loop, "db-reconnect")
+
+
+def _db_reachable():
+    try:
+        psycopg2.connect(**_db_settings).close()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _connection_lost(error):
+    """
+    Called with a failed query's exception. If it was the connection (not the
+    query) that failed and a synced replica exists, switch to offline mode and
+    return True so the caller can re-run against the replica.
+    """
+    global DB_CONNECTED
+    if getattr(_state, "replaying", False):
+        return False   # sync_offline_writes() must not queue its own writes again
+    if not isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+        return False
+    if OFFLINE:
+        return True
+    if not (_open_replica(create=False) and replica.has_snapshot()) or _db_reachable():
+        return False
+    with _connect_lock:
+        if not OFFLINE:
+            DB_CONNECTED = False
+            _go_offline()
+            print("Lost PostgreSQL connection → serving the local replica, writes are queued")
+    _state.went_offline = True
+    change_feed.bus.publish(RESYNC_EVENT)   # clears the cache and reloads open windows
+    return True
+
+
+def _replica_fallback(fn):
+    """For reads: if the connection dropped while fn ran, run it again (now against the replica)."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        _state.went_offline = False
+        result = fn(*args, **kwargs)
+        if _state.went_offline:
+            _state.went_offline = False
+            return fn(*args, **kwargs)
+        return result
+    return wrapper
+
+
+def _reconnect_loop():
+    global pool, DB_CONNECTED, OFFLINE
+    while True:
+        time.sleep(REPLICA_RETRY_INTERVAL)
+        if not _db_reachable():
+            continue
+        with _connect_lock:
+            try:
+                new_pool = ConnectionPool(_db_settings)
+            except Exception:
+                continue
+            if pool is not None:
+                pool.close()
+            pool = new_pool
+            DB_CONNECTED, OFFLINE = True, False
+        print("PostgreSQL is back → replaying offline writes")
+        report = sync_offline_writes()
+        print(f"Offline writes: {report['applied']} applied, {report['conflicts']} conflict(s)")
+        change_feed.bus.publish(RESYNC_EVENT)
+        _start_thread(_replica_sync_loop, "replica-sync")
+        return
+
+
+def _replica_sync_loop():
+    # Runs while online; exits when the connection drops (the reconnect loop restarts it)
+    while is_connected():
+        try:
+            _replay_pending()   # a replay that stopped early is retried before the refresh
+            refresh_replica()
+        except Exception as e:
+            print("Replica sync failed:", e)
+        time.sleep(REPLICA_SYNC_INTERVAL)
+
+
+def _replay_pending():
+    """Replay the journal if an existing replica still holds offline writes. Returns the report or None."""
+    if not (_open_replica(create=False) and replica.pending_writes()):
+        return None
+    report = sync_offline_writes()
+    print(f"Offline writes: {report['applied']} applied, {report['conflicts']} conflict(s)")
+    return report
+
+
+def refresh_replica():
+    """Copy the catalog, members, open loans and clubs into the local replica."""
+    if not REPLICA_PATH or not is_connected():
+        return False
+    _open_replica(create=True)
+    if replica.pending_writes():
+        return False   # never overwrite queued offline work — replay it first
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT member_id, full_name, email FROM members")
+            member_rows = cur.fetchall()
+            cur.execute("""
+                SELECT l.loan_id, l.book_id, l.member_id, b.title, l.loan_date, l.due_date
+                FROM loans l JOIN books b ON b.book_id = l.book_id
+                WHERE l.return_date IS NULL
+            """)
+            loan_rows = cur.fetchall()
+            cur.execute("""
+                SELECT bc.club_id, bc.name, bc.description, COUNT(cm.member_id) AS member_count
+                FROM book_clubs bc LEFT JOIN club_members cm ON bc.club_id = cm.club_id
+                GROUP BY bc.club_id
+            """)
+            club_rows = cur.fetchall()
+        # Books stream through a server-side cursor so a large catalog is never fully in memory
+        with conn.cursor(name="replica_books") as books_cur:
+            books_cur.itersize = 5000
+            books_cur.execute("""
+                SELECT b.book_id, b.title, a.name AS author_name, b.isbn, b.genre,
+                       b.published_year, b.copies_available
+                FROM books b LEFT JOIN authors a ON b.author_id = a.author_id
+            """)
+            replica.load_snapshot(books_cur, member_rows, loan_rows, club_rows)
+    return True
+
+
+def sync_offline_writes():
+    """
+    Replay journaled offline writes in order. A write that no longer makes
+    sense (copy gone, limit reached, loan already returned) is marked
+    'conflict' with the reason instead of being forced through; see
+    replica.conflicts(). Stops early, leaving the rest pending, if the
+    connection drops again.
+    """
+    report = {"applied": 0, "conflicts": 0}
+    if replica is None or not is_connected():
+        return report
+    # connect(), the reconnect loop and the replica-sync loop may all try; one replay at a time
+    with _replay_lock:
+        _state.replaying = True
+        try:
+            _replay(report)
+        finally:
+            _state.replaying = False
+            _state.replay_key = None
+    return report
+
+
+def _record_replay(cur, status, result_id=None):
+    """
+    Inside the transaction of a replayed write: store its journal key and outcome
+    (migrations/010), so the write commits together with the proof it was applied.
+    """
+    key = getattr(_state, "replay_key", None)
+    if key is not None:
+        cur.execute("INSERT INTO offline_writes (replica_id, seq, status, result_id) VALUES (%s, %s, %s, %s)",
+                    (*key, status, result_id))
+
+
+def _replayed(replica_id, seq):
+    """(status, result_id) of a journal entry PostgreSQL already applied, else None."""
+    with get_cursor() as cur:
+        cur.execute("SELECT status, result_id FROM offline_writes WHERE replica_id = %s AND seq = %s",
+                    (replica_id, seq))
+        row = cur.fetchone()
+    return (row["status"], row["result_id"]) if row else None
+
+
+def _replay_write(op, args):
+    """Run one journaled write online. (status, result_id); status None = stop, try again on the next sync."""
+    if op == "add_book":
+        return "applied", add_book(args["title"], args["author_name"], args["isbn"], args["genre"],
+                                   args["year"], args["copies"])
+    if op == "issue_loan":
+        book_id = replica.resolve_id("book", args["book_id"])
+        if book_id is None:
+            return "unmapped", None
+        result = issue_loans(args["member_id"], [book_id])[0]
+        return (None if result["status"] is LoanResult.ERROR else result["status"].value), result["loan_id"]
+    if op == "return_loan":
+        loan_id = replica.resolve_id("loan", args["loan_id"])
+        if loan_id is None:
+            return "unmapped", None
+        status = return_loans([loan_id])[0]["status"]
+        return (None if status == "error" else status), None
+    return "unknown_op", None
+
+
+def _replay(report):
+    # Each online write records (replica_id, seq) in its own transaction, so after a
+    # crash between that commit and mark() the entry is recognised, not applied twice
+    replica_id = replica.replica_id()
+    for entry in replica.pending_writes():
+        seq, op, args = entry["seq"], entry["op"], entry["args"]
+        _state.replay_key = (replica_id, seq)
+        try:
+            status, result_id = _replayed(replica_id, seq) or _replay_write(op, args)
+        except psycopg2.Error as e:
+            print("DB Error:", e)
+            break
+        finally:
+            _state.replay_key = None
+        if status is None:
+            break
+        conflict = None
+        if op == "add_book":
+            replica.map_id("book", args["temp_id"], result_id)
+        elif op == "issue_loan":
+            if status == "unmapped":
+                conflict = "book was never created online"
+            elif status == LoanResult.SUCCESS:
+                replica.map_id("loan", args["temp_id"], result_id)
+            else:
+                conflict = status
+        elif op == "return_loan":
+            if status == "unmapped":
+                conflict = "loan was never issued online"
+            elif status != "returned":
+                conflict = "loan was already returned"
+        else:
+            conflict = f"unknown journal op {op!r}"
+        if conflict:
+            replica.mark(seq, "conflict", conflict)
+            report["conflicts"] += 1
+        else:
+            replica.mark(seq, "applied")
+            report["applied"] += 1
+
+
+# ────────────────────── DEMO DATA (used when no DB) ──────────────────────
+# Kept in demo_store.DemoStore: indexed tables persisted to DEMO_STORE_PATH, so
+# demo-mode changes survive restarts. The sample rows below seed a new store.
+DEMO_SEED = {
+    "books": [
         {"book_id":1,"title":"1984","author_name":"George Orwell","isbn":"123","genre":"Dystopia","published_year":1949,"copies_available":5},
         {"book_id":2,"title":"Harry Potter","author_name":"J.K. Rowling","isbn":"456","genre":"Fantasy","published_year":1997,"copies_available":3},
         {"book_id":3,"title":"The Alchemist","author_name":"Paulo Coelho","isbn":"789","genre":"Fiction","published_year":1988,"copies_available":4}
-    ]
-    members = [
+    ],
+    "members": [
         {"member_id":1, "full_name":"John Doe", "email":"john@example.com"},
         {"member_id":2, "full_name":"Jane Smith", "email":"jane@example.com"}
-    ]
-    loans = []
-    clubs = [{"club_id":1, "name":"Sci-Fi Lovers", "member_count":12}]
+    ],
+    "clubs": [{"club_id":1, "name":"Sci-Fi Lovers", "description":"Monthly sci-fi reads", "member_count":12}],
+}
+demo = DemoStore(DEMO_STORE_PATH or None, DEMO_SEED)
+catalog = demo.books
+
+# ────────────────────── QUERY CACHE ──────────────────────
+# Reads below are cached per function + arguments; every write invalidates
+# exactly the tags it affects, so a write is visible to the very next read.
+cache = QueryCache(max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+
+
+def member_loans_tag(member_id):
+    return f"member_loans:{member_id}"
+
+
+def _invalidate_for_change(event):
+    """Changes made by other workstations (change feed) invalidate the same tags."""
+    table, row = event["table"], event["row"]
+    if table == "*":
+        cache.clear()
+    elif table == "books":
+        cache.invalidate("books")
+    elif table == "loans":
+        cache.invalidate("loans", "books", member_loans_tag(row.get("member_id")))
+    elif table == "club_members":
+        cache.invalidate("clubs")
+    elif table == "holds":
+        cache.invalidate("holds", "books")
+
+
+change_feed.bus.subscribe(_invalidate_for_change)
+
+# ────────────────────── QUERY INSTRUMENTATION ──────────────────────
+# Pooled connections hand out query_stats cursors, so every statement is timed per
+# operation (the function below that ran it) and query shape. query_metrics() is
+# the snapshot; write_metrics() dumps Prometheus text (also every METRICS_INTERVAL
+# seconds to METRICS_PATH). Demo mode runs no SQL — only the cache counters move.
+query_stats.stats.configure(slow_ms=SLOW_QUERY_MS, slow_log=SLOW_QUERY_LOG, data_layer=__file__)
+
+
+def query_metrics():
+    """Per-shape query counters (most total time first), recent slow queries and cache stats."""
+    return {**query_stats.stats.snapshot(), "cache": cache.stats()}
+
+
+def write_metrics(path=None):
+    """Write the Prometheus text dump (default METRICS_PATH). Returns the path written, or None."""
+    path = path or METRICS_PATH
+    if not path:
+        return None
+    query_stats.stats.write_prometheus(path, cache.stats())
+    return path
+
+
+def _metrics_loop():
+    while True:
+        time.sleep(METRICS_INTERVAL)
+        try:
+            write_metrics()
+        except OSError as e:
+            print("Metrics dump failed:", e)
 
 # ────────────────────── HELPER FUNCTIONS ──────────────────────
-def execute(query, params=None, fetch=False, commit=False):
-    if not DB_CONNECTED:
+def execute(query, params=None, fetch=False, commit=False, record=None):
+    """record (a records.Record class) makes fetched rows come back as records built from plain tuples."""
+    if not is_connected():
         return []
     try:
-        cur.execute(query, params or ())
-        if commit:
-            conn.commit()
-        return cur.fetchall() if fetch else None
+        with get_cursor(commit=commit, cursor_factory=query_stats.TimedCursor if record else None) as cur:
+            cur.execute(query, params or ())
+            if not fetch:
+                return None
+            if record is None:
+                return cur.fetchall()
+            make = record.row_factory([column.name for column in cur.description])
+            return [make(row) for row in cur.fetchall()]
     except Exception as e:
-        conn.rollback()
         print("DB Error:", e)
+        cache.discard_current()   # don't cache the empty fallback result
+        _connection_lost(e)
         return []
 
+# ────────────────────── SCHEMA MIGRATIONS ──────────────────────
+def run_migrations():
+    """
+    Apply migrations/*.sql in filename order, each in its own transaction,
+    recording applied files in schema_migrations. Returns the files applied.
+    """
+    applied = []
+    with get_cursor(commit=True) as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                filename TEXT PRIMARY KEY,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+        cur.execute("SELECT filename FROM schema_migrations")
+        done = {r["filename"] for r in cur.fetchall()}
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        if not filename.endswith(".sql") or filename in done:
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, filename), encoding="utf-8") as f:
+            sql = f.read()
+        with get_cursor(commit=True) as cur:
+            cur.execute(sql)
+            cur.execute("INSERT INTO schema_migrations (filename) VALUES (%s)", (filename,))
+        applied.append(filename)
+    return applied
+
 # ────────────────────── LOGIN FUNCTION (Librarian + Member) ──────────────────────
+# The SQL of the functions async_database.py mirrors lives in *_SQL constants so
+# both APIs run the same statements and map rows through the same records.
+# users.password holds a passwords.py scrypt hash (plaintext in rows not yet
+# migrated); it is fetched by username and checked here, never compared in SQL.
+LOGIN_SQL = """
+    SELECT u.username, u.role, m.member_id, u.password
+    FROM users u
+    LEFT JOIN members m ON u.username = m.email
+    WHERE u.username = %s
+"""
+# Only replaces the value that was just verified, so a concurrent password change wins
+REHASH_SQL = "UPDATE users SET password = %s WHERE username = %s AND password = %s"
+
+
+@_replica_fallback
 def authenticate_user(username, password):
     """
-    Returns user dict with role and member_id (for members)
+    Returns user dict with role and member_id (for members), or None. Raises the
+    database error if the password could not be checked at all, so auth.login()
+    doesn't count it as a wrong password.
+    Hashing costs ~50 ms by design — call it off the GUI thread (see auth.py).
     """
-    if not DB_CONNECTED:
+    if not is_connected() and OFFLINE:
+        # Only users who logged in on this machine while online (hash kept in the replica)
+        return replica.authenticate(username, password)
+    if not is_connected():
         # Demo login
         if username == "admin@limkokwing.edu" and password == "admin123":
             return {"username": username, "role": "Librarian"}
@@ -65,148 +721,1264 @@ def authenticate_user(username, password):
         return None
 
     # Real DB login
-    query = """
-        SELECT u.username, u.role, m.member_id 
-        FROM users u
-        LEFT JOIN members m ON u.username = m.email
-        WHERE u.username = %s AND u.password = %s
+    try:
+        with get_cursor() as cur:
+            cur.execute(LOGIN_SQL, (username,))
+            row = cur.fetchone()
+    except Exception as e:
+        print("DB Error:", e)
+        if _connection_lost(e):
+            return authenticate_user(username, password)
+        raise
+    user = dict(row) if row else None
+    stored = user.pop("password") if user else None
+    if not passwords.verify_password(password, stored):
+        return None
+    if passwords.needs_rehash(stored):
+        # Plaintext row (or older cost settings): upgraded on its first good login
+        new_hash = passwords.hash_password(password)
+        execute(REHASH_SQL, (new_hash, username, stored), commit=True)
+        stored = new_hash
+    remember_login(username, stored, user)
+    return user
+
+
+def get_unhashed_passwords(limit=500):
+    """[(username, password)] of rows still holding a plaintext password (auth.py --migrate-passwords)."""
+    if not is_connected():
+        return []
+    rows = execute("SELECT username, password FROM users WHERE password NOT LIKE 'scrypt$%%' LIMIT %s",
+                   (limit,), fetch=True)
+    return [(r["username"], r["password"]) for r in rows]
+
+
+def set_password_hash(username, old, new_hash):
+    """Swap a verified old value for new_hash; False if the row changed meanwhile."""
+    with get_cursor(commit=True) as cur:
+        cur.execute(REHASH_SQL, (new_hash, username, old))
+        return cur.rowcount == 1
+
+
+def remember_login(username, pw_hash, user):
+    """
+    Keep the just-verified scrypt hash in the replica so this user can sign in
+    offline later — no second hash is computed, and no replica file is created
+    for it (the replica-sync loop makes one when REPLICA_PATH is set).
     """
-    result = execute(query, (username, password), fetch=True)
-    return dict(result[0]) if result else None
+    if _open_replica(create=False):
+        replica.remember_login(username, pw_hash, user)
 
 # ────────────────────── BOOK FUNCTIONS ──────────────────────
-def get_all_books(search=""):
-    if not DB_CONNECTED:
-        if search:
-            search = search.lower()
-            return [b for b in books if search in b["title"].lower() or search in b["author_name"].lower()]
-        return books[:]
-
-    query = """
-        SELECT b.book_id, b.title, a.name AS author_name, b.isbn, b.genre, 
-               b.published_year, b.copies_available
-        FROM books b
-        LEFT JOIN authors a ON b.author_id = a.author_id
-        WHERE b.title ILIKE %s OR a.name ILIKE %s
-    """
-    search_term = f"%{search}%"
-    return execute(query, (search_term, search_term), fetch=True)
+CATALOG_PAGE_SIZE = 50
+
+
+def _like_pattern(search):
+    """Escape LIKE wildcards so a typed % or _ is matched literally."""
+    escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+# Plain browse: book_id order walks the primary key, no sort of the whole table
+BROWSE_BOOKS_SQL = """
+    SELECT b.book_id, b.title, a.name AS author_name, b.isbn, b.genre,
+           b.published_year, b.copies_available
+    FROM books b
+    LEFT JOIN authors a ON b.author_id = a.author_id
+    ORDER BY b.book_id
+    LIMIT %(limit)s OFFSET %(offset)s
+"""
+# Title and author hits are collected separately (UNION) so each side can use
+# its own GIN trigram index — an OR across the join would force a seq scan.
+SEARCH_BOOKS_SQL = """
+    WITH hits AS (
+        SELECT book_id FROM books WHERE title ILIKE %(pattern)s
+        UNION
+        SELECT b.book_id FROM authors a JOIN books b ON b.author_id = a.author_id
+        WHERE a.name ILIKE %(pattern)s
+    )
+    SELECT b.book_id, b.title, a.name AS author_name, b.isbn, b.genre,
+           b.published_year, b.copies_available
+    FROM hits h
+    JOIN books b ON b.book_id = h.book_id
+    LEFT JOIN authors a ON b.author_id = a.author_id
+    ORDER BY GREATEST(similarity(b.title, %(search)s),
+                      similarity(COALESCE(a.name, ''), %(search)s)) DESC,
+             b.book_id
+    LIMIT %(limit)s OFFSET %(offset)s
+"""
+
+
+def books_query(search="", limit=None, offset=0):
+    """(sql, params) for a get_all_books() call against PostgreSQL."""
+    search = (search or "").strip()
+    if not search:
+        return BROWSE_BOOKS_SQL, {"limit": limit, "offset": offset}
+    return SEARCH_BOOKS_SQL, {"pattern": _like_pattern(search), "search": search, "limit": limit, "offset": offset}
+
+
+@cache.cached("books")
+@_replica_fallback
+def get_all_books(search="", limit=None, offset=0):
+    """
+    Catalog search over title and author (plus genre/ISBN in demo mode).
+    limit=None returns every match; pass limit/offset (e.g. CATALOG_PAGE_SIZE)
+    to page through results. With a search term PostgreSQL results are ranked by
+    trigram similarity — run migrate.py once so the pg_trgm indexes exist.
+    """
+    if not is_connected():
+        if OFFLINE:
+            return replica.get_all_books(search, limit, offset)
+        matches = catalog.search(search)
+        page = matches[offset:offset + limit] if limit is not None else matches[offset:]
+        return [Book.from_dict(b) for b in page]
+
+    query, params = books_query(search, limit, offset)
+    return execute(query, params, fetch=True, record=Book)
 
 def add_book(title, author_name, isbn="", genre="", year=2025, copies=1):
-    if not DB_CONNECTED:
-        new_id = len(books) + 1
-        books.append({
-            "book_id": new_id, "title": title, "author_name": author_name,
+    """Returns the new book_id (a negative temporary id while offline)."""
+    if not is_connected() and OFFLINE:
+        book_id = replica.add_book(title, author_name, isbn, genre, year, copies)
+        cache.invalidate("books")
+        return book_id
+    if not is_connected():
+        book = demo.add("books", {
+            "book_id": demo.allocate("books"), "title": title, "author_name": author_name,
             "isbn": isbn, "genre": genre, "published_year": year, "copies_available": copies
         })
-        return
+        cache.invalidate("books")
+        change_feed.publish("books", "INSERT", book)
+        return book["book_id"]
 
     # Real DB: Insert author if not exists
-    cur.execute("INSERT INTO authors (name) VALUES (%s) ON CONFLICT (name) DO NOTHING", (author_name,))
-    cur.execute("SELECT author_id FROM authors WHERE name = %s", (author_name,))
-    author_id = cur.fetchone()["author_id"]
+    try:
+        with get_cursor(commit=True) as cur:
+            cur.execute("INSERT INTO authors (name) VALUES (%s) ON CONFLICT (name) DO NOTHING", (author_name,))
+            cur.execute("SELECT author_id FROM authors WHERE name = %s", (author_name,))
+            author_id = cur.fetchone()["author_id"]
+
+            cur.execute("""
+                INSERT INTO books (title, author_id, isbn, genre, published_year, copies_available)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                RETURNING book_id
+            """, (title, author_id, isbn or None, genre, year, copies))
+            book_id = cur.fetchone()["book_id"]
+            _record_replay(cur, "applied", book_id)
+    except psycopg2.Error as e:
+        if _connection_lost(e):
+            return add_book(title, author_name, isbn, genre, year, copies)
+        raise
+    cache.invalidate("books")
+    return book_id
 
-    cur.execute("""
-        INSERT INTO books (title, author_id, isbn, genre, published_year, copies_available)
-        VALUES (%s, %s, %s, %s, %s, %s)
-    """, (title, author_id, isbn or None, genre, year, copies))
-    conn.commit()
+BULK_COLUMNS = ("title", "author_id", "isbn", "genre", "published_year", "copies_available")
+
+
+def _merge_duplicate_isbns(rows):
+    """Rows sharing an ISBN within one batch become one row with the copies summed."""
+    merged, by_isbn = [], {}
+    for row in rows:
+        isbn = row.get("isbn") or None
+        if isbn and isbn in by_isbn:
+            by_isbn[isbn]["copies_available"] += row["copies_available"]
+            continue
+        row = dict(row, isbn=isbn)
+        merged.append(row)
+        if isbn:
+            by_isbn[isbn] = row
+    return merged
+
+
+def add_books_batch(rows, author_ids=None):
+    """
+    Insert a batch of books in one transaction (used by bulk_import.py).
+    rows: dicts with title, author_name, isbn, genre, published_year, copies_available.
+    A book whose ISBN already exists gets its copies added instead of a duplicate row.
+    author_ids (name -> id) may be shared across batches so known authors are
+    never looked up twice. Returns (inserted, merged).
+    """
+    rows = _merge_duplicate_isbns(rows)
+    if not rows:
+        return 0, 0
+
+    if not is_connected():
+        inserted = merged = 0
+        for row in rows:
+            existing = catalog.find_isbn(row["isbn"])
+            if existing:
+                demo.update("books", existing["book_id"],
+                            copies_available=existing["copies_available"] + row["copies_available"])
+                merged += 1
+            else:
+                demo.add("books", {"book_id": demo.allocate("books"), **row})
+                inserted += 1
+        cache.invalidate("books")
+        change_feed.bus.publish(RESYNC_EVENT)
+        return inserted, merged
+
+    author_ids = {} if author_ids is None else author_ids
+    with get_cursor(commit=True) as cur:
+        # Row triggers stay quiet for this transaction; one RESYNC goes out on commit instead
+        cur.execute("SET LOCAL smartlib.bulk_import = 'on'")
+
+        # Authors: one upsert + one lookup for every name not seen in earlier batches
+        missing = sorted({row["author_name"] for row in rows} - author_ids.keys())
+        if missing:
+            cur.execute("INSERT INTO authors (name) SELECT unnest(%s::text[]) ON CONFLICT (name) DO NOTHING", (missing,))
+            cur.execute("SELECT author_id, name FROM authors WHERE name = ANY(%s)", (missing,))
+            author_ids.update((r["name"], r["author_id"]) for r in cur.fetchall())
+
+        # Books: COPY into a staging table, then merge by ISBN in two set-based statements
+        cur.execute("""
+            CREATE TEMP TABLE books_staging (
+                title TEXT, author_id INTEGER, isbn TEXT, genre TEXT,
+                published_year INTEGER, copies_available INTEGER
+            ) ON COMMIT DROP
+        """)
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        for row in rows:
+            writer.writerow([row["title"], author_ids[row["author_name"]], row["isbn"], row["genre"],
+                             row["published_year"], row["copies_available"]])
+        buf.seek(0)
+        cur.copy_expert(f"COPY books_staging ({', '.join(BULK_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+        cur.execute("""
+            UPDATE books b SET copies_available = b.copies_available + s.copies_available
+            FROM books_staging s
+            WHERE s.isbn IS NOT NULL AND b.isbn = s.isbn
+        """)
+        merged = cur.rowcount
+        cur.execute(f"""
+            INSERT INTO books ({', '.join(BULK_COLUMNS)})
+            SELECT {', '.join('s.' + c for c in BULK_COLUMNS)}
+            FROM books_staging s
+            WHERE s.isbn IS NULL OR NOT EXISTS (SELECT 1 FROM books b WHERE b.isbn = s.isbn)
+        """)
+        inserted = cur.rowcount
+        cur.execute("SELECT pg_notify(%s, %s)", (change_feed.CHANNEL, json.dumps(RESYNC_EVENT)))
+    cache.invalidate("books")
+    return inserted, merged
 
 # ────────────────────── LOAN FUNCTIONS ──────────────────────
+MEMBER_LOANS_SQL = """
+    SELECT l.loan_id, b.title, l.loan_date, l.due_date,
+           COALESCE(s.days_overdue, CURRENT_DATE - l.due_date) AS days_overdue,
+           COALESCE(s.fine, 0) AS fine
+    FROM loans l
+    JOIN books b ON l.book_id = b.book_id
+    LEFT JOIN loan_status s ON s.loan_id = l.loan_id
+    WHERE l.member_id = %s AND l.return_date IS NULL
+"""
+
+
+@cache.cached(member_loans_tag)
+@_replica_fallback
 def get_member_loans(member_id):
-    if not DB_CONNECTED:
-        return [l for l in loans if l["member_id"] == member_id]
+    if not is_connected():
+        if OFFLINE:
+            return _with_status(replica.get_member_loans(member_id))
+        return _with_status([Loan.from_dict(l) for l in demo.loans.where(member_id=member_id, return_date=None)])
+
+    return execute(MEMBER_LOANS_SQL, (member_id,), fetch=True, record=Loan)
+
+MAX_LOANS = 3        # open loans allowed per member
+LOAN_DAYS = 7        # loan period
+LOAN_RETRIES = 3     # attempts when PostgreSQL reports a serialization failure / deadlock
+ISSUE_LOAN_SQL = "SELECT status, loan_id FROM issue_loan_atomic(%s, %s, %s, %s)"
+
+
+class LoanResult(str, Enum):
+    """Outcome of issue_loan(); truthy only on success so `if issue_loan(...)` still works."""
+    SUCCESS = "success"
+    NO_COPIES = "no_copies"
+    LIMIT_REACHED = "limit_reached"
+    ERROR = "error"
+
+    def __bool__(self):
+        return self is LoanResult.SUCCESS
 
-    query = """
-        SELECT l.loan_id, b.title, l.loan_date, l.due_date
-        FROM loans l
-        JOIN books b ON l.book_id = b.book_id
-        WHERE l.member_id = %s AND l.return_date IS NULL
-    """
-    return execute(query, (member_id,), fetch=True)
 
 def issue_loan(book_id, member_id):
-    if not DB_CONNECTED:
+    """
+    Check out one copy. With PostgreSQL the limit check, copy decrement and loan
+    insert run atomically inside issue_loan_atomic() (migrations/004) in a single
+    round-trip; serialization failures and deadlocks are retried.
+    Returns a LoanResult.
+    """
+    if not is_connected() and OFFLINE:
+        status, _ = replica.issue_loan(book_id, member_id, MAX_LOANS, LOAN_DAYS)
+        if status == "success":
+            cache.invalidate("books", "loans", "holds", member_loans_tag(member_id))
+        return LoanResult(status)
+    if not is_connected():
+        return _demo_issue_loan(book_id, member_id)[0]
+
+    # Real DB loan
+    def work():
+        with get_cursor(commit=True) as cur:
+            cur.execute(ISSUE_LOAN_SQL, (book_id, member_id, MAX_LOANS, LOAN_DAYS))
+            return LoanResult(cur.fetchone()["status"])
+
+    try:
+        result = _retry_on_conflict(work)
+    except Exception as e:
+        print("DB Error:", e)
+        if _connection_lost(e):
+            return issue_loan(book_id, member_id)
+        return LoanResult.ERROR
+    if result:
+        cache.invalidate("books", "loans", "holds", member_loans_tag(member_id))
+    return result
+
+
+def _demo_issue_loan(book_id, member_id):
+    """Demo-mode checkout; returns (LoanResult, loan_id)."""
+    with demo.lock:
         # Check max 3 loans
-        if len([l for l in loans if l["member_id"] == member_id]) >= 3:
-            return False
-        loans.append({
-            "loan_id": len(loans)+1,
+        if demo.loans.count(member_id=member_id, return_date=None) >= MAX_LOANS:
+            return LoanResult.LIMIT_REACHED, None
+        book = catalog.get(book_id)
+        ready = demo.holds.where(book_id=book_id, member_id=member_id, status="ready")
+        if not book or (not ready and book["copies_available"] <= 0):
+            return LoanResult.NO_COPIES, None
+        loan = demo.add("loans", {
+            "loan_id": demo.allocate("loans"),
             "book_id": book_id,
             "member_id": member_id,
-            "title": next(b["title"] for b in books if b["book_id"] == book_id),
+            "title": book["title"],
             "loan_date": str(date.today()),
-            "due_date": str(date.today() + timedelta(days=7))
+            "due_date": str(date.today() + timedelta(days=LOAN_DAYS)),
+            "return_date": None
         })
-        # Reduce copies
-        for b in books:
-            if b["book_id"] == book_id:
-                b["copies_available"] -= 1
-                break
-        return True
+        if ready:
+            # The copy set aside for this member's hold — the shelf count is untouched
+            holds = [demo.update("holds", ready[0]["hold_id"], status="fulfilled")]
+        else:
+            # Reduce copies
+            demo.update("books", book_id, copies_available=book["copies_available"] - 1)
+            holds = []
+            for hold in demo.holds.where(book_id=book_id, member_id=member_id, status="waiting"):
+                _dequeue_hold(hold)
+                holds.append(demo.update("holds", hold["hold_id"], status="fulfilled"))
+    cache.invalidate("books", "loans", "holds", member_loans_tag(member_id))
+    change_feed.publish("loans", "INSERT", loan)
+    change_feed.publish("books", "UPDATE", book)
+    for hold in holds:
+        change_feed.publish("holds", "UPDATE", hold)
+    return LoanResult.SUCCESS, loan["loan_id"]
+
+
+def _retry_on_conflict(work):
+    """Run a transaction, retrying serialization failures and deadlocks with a short backoff."""
+    for attempt in range(LOAN_RETRIES):
+        try:
+            return work()
+        except (psycopg2.errors.SerializationFailure, psycopg2.errors.DeadlockDetected) as e:
+            if attempt == LOAN_RETRIES - 1:
+                raise
+            print(f"Loan retry {attempt + 1}/{LOAN_RETRIES}:", e)
+            time.sleep(0.05 * (attempt + 1))
+
+
+def issue_loans(member_id, book_ids):
+    """
+    Check out a whole cart in one transaction and one round-trip.
+    Returns [{"book_id", "status": LoanResult, "loan_id"}] in cart order; books
+    are locked in book_id order so overlapping carts can't deadlock each other.
+    """
+    if not book_ids:
+        return []
+    if not is_connected() and OFFLINE:
+        results = []
+        for book_id in book_ids:
+            status, loan_id = replica.issue_loan(book_id, member_id, MAX_LOANS, LOAN_DAYS)
+            results.append({"book_id": book_id, "status": LoanResult(status), "loan_id": loan_id})
+        cache.invalidate("books", "loans", "holds", member_loans_tag(member_id))
+        return results
+    if not is_connected():
+        results = []
+        for book_id in book_ids:
+            status, loan_id = _demo_issue_loan(book_id, member_id)
+            results.append({"book_id": book_id, "status": status, "loan_id": loan_id})
+        return results
+
+    def work():
+        with get_cursor(commit=True) as cur:
+            cur.execute("""
+                SELECT c.book_id, c.ord, r.status, r.loan_id
+                FROM (SELECT book_id, ord FROM unnest(%s::int[]) WITH ORDINALITY AS t(book_id, ord)
+                      ORDER BY book_id) c
+                CROSS JOIN LATERAL issue_loan_atomic(c.book_id, %s, %s, %s) r
+            """, (list(book_ids), member_id, MAX_LOANS, LOAN_DAYS))
+            rows = sorted(cur.fetchall(), key=lambda r: r["ord"])
+            if rows:
+                _record_replay(cur, rows[0]["status"], rows[0]["loan_id"])   # a replayed checkout is one book
+            return rows
 
-    # Real DB loan
     try:
-        cur.execute("SELECT copies_available FROM books WHERE book_id = %s FOR UPDATE", (book_id,))
-        book = cur.fetchone()
-        if not book or book["copies_available"] <= 0:
-            return False
+        rows = _retry_on_conflict(work)
+    except Exception as e:
+        print("DB Error:", e)
+        if _connection_lost(e):
+            return issue_loans(member_id, book_ids)
+        return [{"book_id": b, "status": LoanResult.ERROR, "loan_id": None} for b in book_ids]
+    results = [{"book_id": r["book_id"], "status": LoanResult(r["status"]), "loan_id": r["loan_id"]} for r in rows]
+    if any(r["status"] for r in results):
+        cache.invalidate("books", "loans", "holds", member_loans_tag(member_id))
+    return results
+
+# Librarian loan rows; loans issued since the last overdue run have no loan_status row yet
+_LOAN_COLUMNS = """
+    l.loan_id, b.title AS book_title, m.full_name AS member_name, l.loan_date, l.due_date,
+    l.book_id, l.member_id, l.return_date,
+    COALESCE(s.days_overdue, CURRENT_DATE - l.due_date) AS days_overdue, COALESCE(s.fine, 0) AS fine
+"""
+ACTIVE_LOANS_SQL = f"""
+    SELECT {_LOAN_COLUMNS}
+    FROM loans l
+    JOIN books b ON l.book_id = b.book_id
+    JOIN members m ON l.member_id = m.member_id
+    LEFT JOIN loan_status s ON s.loan_id = l.loan_id
+    WHERE l.return_date IS NULL
+"""
+RETURN_LOAN_SQL = """
+    UPDATE loans SET return_date = CURRENT_DATE WHERE loan_id = %s AND return_date IS NULL
+    RETURNING book_id, member_id
+"""
+# Next waiting hold gets the copy, otherwise it goes back on the shelf
+RESTOCK_SQL = "SELECT restock_or_assign(%s, 1, %s)"
+
+@cache.cached("loans")
+@_replica_fallback
+def get_active_loans():
+    if not is_connected():
+        if OFFLINE:
+            return _with_status(replica.get_active_loans())
+        return _with_status([Loan.from_dict(l) for l in demo.loans.where(return_date=None)])
+    return execute(ACTIVE_LOANS_SQL, fetch=True, record=Loan)
+
+@cache.cached("loans")
+@_replica_fallback
+def get_active_loans_by_id(loan_ids):
+    """The still-open loans among loan_ids, shaped like get_active_loans(), in one query (patching table rows)."""
+    loan_ids = sorted(set(loan_ids))
+    if not loan_ids:
+        return []
+    if not is_connected():
+        if OFFLINE:
+            return _with_status(replica.get_active_loans_by_id(loan_ids))
+        loans = [demo.loans.get(loan_id) for loan_id in loan_ids]
+        return _with_status([Loan.from_dict(l) for l in loans if l and l["return_date"] is None])
+    return execute(ACTIVE_LOANS_SQL + " AND l.loan_id = ANY(%s)", (loan_ids,), fetch=True, record=Loan)
+
+def get_active_loan(loan_id):
+    """One row shaped like get_active_loans(), or None once it is returned."""
+    loans = get_active_loans_by_id((loan_id,))
+    return loans[0] if loans else None
+
+def return_loan(loan_id):
+    if not is_connected() and OFFLINE:
+        member_id = replica.return_loan(loan_id)
+        if member_id is not None:
+            cache.invalidate("books", "loans", "holds", member_loans_tag(member_id))
+        return
+    if not is_connected():
+        _demo_return_loan(loan_id)
+        return
+
+    try:
+        with get_cursor(commit=True) as cur:
+            cur.execute(RETURN_LOAN_SQL, (loan_id,))
+            returned = cur.fetchone()
+            if returned:
+                cur.execute(RESTOCK_SQL, (returned["book_id"], HOLD_PICKUP_DAYS))
+    except psycopg2.Error as e:
+        if _connection_lost(e):
+            return return_loan(loan_id)
+        raise
+    if returned:
+        cache.invalidate("books", "loans", "holds", member_loans_tag(returned["member_id"]))
 
-        # Check member loan limit
-        cur.execute("SELECT COUNT(*) FROM loans WHERE member_id = %s AND return_date IS NULL", (member_id,))
-        count = cur.fetchone()[0]
-        if count >= 3:
+def _demo_return_loan(loan_id):
+    """Demo-mode return; the loan row is kept (with its return_date) as history."""
+    with demo.lock:
+        loan = demo.loans.get(loan_id)
+        if loan is None or loan["return_date"] is not None:
             return False
+        demo.update("loans", loan_id, return_date=str(date.today()))
+        ready = _demo_restock_or_assign(loan["book_id"], 1)
+        book = catalog.get(loan["book_id"])
+    cache.invalidate("books", "loans", "holds", member_loans_tag(loan["member_id"]))
+    change_feed.publish("loans", "UPDATE", loan)
+    if book:
+        change_feed.publish("books", "UPDATE", book)
+    for hold in ready:
+        change_feed.publish("holds", "UPDATE", hold)
+    return True
 
-        cur.execute("""
-            INSERT INTO loans (book_id, member_id, due_date)
-            VALUES (%s, %s, %s)
-        """, (book_id, member_id, date.today() + timedelta(days=7)))
+def return_loans(loan_ids):
+    """
+    Return many loans (end-of-day book drop) in one transaction: loans are closed
+    in one statement, then each book's returned copies go to its waiting holds
+    first and the rest back on the shelf (restock_or_assign, in book_id order).
+    Returns [{"loan_id", "status": "returned" | "not_found"}] in input order.
+    """
+    if not loan_ids:
+        return []
+    if not is_connected() and OFFLINE:
+        results = []
+        for loan_id in loan_ids:
+            member_id = replica.return_loan(loan_id)
+            if member_id is not None:
+                cache.invalidate("books", "loans", "holds", member_loans_tag(member_id))
+            results.append({"loan_id": loan_id, "status": "not_found" if member_id is None else "returned"})
+        return results
+    if not is_connected():
+        return [{"loan_id": i, "status": "returned" if _demo_return_loan(i) else "not_found"} for i in loan_ids]
+
+    def work():
+        with get_cursor(commit=True) as cur:
+            cur.execute("""
+                UPDATE loans SET return_date = CURRENT_DATE
+                WHERE loan_id = ANY(%s) AND return_date IS NULL
+                RETURNING loan_id, book_id, member_id
+            """, (list(loan_ids),))
+            returned = cur.fetchall()
+            copies = sorted(Counter(r["book_id"] for r in returned).items())
+            if copies:
+                cur.execute("""
+                    SELECT restock_or_assign(t.book_id, t.n, %s)
+                    FROM unnest(%s::int[], %s::int[]) AS t(book_id, n)
+                """, (HOLD_PICKUP_DAYS, [b for b, _ in copies], [n for _, n in copies]))
+            _record_replay(cur, "returned" if returned else "not_found")
+            return returned
+
+    try:
+        returned = _retry_on_conflict(work)
+    except Exception as e:
+        print("DB Error:", e)
+        if _connection_lost(e):
+            return return_loans(loan_ids)
+        return [{"loan_id": i, "status": "error"} for i in loan_ids]
+    done = {r["loan_id"] for r in returned}
+    if returned:
+        cache.invalidate("books", "loans", "holds", *{member_loans_tag(r["member_id"]) for r in returned})
+    return [{"loan_id": i, "status": "returned" if i in done else "not_found"} for i in loan_ids]
+
+# ────────────────────── HOLDS ──────────────────────
+# FIFO hold queue per title (holds table, migrations/007). When a copy comes back
+# the oldest waiting hold becomes "ready" inside the return's transaction and the
+# copy is kept for that member for HOLD_PICKUP_DAYS; expire_holds() passes
+# uncollected copies down the queue. Queue positions are index range counts
+# (PostgreSQL) or a bisect into a sorted per-book list of hold ids (demo mode).
+HOLD_PICKUP_DAYS = 3
+
+
+class HoldResult(str, Enum):
+    """Outcome of place_hold(); truthy only when a hold was queued."""
+    PLACED = "placed"
+    AVAILABLE = "available"          # copies are on the shelf — borrow instead
+    ALREADY_HELD = "already_held"
+    ERROR = "error"
+
+    def __bool__(self):
+        return self is HoldResult.PLACED
+
+
+_hold_queues = {}   # demo mode: book_id -> sorted hold_ids of waiting holds (built on first use)
 
-        cur.execute("UPDATE books SET copies_available = copies_available - 1 WHERE book_id = %s", (book_id,))
-        conn.commit()
+_POSITION_SQL = """
+    SELECT COUNT(*) AS position FROM holds
+    WHERE book_id = %s AND status = 'waiting' AND hold_id <= %s
+"""
+
+
+def _hold_queue(book_id):
+    # Callers hold demo.lock
+    queue = _hold_queues.get(book_id)
+    if queue is None:
+        queue = _hold_queues[book_id] = [h["hold_id"] for h in demo.holds.where(book_id=book_id, status="waiting")]
+    return queue
+
+
+def _dequeue_hold(hold):
+    queue = _hold_queue(hold["book_id"])
+    i = bisect_right(queue, hold["hold_id"]) - 1
+    if i >= 0 and queue[i] == hold["hold_id"]:
+        del queue[i]
+
+
+def _demo_restock_or_assign(book_id, copies):
+    """Demo counterpart of restock_or_assign(); returns the holds made ready. Callers hold demo.lock."""
+    queue = _hold_queue(book_id)
+    ready_until = str(date.today() + timedelta(days=HOLD_PICKUP_DAYS))
+    ready = []
+    while copies and queue:
+        ready.append(demo.update("holds", queue.pop(0), status="ready", ready_until=ready_until))
+        copies -= 1
+    book = catalog.get(book_id)
+    if copies and book:
+        demo.update("books", book_id, copies_available=book["copies_available"] + copies)
+    return ready
+
+
+def place_hold(book_id, member_id):
+    """
+    Queue member_id for a title with no copies on the shelf.
+    Returns {"status": HoldResult, "hold_id", "position"} (position 1 = next in line).
+    """
+    if not is_connected() and OFFLINE:
+        return {"status": HoldResult.ERROR, "hold_id": None, "position": None}
+    if not is_connected():
+        with demo.lock:
+            book = catalog.get(book_id)
+            if book is None:
+                return {"status": HoldResult.ERROR, "hold_id": None, "position": None}
+            if book["copies_available"] > 0:
+                return {"status": HoldResult.AVAILABLE, "hold_id": None, "position": None}
+            if (demo.holds.count(book_id=book_id, member_id=member_id, status="waiting")
+                    or demo.holds.count(book_id=book_id, member_id=member_id, status="ready")):
+                return {"status": HoldResult.ALREADY_HELD, "hold_id": None, "position": None}
+            queue = _hold_queue(book_id)    # built before the insert so the new hold isn't counted twice
+            hold = demo.add("holds", {
+                "hold_id": demo.allocate("holds"), "book_id": book_id, "member_id": member_id,
+                "status": "waiting", "placed_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "ready_until": None
+            })
+            insort(queue, hold["hold_id"])
+            position = bisect_right(queue, hold["hold_id"])
+        cache.invalidate("holds")
+        change_feed.publish("holds", "INSERT", hold)
+        return {"status": HoldResult.PLACED, "hold_id": hold["hold_id"], "position": position}
+
+    def work():
+        with get_cursor(commit=True) as cur:
+            # Same lock as restock_or_assign(): a copy can't come back unseen while we queue
+            cur.execute("SELECT copies_available FROM books WHERE book_id = %s FOR UPDATE", (book_id,))
+            book = cur.fetchone()
+            if book is None:
+                return HoldResult.ERROR, None, None
+            if book["copies_available"] > 0:
+                return HoldResult.AVAILABLE, None, None
+            cur.execute("""
+                INSERT INTO holds (book_id, member_id) VALUES (%s, %s)
+                ON CONFLICT (book_id, member_id) WHERE status IN ('waiting', 'ready') DO NOTHING
+                RETURNING hold_id
+            """, (book_id, member_id))
+            row = cur.fetchone()
+            if row is None:
+                return HoldResult.ALREADY_HELD, None, None
+            cur.execute(_POSITION_SQL, (book_id, row["hold_id"]))
+            return HoldResult.PLACED, row["hold_id"], cur.fetchone()["position"]
+
+    try:
+        status, hold_id, position = _retry_on_conflict(work)
+    except Exception as e:
+        print("DB Error:", e)
+        return {"status": HoldResult.ERROR, "hold_id": None, "position": None}
+    if status:
+        cache.invalidate("holds")
+    return {"status": status, "hold_id": hold_id, "position": position}
+
+
+def get_queue_position(hold_id):
+    """1-based place in the queue for a waiting hold, else None."""
+    if not is_connected():
+        if OFFLINE:
+            return None
+        with demo.lock:
+            hold = demo.holds.get(hold_id)
+            if hold is None or hold["status"] != "waiting":
+                return None
+            return bisect_right(_hold_queue(hold["book_id"]), hold_id)
+    result = execute("""
+        SELECT q.position FROM holds h
+        CROSS JOIN LATERAL (SELECT COUNT(*) AS position FROM holds w
+                            WHERE w.book_id = h.book_id AND w.status = 'waiting'
+                              AND w.hold_id <= h.hold_id) q
+        WHERE h.hold_id = %s AND h.status = 'waiting'
+    """, (hold_id,), fetch=True)
+    return result[0]["position"] if result else None
+
+
+@cache.cached("holds")
+def get_member_holds(member_id):
+    """The member's waiting and ready holds, oldest first, as Hold records."""
+    if not is_connected():
+        if OFFLINE:
+            return []
+        with demo.lock:
+            holds = [h for status in ("waiting", "ready")
+                     for h in demo.holds.where(member_id=member_id, status=status)]
+            records = []
+            for h in sorted(holds, key=lambda h: h["hold_id"]):
+                book = catalog.get(h["book_id"])
+                position = bisect_right(_hold_queue(h["book_id"]), h["hold_id"]) if h["status"] == "waiting" else None
+                records.append(Hold.from_dict({**h, "title": book["title"] if book else None, "position": position}))
+        return records
+    return execute("""
+        SELECT h.hold_id, h.book_id, h.member_id, b.title, h.status,
+               CASE WHEN h.status = 'waiting' THEN
+                   (SELECT COUNT(*) FROM holds w
+                    WHERE w.book_id = h.book_id AND w.status = 'waiting' AND w.hold_id <= h.hold_id)
+               END AS position,
+               h.placed_at, h.ready_until
+        FROM holds h
+        JOIN books b ON b.book_id = h.book_id
+        WHERE h.member_id = %s AND h.status IN ('waiting', 'ready')
+        ORDER BY h.hold_id
+    """, (member_id,), fetch=True, record=Hold)
+
+
+def cancel_hold(hold_id, member_id):
+    """Cancel a live hold; a copy already set aside for it moves down the queue. Returns True if cancelled."""
+    if not is_connected():
+        if OFFLINE:
+            return False
+        with demo.lock:
+            hold = demo.holds.get(hold_id)
+            if hold is None or hold["member_id"] != member_id or hold["status"] not in ("waiting", "ready"):
+                return False
+            was_ready = hold["status"] == "ready"
+            if not was_ready:
+                _dequeue_hold(hold)
+            changed = [demo.update("holds", hold_id, status="cancelled")]
+            if was_ready:
+                changed += _demo_restock_or_assign(hold["book_id"], 1)
+            book = catalog.get(hold["book_id"])
+        cache.invalidate("holds", "books")
+        for h in changed:
+            change_feed.publish("holds", "UPDATE", h)
+        if was_ready and book:
+            change_feed.publish("books", "UPDATE", book)
         return True
-    except:
-        conn.rollback()
+
+    def work():
+        with get_cursor(commit=True) as cur:
+            cur.execute("SELECT book_id FROM holds WHERE hold_id = %s AND member_id = %s", (hold_id, member_id))
+            row = cur.fetchone()
+            if row is None:
+                return False
+            # Book first, then hold — the order restock_or_assign() and expire_holds() use
+            cur.execute("SELECT 1 FROM books WHERE book_id = %s FOR UPDATE", (row["book_id"],))
+            cur.execute("SELECT status FROM holds WHERE hold_id = %s FOR UPDATE", (hold_id,))
+            status = cur.fetchone()["status"]
+            if status not in ("waiting", "ready"):
+                return False
+            cur.execute("UPDATE holds SET status = 'cancelled' WHERE hold_id = %s", (hold_id,))
+            if status == "ready":
+                cur.execute("SELECT restock_or_assign(%s, 1, %s)", (row["book_id"], HOLD_PICKUP_DAYS))
+            return True
+
+    try:
+        cancelled = _retry_on_conflict(work)
+    except Exception as e:
+        print("DB Error:", e)
         return False
+    if cancelled:
+        cache.invalidate("holds", "books")
+    return cancelled
 
-def get_active_loans():
-    if not DB_CONNECTED:
-        return loans[:]
-    return execute("""
-        SELECT l.loan_id, b.title AS book_title, m.full_name AS member_name,
-               l.loan_date, l.due_date
-        FROM loans l
+
+def expire_holds():
+    """Expire ready holds past ready_until and pass their copies on. Returns how many expired."""
+    if not is_connected():
+        if OFFLINE:
+            return 0
+        today = str(date.today())
+        changed, books = [], set()
+        with demo.lock:
+            for hold in demo.holds.where(status="ready"):
+                if hold["ready_until"] and hold["ready_until"] < today:
+                    changed.append(demo.update("holds", hold["hold_id"], status="expired"))
+                    changed += _demo_restock_or_assign(hold["book_id"], 1)
+                    books.add(hold["book_id"])
+        expired = sum(1 for h in changed if h["status"] == "expired")
+        for h in changed:
+            change_feed.publish("holds", "UPDATE", h)
+        for book_id in sorted(books):
+            change_feed.publish("books", "UPDATE", catalog.get(book_id))
+    else:
+        with get_cursor(commit=True) as cur:
+            cur.execute("SELECT expire_holds(%s) AS expired", (HOLD_PICKUP_DAYS,))
+            expired = cur.fetchone()["expired"]
+    if expired:
+        cache.invalidate("holds", "books")
+    return expired
+
+# ────────────────────── OVERDUE & FINES ──────────────────────
+# refresh_overdue() runs on the "overdue-job" thread every OVERDUE_INTERVAL
+# seconds and materializes days overdue + fines for all open loans (loan_status,
+# migrations/005); loan reads and get_overdue_loans() just read the result.
+FINE_PER_DAY = 0.50   # charged per day past the due date
+FINE_CAP = 20.00      # maximum fine per loan
+OVERDUE_LAST_RUN = None
+
+_overdue = {}           # demo mode: loan_id -> (days_overdue, fine)
+_overdue_ranking = []   # demo mode: overdue loan_ids, worst first
+
+
+def _assess(due_date, today):
+    days = (today - date.fromisoformat(str(due_date)[:10])).days
+    return days, min(max(days, 0) * FINE_PER_DAY, FINE_CAP)
+
+
+def _with_status(loans):
+    """Fill days_overdue/fine on demo or replica Loan records (computed for loans newer than the last run)."""
+    today = date.today()
+    for loan in loans:
+        loan.days_overdue, loan.fine = _overdue.get(loan.loan_id) or _assess(loan.due_date, today)
+    return loans
+
+
+def refresh_overdue():
+    """Recompute overdue status for every open loan. Returns the number of overdue loans."""
+    global _overdue, _overdue_ranking, OVERDUE_LAST_RUN
+    if not is_connected():
+        if OFFLINE:
+            return None   # the replica computes status on read; the server job resumes on reconnect
+        today = date.today()
+        status = {l["loan_id"]: _assess(l["due_date"], today) for l in demo.loans.where(return_date=None)}
+        _overdue = status
+        _overdue_ranking = sorted((i for i, (days, _) in status.items() if days > 0),
+                                  key=lambda i: (-status[i][0], i))
+        overdue = len(_overdue_ranking)
+    else:
+        with get_cursor(commit=True) as cur:
+            # One set-based pass: upsert changed rows, drop rows of loans no longer open
+            cur.execute("""
+                WITH open_loans AS (
+                    SELECT loan_id, member_id, CURRENT_DATE - due_date AS days_overdue
+                    FROM loans
+                    WHERE return_date IS NULL
+                ), upserted AS (
+                    INSERT INTO loan_status (loan_id, member_id, days_overdue, fine)
+                    SELECT loan_id, member_id, days_overdue,
+                           LEAST(GREATEST(days_overdue, 0) * %(per_day)s::numeric, %(cap)s::numeric)
+                    FROM open_loans
+                    ON CONFLICT (loan_id) DO UPDATE
+                        SET days_overdue = EXCLUDED.days_overdue, fine = EXCLUDED.fine
+                        WHERE (loan_status.days_overdue, loan_status.fine)
+                              IS DISTINCT FROM (EXCLUDED.days_overdue, EXCLUDED.fine)
+                )
+                DELETE FROM loan_status s
+                WHERE NOT EXISTS (SELECT 1 FROM open_loans o WHERE o.loan_id = s.loan_id)
+            """, {"per_day": FINE_PER_DAY, "cap": FINE_CAP})
+            cur.execute("SELECT COUNT(*) AS overdue FROM loan_status WHERE days_overdue > 0")
+            overdue = cur.fetchone()["overdue"]
+    OVERDUE_LAST_RUN = time.time()
+    cache.invalidate("loans", "overdue")
+    return overdue
+
+
+def _overdue_loop():
+    # Also runs the hold-expiry sweep: both only change when the date rolls over
+    while True:
+        for job in (refresh_overdue, expire_holds):
+            try:
+                job()
+            except Exception as e:
+                print(f"{job.__name__} failed:", e)
+        time.sleep(OVERDUE_INTERVAL)
+
+
+@cache.cached("loans", "overdue")
+@_replica_fallback
+def get_overdue_loans(limit=None, offset=0):
+    """Overdue open loans, most days overdue first, from the last refresh_overdue() run."""
+    if not is_connected() and OFFLINE:
+        loans = sorted((l for l in _with_status(replica.get_active_loans()) if l.days_overdue > 0),
+                       key=lambda l: (-l.days_overdue, l.loan_id))
+        return loans[offset:offset + limit] if limit is not None else loans[offset:]
+    if not is_connected():
+        ids = _overdue_ranking[offset:offset + limit] if limit is not None else _overdue_ranking[offset:]
+        rows = (demo.loans.get(i) for i in ids)
+        return _with_status([Loan.from_dict(r) for r in rows if r and r["return_date"] is None])
+    return execute(f"""
+        SELECT {_LOAN_COLUMNS}
+        FROM loan_status s
+        JOIN loans l ON l.loan_id = s.loan_id
         JOIN books b ON l.book_id = b.book_id
         JOIN members m ON l.member_id = m.member_id
-        WHERE l.return_date IS NULL
-    """, fetch=True)
+        WHERE s.days_overdue > 0 AND l.return_date IS NULL
+        ORDER BY s.days_overdue DESC, s.loan_id
+        LIMIT %(limit)s OFFSET %(offset)s
+    """, {"limit": limit, "offset": offset}, fetch=True, record=Loan)
 
-def return_loan(loan_id):
-    if not DB_CONNECTED:
-        global loans
-        loan = next((l for l in loans if l["loan_id"] == loan_id), None)
-        if loan:
-            loans = [l for l in loans if l["loan_id"] != loan_id]
-            for b in books:
-                if b["book_id"] == loan["book_id"]:
-                    b["copies_available"] += 1
+# ────────────────────── REMINDERS ──────────────────────
+# Data side of reminders.py: keyset-paged candidate selection plus a ledger of
+# idempotency keys (reminders_sent, migrations/006) claimed before each send.
+REMINDER_DUE_SOON_DAYS = 2   # "due soon" = due within this many days
+
+
+def _reminder_key(kind, loan_id, due_date):
+    return f"{kind}:{loan_id}:{str(due_date)[:10]}"
+
+
+def get_reminder_batch(after_loan_id=0, limit=500, due_within=REMINDER_DUE_SOON_DAYS):
+    """
+    Open loans that are overdue or due within `due_within` days and not yet
+    reminded, with loan_id > after_loan_id (pass the last loan_id seen to page).
+    Rows are dicts: loan_id, member_id, full_name, email, title, due_date,
+    days_overdue, fine, kind ("due_soon" | "overdue") and key.
+    """
+    if not is_connected():
+        if OFFLINE:
+            return []   # members are never reminded from a workstation's offline copy
+        today = date.today()
+        horizon = str(today + timedelta(days=due_within))
+        batch = []
+        for loan in _with_status([Loan.from_dict(l) for l in demo.loans.where(return_date=None)]):
+            if loan.loan_id <= after_loan_id or str(loan.due_date) > horizon:
+                continue
+            kind = "overdue" if loan.days_overdue > 0 else "due_soon"
+            key = _reminder_key(kind, loan.loan_id, loan.due_date)
+            member = demo.members.get(loan.member_id)
+            if key in demo.reminders or member is None:
+                continue
+            batch.append({"loan_id": loan.loan_id, "member_id": loan.member_id, "full_name": member["full_name"],
+                          "email": member["email"], "title": loan.title, "due_date": loan.due_date,
+                          "days_overdue": loan.days_overdue, "fine": loan.fine, "kind": kind, "key": key})
+            if len(batch) == limit:
+                break
+        return batch
+
+    rows = execute("""
+        WITH candidates AS (
+            SELECT l.loan_id, l.member_id, m.full_name, m.email, b.title, l.due_date,
+                   COALESCE(s.days_overdue, CURRENT_DATE - l.due_date) AS days_overdue,
+                   COALESCE(s.fine, 0) AS fine,
+                   CASE WHEN l.due_date < CURRENT_DATE THEN 'overdue' ELSE 'due_soon' END AS kind
+            FROM loans l
+            JOIN members m ON m.member_id = l.member_id
+            JOIN books b ON b.book_id = l.book_id
+            LEFT JOIN loan_status s ON s.loan_id = l.loan_id
+            WHERE l.return_date IS NULL
+              AND l.due_date <= CURRENT_DATE + %(due_within)s
+              AND l.loan_id > %(after)s
+        )
+        SELECT c.*, c.kind || ':' || c.loan_id || ':' || c.due_date AS key
+        FROM candidates c
+        WHERE NOT EXISTS (SELECT 1 FROM reminders_sent r
+                          WHERE r.idempotency_key = c.kind || ':' || c.loan_id || ':' || c.due_date)
+        ORDER BY c.loan_id
+        LIMIT %(limit)s
+    """, {"due_within": due_within, "after": after_loan_id, "limit": limit}, fetch=True)
+    return [dict(r) for r in rows]
+
+
+def claim_reminder(key, loan_id, member_id, kind):
+    """Record key as sent; False if another run already claimed it (don't send)."""
+    if not is_connected() and OFFLINE:
+        return False
+    if not is_connected():
+        with demo.lock:
+            if key in demo.reminders:
+                return False
+            demo.add("reminders", {"key": key, "loan_id": loan_id, "member_id": member_id, "kind": kind,
+                                   "sent_at": time.strftime("%Y-%m-%dT%H:%M:%S")})
+        return True
+    with get_cursor(commit=True) as cur:
+        cur.execute("""
+            INSERT INTO reminders_sent (idempotency_key, loan_id, member_id, kind)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (idempotency_key) DO NOTHING
+        """, (key, loan_id, member_id, kind))
+        return cur.rowcount == 1
+
+
+def release_reminder(key):
+    """Undo a claim whose send failed, so the next run retries it."""
+    if not is_connected() and OFFLINE:
         return
+    if not is_connected():
+        demo.remove("reminders", key)
+        return
+    execute("DELETE FROM reminders_sent WHERE idempotency_key = %s", (key,), commit=True)
+
+# ────────────────────── RECOMMENDATIONS ──────────────────────
+# Data side of recommender.py: loans after the last run's watermark, increments
+# to the co-borrowing matrix (book_cooccurrence, migrations/008) and the top-K
+# neighbour lists built from it. get_recommendations() only reads the lists of a
+# member's RECOMMEND_SEEDS most recent titles, so serving costs at most
+# RECOMMEND_SEEDS × K index rows however long the member's history is.
+RECOMMEND_SEEDS = 10   # most recent distinct titles a member's picks are drawn from
+
+
+def get_recommender_watermark():
+    """loan_id up to which loans are counted in the matrix (None while offline)."""
+    if not is_connected():
+        if OFFLINE:
+            return None
+        state = demo.recommender_state.get(1)
+        return state["last_loan_id"] if state else 0
+    result = execute("SELECT last_loan_id FROM recommender_state", fetch=True)
+    return result[0]["last_loan_id"] if result else 0
+
+
+def get_borrow_events(after_loan_id=0, limit=5000):
+    """(loan_id, member_id, book_id) of loans with loan_id > after_loan_id, oldest first."""
+    if not is_connected():
+        loans = [l for l in demo.loans.where() if l["loan_id"] > after_loan_id][:limit]
+        return [(l["loan_id"], l["member_id"], l["book_id"]) for l in loans]
+    rows = execute("""
+        SELECT loan_id, member_id, book_id FROM loans
+        WHERE loan_id > %s ORDER BY loan_id LIMIT %s
+    """, (after_loan_id, limit), fetch=True)
+    return [(r["loan_id"], r["member_id"], r["book_id"]) for r in rows]
+
+
+def get_member_histories(member_ids, up_to_loan_id):
+    """{member_id: set of book_ids} the members borrowed in loans up to up_to_loan_id."""
+    member_ids = sorted(member_ids)
+    if not is_connected():
+        with demo.lock:
+            return {m: {l["book_id"] for l in demo.loans.where(member_id=m) if l["loan_id"] <= up_to_loan_id}
+                    for m in member_ids}
+    rows = execute("""
+        SELECT member_id, array_agg(DISTINCT book_id) AS books FROM loans
+        WHERE member_id = ANY(%s) AND loan_id <= %s
+        GROUP BY member_id
+    """, (member_ids, up_to_loan_id), fetch=True)
+    return {r["member_id"]: set(r["books"]) for r in rows}
+
+
+def get_cooccurrence(book_ids):
+    """
+    Rows of the matrix for book_ids as ({book_id: {other_id: together}}, borrowers),
+    borrowers being the diagonal ({book_id: members who borrowed it}) for every
+    book that appears in those rows.
+    """
+    book_ids = sorted(book_ids)
+    rows, borrowers = {}, {}
+    if not is_connected():
+        with demo.lock:
+            for book_id in book_ids:
+                stored = demo.book_cooccurrence.get(book_id)
+                rows[book_id] = row = {other: n for other, n in stored["counts"]} if stored else {}
+                for other in row:
+                    if other not in borrowers:
+                        diagonal = demo.book_cooccurrence.get(other)
+                        borrowers[other] = dict(diagonal["counts"]).get(other, 0) if diagonal else 0
+        return rows, borrowers
+    result = execute("""
+        SELECT r.book_id, r.other_id, r.together, d.together AS borrowers
+        FROM book_cooccurrence r
+        JOIN book_cooccurrence d ON d.book_id = r.other_id AND d.other_id = r.other_id
+        WHERE r.book_id = ANY(%s)
+    """, (book_ids,), fetch=True)
+    for book_id in book_ids:
+        rows[book_id] = {}
+    for r in result:
+        rows[r["book_id"]][r["other_id"]] = r["together"]
+        borrowers[r["other_id"]] = r["borrowers"]
+    return rows, borrowers
+
+
+def apply_cooccurrence(deltas, from_loan_id, to_loan_id):
+    """
+    Add {book_id: {other_id: n}} to the matrix and move the watermark from
+    from_loan_id to to_loan_id in one transaction. Returns False, applying
+    nothing, if another run moved the watermark first.
+    """
+    if not is_connected():
+        with demo.lock:
+            state = demo.recommender_state.get(1)
+            if (state["last_loan_id"] if state else 0) != from_loan_id:
+                return False
+            for book_id in sorted(deltas):
+                stored = demo.book_cooccurrence.get(book_id)
+                counts = Counter({other: n for other, n in stored["counts"]} if stored else {})
+                counts.update(deltas[book_id])
+                demo.add("book_cooccurrence", {"book_id": book_id, "counts": sorted(counts.items())})
+            demo.add("recommender_state", {"id": 1, "last_loan_id": to_loan_id,
+                                           "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S")})
+        return True
+
+    # Cells in key order so concurrent writers (a rebuild racing a nightly run) lock rows in the same order
+    cells = sorted((book_id, other, n) for book_id, row in deltas.items() for other, n in row.items())
+    with get_cursor(commit=True) as cur:
+        cur.execute("SELECT last_loan_id FROM recommender_state FOR UPDATE")
+        if cur.fetchone()["last_loan_id"] != from_loan_id:
+            return False
+        if cells:
+            cur.execute("""
+                INSERT INTO book_cooccurrence (book_id, other_id, together)
+                SELECT * FROM unnest(%s::int[], %s::int[], %s::int[])
+                ON CONFLICT (book_id, other_id) DO UPDATE
+                    SET together = book_cooccurrence.together + EXCLUDED.together
+            """, [list(column) for column in zip(*cells)])
+        cur.execute("UPDATE recommender_state SET last_loan_id = %s, updated_at = now()", (to_loan_id,))
+    return True
+
 
-    cur.execute("""
-        UPDATE loans SET return_date = CURRENT_DATE WHERE loan_id = %s AND return_date IS NULL
-    """, (loan_id,))
-    if cur.rowcount > 0:
-        cur.execute("UPDATE books SET copies_available = copies_available + 1 WHERE book_id = (SELECT book_id FROM loans WHERE loan_id = %s)", (loan_id,))
-        conn.commit()
+def get_book_features(book_ids):
+    """{book_id: (author, genre)} for the affinity part of the similarity score."""
+    book_ids = sorted(book_ids)
+    if not is_connected():
+        books = (catalog.get(i) for i in book_ids)
+        return {b["book_id"]: (b["author_name"], b["genre"]) for b in books if b}
+    rows = execute("SELECT book_id, author_id, genre FROM books WHERE book_id = ANY(%s)", (book_ids,), fetch=True)
+    return {r["book_id"]: (r["author_id"], r["genre"]) for r in rows}
+
+
+def save_neighbors(neighbors):
+    """Replace the neighbour lists of the given books: {book_id: [(neighbor_id, score), ...]}."""
+    if not is_connected():
+        with demo.lock:
+            for book_id in sorted(neighbors):
+                demo.add("book_neighbors", {"book_id": book_id, "neighbors": [list(n) for n in neighbors[book_id]]})
+    else:
+        book_ids = sorted(neighbors)
+        cells = [(book_id, other, score) for book_id in book_ids for other, score in neighbors[book_id]]
+        with get_cursor(commit=True) as cur:
+            cur.execute("DELETE FROM book_neighbors WHERE book_id = ANY(%s)", (book_ids,))
+            if cells:
+                cur.execute("""
+                    INSERT INTO book_neighbors (book_id, neighbor_id, score)
+                    SELECT * FROM unnest(%s::int[], %s::int[], %s::real[])
+                """, [list(column) for column in zip(*cells)])
+    cache.invalidate("recommendations")
+
+
+def reset_recommendations():
+    """Empty the matrix and the neighbour lists and rewind the watermark (before a full rebuild)."""
+    if not is_connected():
+        with demo.lock:
+            for table in ("book_cooccurrence", "book_neighbors"):
+                for row in demo.tables[table].all():
+                    demo.remove(table, row["book_id"])
+            demo.add("recommender_state", {"id": 1, "last_loan_id": 0,
+                                           "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S")})
+    else:
+        with get_cursor(commit=True) as cur:
+            cur.execute("SELECT 1 FROM recommender_state FOR UPDATE")
+            cur.execute("TRUNCATE book_cooccurrence, book_neighbors")
+            cur.execute("UPDATE recommender_state SET last_loan_id = 0, updated_at = now()")
+    cache.invalidate("recommendations")
+
+
+_BOOK_COLUMNS = """
+    b.book_id, b.title, a.name AS author_name, b.isbn, b.genre, b.published_year, b.copies_available
+"""
+
+
+@cache.cached("recommendations", "books", lambda member_id, limit=10: member_loans_tag(member_id))
+def get_recommendations(member_id, limit=10):
+    """
+    Titles the member hasn't borrowed, ranked by summed similarity to their
+    RECOMMEND_SEEDS most recent titles; the most borrowed titles for members
+    with no history yet. Book records.
+    """
+    if not is_connected():
+        if OFFLINE:
+            return []
+        with demo.lock:
+            borrowed, seeds = set(), []
+            for loan in reversed(demo.loans.where(member_id=member_id)):
+                if loan["book_id"] not in borrowed and len(seeds) < RECOMMEND_SEEDS:
+                    seeds.append(loan["book_id"])
+                borrowed.add(loan["book_id"])
+            scores = Counter()
+            for seed in seeds:
+                stored = demo.book_neighbors.get(seed)
+                for other, score in (stored["neighbors"] if stored else ()):
+                    if other not in borrowed:
+                        scores[other] += score
+            if not scores:
+                for row in demo.book_cooccurrence.all():
+                    if row["book_id"] not in borrowed:
+                        scores[row["book_id"]] = dict(row["counts"]).get(row["book_id"], 0)
+            ranked = sorted(scores, key=lambda i: (-scores[i], i))
+            books = (catalog.get(i) for i in ranked)
+            return [Book.from_dict(b) for b in books if b][:limit]
+
+    picks = execute(f"""
+        WITH seeds AS (
+            SELECT book_id FROM loans
+            WHERE member_id = %(member)s
+            GROUP BY book_id
+            ORDER BY MAX(loan_id) DESC
+            LIMIT %(seeds)s
+        ), scored AS (
+            SELECT n.neighbor_id, SUM(n.score) AS score
+            FROM seeds s
+            JOIN book_neighbors n ON n.book_id = s.book_id
+            WHERE NOT EXISTS (SELECT 1 FROM loans l WHERE l.member_id = %(member)s AND l.book_id = n.neighbor_id)
+            GROUP BY n.neighbor_id
+        )
+        SELECT {_BOOK_COLUMNS}
+        FROM scored s
+        JOIN books b ON b.book_id = s.neighbor_id
+        LEFT JOIN authors a ON a.author_id = b.author_id
+        ORDER BY s.score DESC, b.book_id
+        LIMIT %(limit)s
+    """, {"member": member_id, "seeds": RECOMMEND_SEEDS, "limit": limit}, fetch=True, record=Book)
+    if picks:
+        return picks
+    return execute(f"""
+        SELECT {_BOOK_COLUMNS}
+        FROM book_cooccurrence c
+        JOIN books b ON b.book_id = c.book_id
+        LEFT JOIN authors a ON a.author_id = b.author_id
+        WHERE c.book_id = c.other_id
+          AND NOT EXISTS (SELECT 1 FROM loans l WHERE l.member_id = %(member)s AND l.book_id = c.book_id)
+        ORDER BY c.together DESC, b.book_id
+        LIMIT %(limit)s
+    """, {"member": member_id, "limit": limit}, fetch=True, record=Book)
+
+# ────────────────────── DASHBOARD STATS ──────────────────────
+@cache.cached("books", "loans", "clubs", ttl=10.0)
+@_replica_fallback
+def get_dashboard_stats():
+    """
+    Counts for the librarian dashboard in one round-trip — no rows are shipped
+    to the client just to be counted. Loans are scanned once with FILTERs.
+    """
+    if not is_connected() and OFFLINE:
+        return replica.get_dashboard_stats()
+    if not is_connected():
+        today = str(date.today())
+        open_loans = demo.loans.where(return_date=None)
+        return {
+            "total_books": len(catalog),
+            "copies_on_shelf": catalog.copies_total,
+            "active_loans": len(open_loans),
+            "overdue_loans": sum(1 for l in open_loans if l["due_date"] < today),
+            "due_today": sum(1 for l in open_loans if l["due_date"] == today),
+            "book_clubs": len(demo.clubs),
+        }
+
+    result = execute("""
+        SELECT bk.total_books, bk.copies_on_shelf,
+               ln.active_loans, ln.overdue_loans, ln.due_today,
+               cl.book_clubs
+        FROM (SELECT COUNT(*) AS total_books,
+                     COALESCE(SUM(copies_available), 0) AS copies_on_shelf
+              FROM books) bk,
+             (SELECT COUNT(*) AS active_loans,
+                     COUNT(*) FILTER (WHERE due_date < CURRENT_DATE) AS overdue_loans,
+                     COUNT(*) FILTER (WHERE due_date = CURRENT_DATE) AS due_today
+              FROM loans
+              WHERE return_date IS NULL) ln,
+             (SELECT COUNT(*) AS book_clubs FROM book_clubs) cl
+    """, fetch=True)
+    return dict(result[0]) if result else {}
 
 # ────────────────────── CLUBS ──────────────────────
+CLUBS_SQL = """
+    SELECT bc.club_id, bc.name, bc.description, COUNT(cm.member_id) AS member_count
+    FROM book_clubs bc
+    LEFT JOIN club_members cm ON bc.club_id = cm.club_id
+    GROUP BY bc.club_id
+"""
+
+
+@cache.cached("clubs")
+@_replica_fallback
 def get_all_clubs():
-    if not DB_CONNECTED:
-        return clubs[:]
-    return execute("""
-        SELECT bc.club_id, bc.name, bc.description, COUNT(cm.member_id) AS member_count
-        FROM book_clubs bc
-        LEFT JOIN club_members cm ON bc.club_id = cm.club_id
-        GROUP BY bc.club_id
-    """, fetch=True)
\ No newline at end of file
+    if not is_connected():
+        if OFFLINE:
+            return replica.get_all_clubs()
+        return [Club.from_dict(c) for c in demo.clubs.all()]
+    return execute(CLUBS_SQL, fetch=True, record=Club)
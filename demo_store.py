@@ -0,0 +1,253 @@
+# demo_store.py
+# DEMO-MODE STORAGE ENGINE – indexed in-memory tables + append-only log on disk
+#
+# Every write appends one JSON line to the log:
+#   {"t": "loans", "op": "put", "row": {...}}     insert or full-row update
+#   {"t": "loans", "op": "del", "id": 7}
+#   {"t": "loans", "op": "seq", "id": 7}          id allocator high-water mark
+# Opening the store replays the log; once it holds mostly superseded lines it is
+# compacted (rewritten as one put per live row) via a temp file + os.replace.
+import json
+import os
+import threading
+from collections import defaultdict
+
+from catalog_index import CatalogIndex
+
+COMPACT_MIN_ENTRIES = 1000   # never compact a log shorter than this
+COMPACT_RATIO = 2.0          # compact once log lines exceed live rows by this factor
+
+
+class Table:
+    """
+    Rows by primary key plus secondary indexes (column -> value -> {pk}), so
+    where(member_id=1, return_date=None) intersects two posting sets instead of
+    scanning every row. Same add/update/remove/get/all interface as CatalogIndex.
+    """
+
+    def __init__(self, key, indexes=()):
+        self.key = key
+        self._rows = {}
+        self._indexes = {column: defaultdict(set) for column in indexes}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, pk):
+        return pk in self._rows
+
+    def get(self, pk):
+        return self._rows.get(pk)
+
+    def all(self):
+        with self._lock:
+            return list(self._rows.values())
+
+    def where(self, **criteria):
+        """Rows matching every column=value pair, in primary key order (indexed columns only)."""
+        with self._lock:
+            return [self._rows[pk] for pk in sorted(self._match(criteria))]
+
+    def count(self, **criteria):
+        with self._lock:
+            return len(self._match(criteria))
+
+    def _match(self, criteria):
+        postings = sorted((self._indexes[column].get(value, ()) for column, value in criteria.items()), key=len)
+        if not postings:
+            return set(self._rows)
+        return set(postings[0]).intersection(*postings[1:])
+
+    # ────────────── write path ──────────────
+    def _index(self, pk, row):
+        for column, index in self._indexes.items():
+            index[row.get(column)].add(pk)
+
+    def _unindex(self, pk, row):
+        for column, index in self._indexes.items():
+            value = row.get(column)
+            pks = index.get(value)
+            if pks is not None:
+                pks.discard(pk)
+                if not pks:
+                    del index[value]
+
+    def add(self, row):
+        pk = row[self.key]
+        with self._lock:
+            if pk in self._rows:
+                self._unindex(pk, self._rows[pk])
+            self._rows[pk] = row
+            self._index(pk, row)
+        return row
+
+    def update(self, pk, **changes):
+        with self._lock:
+            row = self._rows.get(pk)
+            if row is None:
+                return None
+            self._unindex(pk, row)
+            row.update(changes)
+            self._index(pk, row)
+        return row
+
+    def remove(self, pk):
+        with self._lock:
+            row = self._rows.pop(pk, None)
+            if row is not None:
+                self._unindex(pk, row)
+        return row
+
+
+class DemoStore:
+    """
+    The demo tables behind one lock and one log file. Books live in a
+    CatalogIndex (trigram search); loans are indexed by member_id, book_id and
+    return_date (None = still open). Ids come from per-table allocators that
+    never hand out an id twice, even after deletes and restarts.
+    path=None keeps everything in memory. open() loads the log, or writes
+    `seed` when there is none yet.
+    """
+
+    def __init__(self, path=None, seed=None):
+        self.path = path
+        self.seed = seed or {}
+        self.books = CatalogIndex()
+        self.members = Table("member_id")
+        self.loans = Table("loan_id", indexes=("member_id", "book_id", "return_date"))
+        self.clubs = Table("club_id")
+        self.reminders = Table("key")     # idempotency keys of reminders already sent
+        self.holds = Table("hold_id", indexes=("book_id", "member_id", "status"))
+        # Recommender: co-borrowing matrix rows, top-K neighbour lists, watermark (row id 1)
+        self.book_cooccurrence = Table("book_id")
+        self.book_neighbors = Table("book_id")
+        self.recommender_state = Table("id")
+        self.tables = {"books": self.books, "members": self.members, "loans": self.loans, "clubs": self.clubs,
+                       "reminders": self.reminders, "holds": self.holds,
+                       "book_cooccurrence": self.book_cooccurrence, "book_neighbors": self.book_neighbors,
+                       "recommender_state": self.recommender_state}
+        self._keys = {"books": "book_id", "members": "member_id", "loans": "loan_id", "clubs": "club_id",
+                      "reminders": "key", "holds": "hold_id", "book_cooccurrence": "book_id",
+                      "book_neighbors": "book_id", "recommender_state": "id"}
+        self._last_id = dict.fromkeys(self.tables, 0)
+        self._log = None
+        self._entries = 0          # lines in the log file, live or superseded
+        self._opened = False
+        self.lock = threading.RLock()   # held by callers for multi-table read-modify-write
+
+    # ────────────── open / replay ──────────────
+    def open(self):
+        with self.lock:
+            if self._opened:
+                return self
+            self._opened = True
+            if self.path and os.path.exists(self.path):
+                self._replay()
+            if not self._entries:
+                for table, rows in self.seed.items():
+                    for row in rows:
+                        self._apply({"t": table, "op": "put", "row": dict(row)})
+            if self.path:
+                if not self._entries or self._should_compact():
+                    self.compact()
+                else:
+                    self._log = open(self.path, "a", encoding="utf-8")
+        return self
+
+    def _replay(self):
+        with open(self.path, encoding="utf-8") as f:
+            for n, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash mid-write; compaction drops it
+                    print(f"Demo store: skipping unreadable line {n} of {self.path}")
+                    continue
+                self._apply(record)
+                self._entries += 1
+
+    def _apply(self, record):
+        table, op = record["t"], record["op"]
+        if op == "put":
+            row = self.tables[table].add(record["row"])
+            self._bump(table, row[self._keys[table]])
+        elif op == "del":
+            self.tables[table].remove(record["id"])
+        elif op == "seq":
+            self._bump(table, record["id"])
+
+    def _bump(self, table, pk):
+        if isinstance(pk, int) and pk > self._last_id[table]:
+            self._last_id[table] = pk
+
+    # ────────────── writes ──────────────
+    def allocate(self, table):
+        """Next id for table; monotonic, never reused."""
+        with self.lock:
+            self._last_id[table] += 1
+            return self._last_id[table]
+
+    def add(self, table, row):
+        with self.lock:
+            row = self.tables[table].add(row)
+            self._bump(table, row[self._keys[table]])
+            self._write({"t": table, "op": "put", "row": row})
+        return row
+
+    def update(self, table, pk, **changes):
+        with self.lock:
+            row = self.tables[table].update(pk, **changes)
+            if row is not None:
+                self._write({"t": table, "op": "put", "row": row})
+        return row
+
+    def remove(self, table, pk):
+        with self.lock:
+            row = self.tables[table].remove(pk)
+            if row is not None:
+                self._write({"t": table, "op": "del", "id": pk})
+        return row
+
+    def _write(self, record):
+        if self._log is None:
+            return
+        self._log.write(json.dumps(record, default=str) + "\n")
+        self._log.flush()
+        self._entries += 1
+        if self._should_compact():
+            self.compact()
+
+    # ────────────── compaction ──────────────
+    def _live_rows(self):
+        return sum(len(t) for t in self.tables.values())
+
+    def _should_compact(self):
+        return self._entries > COMPACT_MIN_ENTRIES and self._entries > COMPACT_RATIO * self._live_rows()
+
+    def compact(self):
+        """Rewrite the log as one line per live row (plus allocator marks) and swap it in atomically."""
+        if not self.path:
+            return
+        with self.lock:
+            if self._log is not None:
+                self._log.close()
+            tmp = self.path + ".tmp"
+            entries = 0
+            with open(tmp, "w", encoding="utf-8") as f:
+                for table, rows in self.tables.items():
+                    f.write(json.dumps({"t": table, "op": "seq", "id": self._last_id[table]}) + "\n")
+                    for row in rows.all():
+                        f.write(json.dumps({"t": table, "op": "put", "row": row}, default=str) + "\n")
+                    entries += len(rows) + 1
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self._entries = entries
+            self._log = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        with self.lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
@@ -0,0 +1,208 @@
+# gui_trace.py
+# GUI RESPONSIVENESS TRACER – slot timings, event-loop stalls, Chrome trace JSON (opt-in)
+#
+#   SMARTLIB_GUI_TRACE=trace.json python main.py           # then open trace.json in
+#   SMARTLIB_GUI_TRACE=trace.json SMARTLIB_GUI_STALL_MS=30  # chrome://tracing or ui.perfetto.dev
+#
+# Off unless SMARTLIB_GUI_TRACE is set. When on, make_application() returns a
+# QApplication whose notify() times every event delivery, the dashboard slots in
+# TRACED_SLOTS are wrapped at class level (so connections made in __init__ see the
+# wrapper), and a heartbeat timer on the GUI thread records every gap longer than
+# the stall threshold. Each slot span carries the rows its view shows afterwards.
+import atexit
+import functools
+import importlib
+import inspect
+import json
+import os
+import threading
+import time
+
+from PyQt5.QtCore import QEvent, QTimer
+from PyQt5.QtWidgets import QApplication
+
+TRACE_PATH = os.environ.get("SMARTLIB_GUI_TRACE", "")
+STALL_MS = float(os.environ.get("SMARTLIB_GUI_STALL_MS", "50"))   # gaps / deliveries longer than this are recorded
+HEARTBEAT_MS = 10
+MAX_EVENTS = 200000      # the trace stops growing here (a long session shouldn't eat memory)
+STALL_TID = 0            # trace row the stalls are drawn on
+
+# class -> {slot name: attribute of the view whose rows are counted afterwards (or None)}
+TRACED_SLOTS = {
+    "dashboard_librarian.LibrarianDashboard": {
+        "load_books": None, "show_books": "book_model", "load_loans": "loans_table",
+        "return_selected": "loans_table", "load_clubs": "clubs_table", "show_stats": None, "apply_change": None,
+    },
+    "dashboard_member.MemberDashboard": {
+        "refresh_all": None, "refresh_catalog": None, "show_catalog": "book_model", "borrow_book": None,
+        "place_hold": None, "refresh_my_loans": "loans_table", "refresh_my_holds": "holds_table",
+        "refresh_recommendations": "recommended_list", "apply_change": None,
+    },
+    # Worker-thread side of the debounced searches, so waits show up next to the GUI thread
+    "search_worker._SearchTask": {"run": None},
+}
+
+_EVENT_NAMES = {v: k for k, v in vars(QEvent).items() if isinstance(v, QEvent.Type)}
+
+
+def _rows(view):
+    if view is None:
+        return None
+    return view.rowCount() if hasattr(view, "rowCount") else view.count()
+
+
+class Tracer:
+    """Collects Chrome trace "complete" events (ph X, µs) and writes them as one JSON file."""
+
+    def __init__(self, path, stall_ms=STALL_MS):
+        self.path = path
+        self.stall = stall_ms / 1000.0
+        self.pid = os.getpid()
+        self.origin = time.perf_counter()
+        self.events = []
+        self.dropped = 0
+        self.active = []         # GUI-thread slot stack (names), for labelling stalls
+        self.since_beat = []     # slots finished since the last heartbeat
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._heartbeat = None
+        self._saved = False
+
+    def _us(self, t):
+        return round((t - self.origin) * 1e6, 1)
+
+    def span(self, name, cat, started, ended, args=None, tid=None):
+        if tid is None:
+            tid = threading.get_ident()
+            if tid not in self._threads:
+                with self._lock:
+                    self._threads[tid] = threading.current_thread().name
+        if len(self.events) >= MAX_EVENTS:
+            self.dropped += 1
+            return
+        event = {"name": name, "cat": cat, "ph": "X", "pid": self.pid, "tid": tid,
+                 "ts": self._us(started), "dur": round((ended - started) * 1e6, 1)}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    # ────────────── slots ──────────────
+    def wrap(self, fn, label, view_attr):
+        gui_thread = threading.main_thread()
+        # A signal may carry more arguments than the slot takes (clicked(bool) → load_loans(self));
+        # PyQt drops the extras for the real method but can't see through *args, so do it here
+        params = list(inspect.signature(fn).parameters.values())[1:]
+        if any(p.kind is p.VAR_POSITIONAL for p in params):
+            accepts = None
+        else:
+            accepts = sum(p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD) for p in params)
+
+        @functools.wraps(fn)
+        def traced(obj, *args, **kwargs):
+            if accepts is not None:
+                args = args[:accepts]
+            on_gui = threading.current_thread() is gui_thread
+            if on_gui:
+                self.active.append(label)
+            started = time.perf_counter()
+            try:
+                return fn(obj, *args, **kwargs)
+            finally:
+                ended = time.perf_counter()
+                if on_gui:
+                    self.active.pop()
+                    self.since_beat.append(label)
+                rows = _rows(getattr(obj, view_attr, None)) if view_attr else None
+                self.span(label, "slot", started, ended, {"rows": rows} if rows is not None else None)
+        return traced
+
+    def instrument(self, slots=TRACED_SLOTS):
+        """Replace the listed methods on their classes with traced wrappers (before any window exists)."""
+        for path, names in slots.items():
+            module_name, class_name = path.rsplit(".", 1)
+            cls = getattr(importlib.import_module(module_name), class_name)
+            for name, view_attr in names.items():
+                fn = getattr(cls, name, None)
+                if fn is None:
+                    continue
+                if getattr(fn, "_gui_traced", False):
+                    continue
+                traced = self.wrap(fn, f"{class_name}.{name}", view_attr)
+                traced._gui_traced = True
+                setattr(cls, name, traced)
+
+    # ────────────── event loop ──────────────
+    def start_heartbeat(self, interval_ms=HEARTBEAT_MS):
+        last = [time.perf_counter()]
+        expected = interval_ms / 1000.0
+
+        def beat():
+            now = time.perf_counter()
+            blocked = now - last[0] - expected
+            if blocked >= self.stall:
+                self.span("event loop stalled", "stall", now - blocked, now,
+                          {"ms": round(blocked * 1000, 1), "during": self.since_beat[-10:] or list(self.active)},
+                          tid=STALL_TID)
+            self.since_beat = []
+            last[0] = now
+
+        self._heartbeat = QTimer()
+        self._heartbeat.timeout.connect(beat)
+        self._heartbeat.start(interval_ms)
+
+    # ────────────── output ──────────────
+    def save(self, path=None):
+        path = path or self.path
+        metadata = [{"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": "SmartLibrary"}},
+                    {"name": "thread_name", "ph": "M", "pid": self.pid, "tid": STALL_TID,
+                     "args": {"name": "event-loop stalls"}}]
+        with self._lock:
+            metadata += [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+                         for tid, name in self._threads.items()]
+        trace = {"traceEvents": metadata + list(self.events), "displayTimeUnit": "ms",
+                 "otherData": {"stall_ms": self.stall * 1000, "dropped_events": self.dropped}}
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(trace, f)
+        os.replace(tmp, path)
+        self._saved = True
+        print(f"GUI trace: {len(self.events)} events written to {path}")
+        return path
+
+    def save_at_exit(self):
+        # Covers sys.exit() paths that never emit aboutToQuit
+        if not self._saved and self.events:
+            self.save()
+
+
+class TracingApplication(QApplication):
+    """QApplication that records event deliveries slower than the tracer's stall threshold."""
+
+    def __init__(self, argv, tracer):
+        super().__init__(argv)
+        self.tracer = tracer
+
+    def notify(self, receiver, event):
+        started = time.perf_counter()
+        try:
+            return super().notify(receiver, event)
+        finally:
+            ended = time.perf_counter()
+            if ended - started >= self.tracer.stall:
+                kind = _EVENT_NAMES.get(event.type(), str(int(event.type())))
+                self.tracer.span(f"{type(receiver).__name__} {kind}", "event", started, ended,
+                                 {"object": receiver.objectName() or None})
+
+
+def make_application(argv, path=TRACE_PATH, stall_ms=STALL_MS):
+    """A plain QApplication, or a traced one when SMARTLIB_GUI_TRACE (path) is set."""
+    if not path:
+        return QApplication(argv)
+    tracer = Tracer(path, stall_ms)
+    tracer.instrument()
+    app = TracingApplication(argv, tracer)
+    tracer.start_heartbeat()
+    app.aboutToQuit.connect(tracer.save)
+    atexit.register(tracer.save_at_exit)
+    print(f"GUI tracing on → {path} (stalls ≥ {stall_ms:g} ms)")
+    return app
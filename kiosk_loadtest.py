@@ -0,0 +1,196 @@
+# kiosk_loadtest.py
+# KIOSK LOAD TEST – many simulated kiosks hammering kiosk_service.py over keep-alive HTTP
+#
+#   python kiosk_loadtest.py                                   # in-process service, demo data
+#   python kiosk_loadtest.py --books 100000 --kiosks 64 --seconds 20 --out kiosk.json
+#   python kiosk_loadtest.py --url http://10.0.0.5:8080 --token s3cr3t \
+#       --username reader@example.com --password ...                # a running service
+#
+# Each kiosk thread holds one connection and loops over a weighted mix: catalog
+# searches and page browses, re-polls of a page it has seen (If-None-Match, so an
+# unchanged page answers 304), the signed-in member's loans, clubs and — with
+# --writes — a checkout followed by returning that loan. Each kiosk logs in once
+# (--username/--password, the demo member by default) and sends its session
+# token. The report has requests/second and p50/p95/p99 per request kind, in the
+# same shape as benchmark.py's results.
+import argparse
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import quote, urlsplit
+
+import benchmark    # sets the demo/replica env defaults before database is imported
+import database
+import kiosk_service
+
+KIOSKS = 16
+SECONDS = 10.0
+MIX = {"search": 40, "browse": 20, "revalidate": 25, "my_loans": 10, "clubs": 5}
+USERNAME = "john@example.com"   # demo-mode member
+PASSWORD = "123"
+
+
+class Kiosk:
+    """One terminal: a keep-alive connection plus the ETags of the pages it has fetched."""
+
+    def __init__(self, host, port, token, rng):
+        self.conn = http.client.HTTPConnection(host, port, timeout=30)
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self.rng = rng
+        self.etags = {}
+
+    def login(self, username, password):
+        status, payload = self.request("POST", "/login", {"username": username, "password": password})
+        if status != 200:
+            raise RuntimeError(f"kiosk login as {username} failed: {status} {payload}")
+        self.headers["X-Session-Token"] = payload["token"]
+
+    def request(self, method, path, body=None, headers=None):
+        payload = json.dumps(body).encode() if body is not None else None
+        all_headers = {**self.headers, **(headers or {})}
+        if payload is not None:
+            all_headers["Content-Type"] = "application/json"
+        for attempt in range(2):
+            try:
+                self.conn.request(method, path, payload, all_headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                self.conn.close()   # server dropped the keep-alive connection — reconnect once
+                if attempt:
+                    raise
+        if response.getheader("ETag"):
+            self.etags[path] = response.getheader("ETag")
+        return response.status, json.loads(data) if data else None
+
+    def catalog_page(self, path):
+        return self.request("GET", path)
+
+    def revalidate(self):
+        if not self.etags:
+            return self.request("GET", "/books")
+        path = self.rng.choice(list(self.etags))
+        return self.request("GET", path, headers={"If-None-Match": self.etags[path]})
+
+
+def _search_term(rng):
+    return rng.choice(benchmark.ADJECTIVES + benchmark.NOUNS)[:rng.randint(3, 6)]
+
+
+def kiosk_loop(kiosk, deadline, writes, timings, statuses):
+    rng = kiosk.rng
+    kinds, weights = zip(*({**MIX, "checkout": writes} if writes else MIX).items())
+    while time.perf_counter() < deadline:
+        kind = rng.choices(kinds, weights)[0]
+        started = time.perf_counter()
+        if kind == "search":
+            status, _ = kiosk.catalog_page(f"/books?q={quote(_search_term(rng))}&limit=20")
+        elif kind == "browse":
+            status, _ = kiosk.catalog_page(f"/books?limit=50&offset={50 * rng.randrange(20)}")
+        elif kind == "revalidate":
+            status, _ = kiosk.revalidate()
+        elif kind == "my_loans":
+            status, _ = kiosk.request("GET", "/me/loans")
+        elif kind == "clubs":
+            status, _ = kiosk.request("GET", "/clubs")
+        else:
+            status, payload = kiosk.request("GET", f"/books?limit=20&offset={20 * rng.randrange(10)}")
+            available = [b["book_id"] for b in payload["books"] if b["copies_available"]] if status == 200 else []
+            if available:
+                status, _ = kiosk.request("POST", "/loans", {"book_id": rng.choice(available)})
+                if status == 201:
+                    _, loans = kiosk.request("GET", "/me/loans")
+                    if loans["loans"]:
+                        kiosk.request("POST", f"/loans/{loans['loans'][-1]['loan_id']}/return")
+        timings[kind].append(time.perf_counter() - started)
+        statuses[status] += 1
+
+
+def run(url, token, kiosks, seconds, writes, username=USERNAME, password=PASSWORD, seed=benchmark.SEED):
+    parts = urlsplit(url)
+    timings = defaultdict(list)   # list.append is atomic, so the threads share these
+    statuses = Counter()
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(i):
+        kiosk = Kiosk(parts.hostname, parts.port or 80, token, random.Random(seed + i))
+        local = Counter()
+        try:
+            kiosk.login(username, password)
+            kiosk_loop(kiosk, deadline, writes, timings, local)
+        finally:
+            kiosk.conn.close()
+            with lock:
+                statuses.update(local)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,), name=f"kiosk-{i}") for i in range(kiosks)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    total = sum(len(v) for v in timings.values())
+    return {
+        "requests": total,
+        "seconds": round(elapsed, 2),
+        "requests_per_second": round(total / elapsed, 1),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "not_modified_ratio": round(statuses[304] / max(1, len(timings["revalidate"])), 3),
+        "results": {kind: benchmark.summarize(samples) for kind, samples in sorted(timings.items())},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the kiosk HTTP service")
+    parser.add_argument("--url", help="service to test (default: start one in this process)")
+    parser.add_argument("--token", default=kiosk_service.TOKEN)
+    parser.add_argument("--kiosks", type=int, default=KIOSKS, help="concurrent kiosk connections")
+    parser.add_argument("--seconds", type=float, default=SECONDS)
+    parser.add_argument("--writes", type=int, default=0, help="weight of checkout+return rounds in the mix (0 = read only)")
+    parser.add_argument("--books", type=int, default=10000, help="synthetic library for the in-process service")
+    parser.add_argument("--members", type=int, default=2000)
+    parser.add_argument("--loans", type=int, default=20000)
+    parser.add_argument("--postgres", action="store_true", help="in-process service on the configured PostgreSQL (loads data!)")
+    parser.add_argument("--username", default=USERNAME, help="member account every kiosk signs in as")
+    parser.add_argument("--password", default=PASSWORD)
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        url, mode = args.url, "remote"
+    else:
+        if not args.postgres:
+            database.DB_CONNECTED = False   # demo mode, as in benchmark.py
+            database.demo.open()
+        elif not database.is_connected():
+            raise SystemExit("--postgres: no database reachable with the SMARTLIB_DB_* settings")
+        _, member_ids = benchmark.load_library(args.books, args.members, args.loans)
+        server = kiosk_service.serve_in_background(token=args.token)
+        host, port = server.server_address[:2]
+        url, mode = f"http://{host}:{port}", "postgres" if args.postgres else "demo"
+        print(f"Loaded {args.books} books, {len(member_ids)} members; service on {url}")
+
+    report = run(url, args.token, args.kiosks, args.seconds, args.writes, args.username, args.password)
+    report = {"meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "mode": mode, "url": url,
+                       "kiosks": args.kiosks, "writes": args.writes}, **report}
+    if not args.url:
+        report["cache"] = {k: v for k, v in database.cache.stats().items() if k != "by_function"}
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print("Report written to", args.out)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
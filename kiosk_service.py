@@ -0,0 +1,323 @@
+# kiosk_service.py
+# KIOSK SERVICE – the data layer over HTTP/JSON for self-checkout kiosks and OPAC terminals
+#
+#   python kiosk_service.py                                         # http://127.0.0.1:8080
+#   python kiosk_service.py --host 0.0.0.0 --port 9000 --token s3cr3t  # network: token required,
+#                                                                      # kiosks send "Authorization: Bearer s3cr3t"
+#   GET  /health
+#   GET  /books?q=orwell&limit=50&offset=0     catalog page; ETag + If-None-Match → 304
+#   GET  /clubs
+#   POST /login                                {"username": "...", "password": "..."} → session token
+#   --- the rest need X-Session-Token: <token>; the member is the session's, never the request's
+#   GET  /me/loans
+#   POST /loans                                {"book_id": 1}  (librarian sessions may add "member_id")
+#   POST /loans/<loan_id>/return               own loans only (librarians: any)
+#   POST /logout
+#
+# One process, one connection pool (database.py) and one query cache shared by
+# every kiosk: requests are handled on threads that borrow pooled connections,
+# so terminals need neither a desktop install nor their own database login.
+# Catalog pages carry an ETag of their body; a kiosk re-polling an unchanged page
+# gets 304 Not Modified with no body. The server subscribes to the change feed,
+# so loans, returns and holds made from the desktop apps invalidate the cache
+# (and with it the ETags) as they happen rather than after the cache TTL. Demo mode and the offline replica work as
+# in the desktop app.
+import argparse
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import re
+import socket
+import sys
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import auth
+import database
+from database import LoanResult
+
+HOST = "127.0.0.1"      # listening beyond loopback requires a kiosk token (see main)
+PORT = 8080
+TOKEN = os.environ.get("SMARTLIB_KIOSK_TOKEN", "")   # empty = no Authorization header required
+MAX_PAGE = 200          # largest catalog page a kiosk may ask for
+MAX_BODY = 64 * 1024    # bytes accepted in a POST body
+
+LOAN_STATUS = {
+    LoanResult.SUCCESS: HTTPStatus.CREATED,
+    LoanResult.NO_COPIES: HTTPStatus.CONFLICT,
+    LoanResult.LIMIT_REACHED: HTTPStatus.CONFLICT,
+    LoanResult.ERROR: HTTPStatus.SERVICE_UNAVAILABLE,
+}
+LOGIN_STATUS = {
+    auth.LoginResult.SUCCESS: HTTPStatus.OK,
+    auth.LoginResult.INVALID: HTTPStatus.UNAUTHORIZED,
+    auth.LoginResult.LOCKED: HTTPStatus.TOO_MANY_REQUESTS,
+    auth.LoginResult.ERROR: HTTPStatus.SERVICE_UNAVAILABLE,
+}
+RETURN_STATUS = {"returned": HTTPStatus.OK, "not_found": HTTPStatus.NOT_FOUND, "error": HTTPStatus.SERVICE_UNAVAILABLE}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _as_json(value):
+    if isinstance(value, list):
+        return [_as_json(v) for v in value]
+    return value.as_dict() if hasattr(value, "as_dict") else value
+
+
+def _int(value, name, minimum=0, maximum=None):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} must be an integer")
+    if number < minimum or (maximum is not None and number > maximum):
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} must be between {minimum} and {maximum or '∞'}")
+    return number
+
+
+def etag_of(body):
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+# ────────────────────── ENDPOINTS ──────────────────────
+# Each returns (status, payload); the payload is sent as JSON.
+def health(query, body):
+    mode = "offline" if database.OFFLINE else "postgres" if database.is_connected() else "demo"
+    return HTTPStatus.OK, {"status": "ok", "mode": mode}
+
+
+def books(query, body):
+    search = query.get("q", [""])[0]
+    limit = _int(query.get("limit", [database.CATALOG_PAGE_SIZE])[0], "limit", 1, MAX_PAGE)
+    offset = _int(query.get("offset", [0])[0], "offset")
+    return HTTPStatus.OK, {"q": search, "limit": limit, "offset": offset,
+                           "books": database.get_all_books(search, limit, offset)}
+
+
+def _is_librarian(session):
+    return session.get("role") == "Librarian"
+
+
+def _session_member(session):
+    if session.get("member_id") is None:
+        raise ApiError(HTTPStatus.FORBIDDEN, "not a member account")
+    return session["member_id"]
+
+
+def checkout(query, body, session):
+    book_id = _int(body.get("book_id"), "book_id", 1)
+    if _is_librarian(session) and body.get("member_id") is not None:
+        member_id = _int(body["member_id"], "member_id", 1)   # staff desk checking out for a patron
+    else:
+        member_id = _session_member(session)
+    result = database.issue_loan(book_id, member_id)
+    return LOAN_STATUS[result], {"book_id": book_id, "member_id": member_id, "status": result.value}
+
+
+def return_book(query, body, loan_id, session):
+    if not _is_librarian(session):
+        loan = database.get_active_loan(loan_id)
+        if loan is None or loan.member_id != _session_member(session):
+            # Same answer as a loan that doesn't exist: ids of other members' loans aren't confirmed
+            return HTTPStatus.NOT_FOUND, {"loan_id": loan_id, "status": "not_found"}
+    result = database.return_loans([loan_id])[0]
+    return RETURN_STATUS[result["status"]], result
+
+
+def clubs(query, body):
+    return HTTPStatus.OK, {"clubs": database.get_all_clubs()}
+
+
+def login(query, body):
+    username, password = body.get("username"), body.get("password")
+    if not isinstance(username, str) or not isinstance(password, str):
+        raise ApiError(HTTPStatus.BAD_REQUEST, "username and password are required")
+    result, user = auth.login(username, password)
+    if not result:
+        return LOGIN_STATUS[result], {"status": result.value,
+                                      "retry_after": round(auth.limiter.retry_after(username)) or None}
+    return HTTPStatus.OK, {"status": result.value, **user}
+
+
+def my_loans(query, body, session):
+    member_id = _session_member(session)
+    return HTTPStatus.OK, {"member_id": member_id, "loans": database.get_member_loans(member_id)}
+
+
+def logout(query, body, session):
+    auth.logout(session["token"])
+    return HTTPStatus.OK, {"status": "logged_out"}
+
+
+# (method, path pattern, handler, conditional GET) — path groups are passed as ints;
+# handlers in SESSION_ROUTES also get the X-Session-Token user (from auth's session cache)
+SESSION_ROUTES = {my_loans, checkout, return_book, logout}
+ROUTES = [
+    ("GET", re.compile(r"/health"), health, False),
+    ("GET", re.compile(r"/books"), books, True),
+    ("POST", re.compile(r"/loans"), checkout, False),
+    ("POST", re.compile(r"/loans/(\d+)/return"), return_book, False),
+    ("GET", re.compile(r"/clubs"), clubs, False),
+    ("POST", re.compile(r"/login"), login, False),
+    ("GET", re.compile(r"/me/loans"), my_loans, False),
+    ("POST", re.compile(r"/logout"), logout, False),
+]
+
+
+# ────────────────────── HTTP ──────────────────────
+class KioskHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive: a kiosk reuses one connection
+    disable_nagle_algorithm = True  # headers and body are separate writes; don't let the body wait for an ACK
+    server_version = "SmartLibraryKiosk/1.0"
+    token = TOKEN
+    verbose = False
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        try:
+            raw = self._read_raw() if method == "POST" else b""   # always drained, so keep-alive stays in sync
+            if self.token and not hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {self.token}"):
+                raise ApiError(HTTPStatus.UNAUTHORIZED, "missing or wrong kiosk token")
+            body = self._parse_body(raw) if method == "POST" else {}
+            for route_method, pattern, handler, conditional in ROUTES:
+                match = pattern.fullmatch(url.path.rstrip("/") or "/")
+                if match and route_method == method:
+                    args = list(map(int, match.groups()))
+                    if handler in SESSION_ROUTES:
+                        args.append(self._session())
+                    status, payload = handler(parse_qs(url.query), body, *args)
+                    self._send(status, payload, conditional)
+                    return
+                if match:
+                    raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} not allowed on {url.path}")
+            raise ApiError(HTTPStatus.NOT_FOUND, f"no such endpoint: {url.path}")
+        except ApiError as e:
+            self._send(e.status, {"error": str(e)})
+        except Exception as e:
+            print("Kiosk request failed:", method, self.path, e)
+            self._send(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "internal error"})
+
+    def _session(self):
+        token = self.headers.get("X-Session-Token", "")
+        user = auth.session(token)
+        if user is None:
+            raise ApiError(HTTPStatus.UNAUTHORIZED, "missing or expired session")
+        return {**user, "token": token}
+
+    def _read_raw(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if not 0 <= length <= MAX_BODY:
+            self.close_connection = True   # the body is not read, so the connection can't be reused
+            raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE if length > MAX_BODY else HTTPStatus.BAD_REQUEST,
+                           f"Content-Length must be between 0 and {MAX_BODY}")
+        return self.rfile.read(length) if length else b"{}"
+
+    @staticmethod
+    def _parse_body(raw):
+        try:
+            body = json.loads(raw)
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "body must be JSON")
+        if not isinstance(body, dict):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "body must be a JSON object")
+        return body
+
+    def _send(self, status, payload, conditional=False):
+        body = json.dumps({k: _as_json(v) for k, v in payload.items()}, default=str).encode()
+        headers = {"Content-Type": "application/json"}
+        if self.close_connection:
+            headers["Connection"] = "close"
+        if conditional and status == HTTPStatus.OK:
+            tag = etag_of(body)
+            headers.update({"ETag": tag, "Cache-Control": "no-cache"})
+            if tag in (t.strip() for t in self.headers.get("If-None-Match", "").split(",")):
+                status, body = HTTPStatus.NOT_MODIFIED, b""
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if status != HTTPStatus.NOT_MODIFIED:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+def _loopback(host):
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+def make_server(host=HOST, port=PORT, token=TOKEN, verbose=False):
+    """
+    A ThreadingHTTPServer serving the kiosk API (port 0 picks a free port); call
+    serve_forever(). Refuses a non-loopback host without a kiosk token.
+    """
+    if not token and not _loopback(host):
+        raise ValueError(f"refusing to serve on {host} without a kiosk token (--token or SMARTLIB_KIOSK_TOKEN)")
+    # Starts the PostgreSQL LISTEN connection; its events reach database.cache through
+    # database._invalidate_for_change, which is all the service needs from them
+    server_changes = database.subscribe_changes(lambda event: None)
+    handler = type("Handler", (KioskHandler,), {"token": token, "verbose": verbose})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.unsubscribe_changes = server_changes
+    return server
+
+
+def serve_in_background(host="127.0.0.1", port=0, token=TOKEN):
+    """Start a server on a daemon thread (tests, load tests); returns it — server.server_address has the port."""
+    server = make_server(host, port, token)
+    threading.Thread(target=server.serve_forever, name="kiosk-http", daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the library data layer to kiosks over HTTP/JSON")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--token", default=TOKEN, help="require 'Authorization: Bearer <token>' (or SMARTLIB_KIOSK_TOKEN)")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    database.connect()
+    try:
+        server = make_server(args.host, args.port, args.token, args.verbose)
+    except ValueError as e:
+        sys.exit(str(e))
+    host, port = server.server_address[:2]
+    print(f"Kiosk service on http://{host}:{port}" + (" (token required)" if args.token else ""))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.unsubscribe_changes()
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,24 @@
+# live_updates.py
+# Qt side of the change feed — delivers data-layer row changes to the GUI thread
+from PyQt5.QtCore import Qt, QObject, pyqtSignal
+
+
+class LiveUpdates(QObject):
+    """
+    Subscribes to the data-layer change feed and re-emits each event as `changed`.
+    Delivery is always queued: events from the listener thread land on the GUI
+    thread, and demo-mode events published inside a slot (e.g. a Return button)
+    are handled after that slot returns. Call stop() when the window closes.
+    """
+    changed = pyqtSignal(dict)
+    _received = pyqtSignal(dict)
+
+    def __init__(self, subscribe, parent=None):
+        super().__init__(parent)
+        self._received.connect(self.changed, Qt.QueuedConnection)
+        self._unsubscribe = subscribe(self._received.emit)
+
+    def stop(self):
+        if self._unsubscribe:
+            self._unsubscribe()
+            self._unsubscribe = None
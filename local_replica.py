@@ -0,0 +1,279 @@
+# local_replica.py
+# OFFLINE-FIRST LOCAL REPLICA – SQLite copy of the catalog, open loans and clubs,
+# plus a durable journal of writes made while PostgreSQL was unreachable.
+#
+# database.py keeps the replica fresh while online (snapshot after connecting and
+# every REPLICA_SYNC_INTERVAL), serves reads from it when the connection drops,
+# queues add_book / issue_loan / return_loan here, and replays the journal with
+# conflict detection once PostgreSQL is back (database.sync_offline_writes()).
+import hashlib
+import hmac
+import json
+import secrets
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+
+import passwords
+from records import Book, Club, Loan
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    book_id INTEGER PRIMARY KEY, title TEXT, author_name TEXT, isbn TEXT,
+    genre TEXT, published_year INTEGER, copies_available INTEGER
+);
+CREATE TABLE IF NOT EXISTS members (
+    member_id INTEGER PRIMARY KEY, full_name TEXT, email TEXT
+);
+CREATE TABLE IF NOT EXISTS loans (
+    loan_id INTEGER PRIMARY KEY, book_id INTEGER, member_id INTEGER, title TEXT,
+    loan_date TEXT, due_date TEXT, return_date TEXT
+);
+CREATE INDEX IF NOT EXISTS loans_open_member ON loans (member_id) WHERE return_date IS NULL;
+CREATE TABLE IF NOT EXISTS clubs (
+    club_id INTEGER PRIMARY KEY, name TEXT, description TEXT, member_count INTEGER
+);
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY, role TEXT, member_id INTEGER, salt BLOB, pw_hash BLOB   -- salt: PBKDF2 rows only
+);
+CREATE TABLE IF NOT EXISTS journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT, op TEXT NOT NULL, args TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending', detail TEXT, queued_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS id_map (
+    kind TEXT, temp_id INTEGER, real_id INTEGER, PRIMARY KEY (kind, temp_id)
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+PBKDF2_ROUNDS = 200_000
+
+
+def _like(search):
+    escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+class LocalReplica:
+    """
+    One SQLite file shared by all threads of the app (guarded by a lock).
+    Rows created offline get negative temporary ids; the journal replay maps
+    them to the real PostgreSQL ids (id_map) so later queued writes still apply.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")    # the journal must survive a power cut
+        self._db.executescript(SCHEMA)
+
+    def _rows(self, sql, params=()):
+        with self._lock:
+            return [dict(r) for r in self._db.execute(sql, params).fetchall()]
+
+    def _records(self, cls, sql, params=()):
+        with self._lock:
+            cur = self._db.execute(sql, params)
+            make = cls.row_factory([column[0] for column in cur.description])
+            return [make(tuple(r)) for r in cur.fetchall()]
+
+    def _transaction(self):
+        return _Transaction(self)
+
+    # ────────────── snapshot (online → replica) ──────────────
+    def has_snapshot(self):
+        return bool(self._rows("SELECT 1 FROM meta WHERE key = 'synced_at'"))
+
+    def synced_at(self):
+        rows = self._rows("SELECT value FROM meta WHERE key = 'synced_at'")
+        return rows[0]["value"] if rows else None
+
+    def replica_id(self):
+        """Random id of this replica file; with a journal seq it names one offline write in PostgreSQL."""
+        with self._transaction() as db:
+            row = db.execute("SELECT value FROM meta WHERE key = 'replica_id'").fetchone()
+            if row is not None:
+                return row["value"]
+            value = secrets.token_hex(16)
+            db.execute("INSERT INTO meta VALUES ('replica_id', ?)", (value,))
+            return value
+
+    def load_snapshot(self, books, members, loans, clubs):
+        """Replace the local copy in one transaction; books may be a lazy iterator."""
+        with self._transaction() as db:
+            for table in ("books", "members", "loans", "clubs"):
+                db.execute(f"DELETE FROM {table}")
+            db.executemany("INSERT INTO books VALUES (:book_id, :title, :author_name, :isbn, :genre, "
+                           ":published_year, :copies_available)", books)
+            db.executemany("INSERT INTO members VALUES (:member_id, :full_name, :email)", members)
+            db.executemany("INSERT INTO loans VALUES (:loan_id, :book_id, :member_id, :title, "
+                           ":loan_date, :due_date, NULL)",
+                           ({**l, "loan_date": str(l["loan_date"]), "due_date": str(l["due_date"])} for l in loans))
+            db.executemany("INSERT INTO clubs VALUES (:club_id, :name, :description, :member_count)", clubs)
+            db.execute("DELETE FROM id_map")
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('synced_at', ?)", (datetime.now().isoformat(timespec="seconds"),))
+
+    # ────────────── offline login ──────────────
+    def remember_login(self, username, pw_hash, user):
+        """Store the server's scrypt hash (passwords.py) after a successful online login (never the password)."""
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO users VALUES (?, ?, ?, NULL, ?)",
+                             (username, user.get("role"), user.get("member_id"), pw_hash))
+
+    def authenticate(self, username, password):
+        rows = self._rows("SELECT * FROM users WHERE username = ?", (username,))
+        if not rows:
+            return None
+        u = rows[0]
+        if u["salt"] is not None:
+            # Stored by an older version: salted PBKDF2 of the password
+            candidate = hashlib.pbkdf2_hmac("sha256", password.encode(), u["salt"], PBKDF2_ROUNDS)
+            if not hmac.compare_digest(candidate, u["pw_hash"]):
+                return None
+        elif not (passwords.is_hashed(u["pw_hash"]) and passwords.verify_password(password, u["pw_hash"])):
+            return None
+        return {"username": u["username"], "role": u["role"], "member_id": u["member_id"]}
+
+    # ────────────── reads (same shapes as database.py) ──────────────
+    def get_all_books(self, search="", limit=None, offset=0):
+        sql = "SELECT * FROM books"
+        params = []
+        search = (search or "").strip()
+        if search:
+            sql += (" WHERE title LIKE ? ESCAPE '\\' OR author_name LIKE ? ESCAPE '\\'"
+                    " OR genre LIKE ? ESCAPE '\\' OR isbn LIKE ? ESCAPE '\\'")
+            params = [_like(search)] * 4
+        sql += " ORDER BY book_id LIMIT ? OFFSET ?"
+        return self._records(Book, sql, params + [-1 if limit is None else limit, offset])
+
+    def get_member_loans(self, member_id):
+        return self._records(Loan, """
+            SELECT loan_id, title, loan_date, due_date FROM loans
+            WHERE member_id = ? AND return_date IS NULL ORDER BY loan_id
+        """, (member_id,))
+
+    def get_active_loans(self):
+        return self._records(Loan, """
+            SELECT l.loan_id, l.title AS book_title, m.full_name AS member_name, l.loan_date, l.due_date,
+                   l.book_id, l.member_id, l.return_date
+            FROM loans l LEFT JOIN members m ON m.member_id = l.member_id
+            WHERE l.return_date IS NULL ORDER BY l.loan_id
+        """)
+
+    def get_active_loans_by_id(self, loan_ids):
+        return self._records(Loan, f"""
+            SELECT l.loan_id, l.title AS book_title, m.full_name AS member_name, l.loan_date, l.due_date,
+                   l.book_id, l.member_id, l.return_date
+            FROM loans l LEFT JOIN members m ON m.member_id = l.member_id
+            WHERE l.loan_id IN ({", ".join("?" * len(loan_ids))}) AND l.return_date IS NULL ORDER BY l.loan_id
+        """, tuple(loan_ids))
+
+    def get_all_clubs(self):
+        return self._records(Club, "SELECT * FROM clubs ORDER BY club_id")
+
+    def get_dashboard_stats(self):
+        today = str(date.today())
+        return self._rows("""
+            SELECT (SELECT COUNT(*) FROM books) AS total_books,
+                   (SELECT COALESCE(SUM(copies_available), 0) FROM books) AS copies_on_shelf,
+                   COUNT(*) AS active_loans,
+                   COALESCE(SUM(due_date < ?), 0) AS overdue_loans,
+                   COALESCE(SUM(due_date = ?), 0) AS due_today,
+                   (SELECT COUNT(*) FROM clubs) AS book_clubs
+            FROM loans WHERE return_date IS NULL
+        """, (today, today))[0]
+
+    # ────────────── offline writes: apply locally + journal ──────────────
+    def _queue(self, db, op, args):
+        db.execute("INSERT INTO journal (op, args, queued_at) VALUES (?, ?, ?)",
+                   (op, json.dumps(args), datetime.now().isoformat(timespec="seconds")))
+
+    @staticmethod
+    def _temp_id(db, table, column):
+        return min(0, db.execute(f"SELECT COALESCE(MIN({column}), 0) FROM {table}").fetchone()[0]) - 1
+
+    def add_book(self, title, author_name, isbn="", genre="", year=2025, copies=1):
+        with self._transaction() as db:
+            book_id = self._temp_id(db, "books", "book_id")
+            db.execute("INSERT INTO books VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (book_id, title, author_name, isbn, genre, year, copies))
+            self._queue(db, "add_book", {"temp_id": book_id, "title": title, "author_name": author_name,
+                                         "isbn": isbn, "genre": genre, "year": year, "copies": copies})
+        return book_id
+
+    def issue_loan(self, book_id, member_id, max_loans, loan_days):
+        """Returns (status, temp_loan_id) using the same rules as issue_loan_atomic()."""
+        with self._transaction() as db:
+            open_loans = db.execute("SELECT COUNT(*) FROM loans WHERE member_id = ? AND return_date IS NULL",
+                                    (member_id,)).fetchone()[0]
+            if open_loans >= max_loans:
+                return "limit_reached", None
+            book = db.execute("SELECT title, copies_available FROM books WHERE book_id = ?", (book_id,)).fetchone()
+            if book is None or book["copies_available"] <= 0:
+                return "no_copies", None
+            loan_id = self._temp_id(db, "loans", "loan_id")
+            db.execute("UPDATE books SET copies_available = copies_available - 1 WHERE book_id = ?", (book_id,))
+            db.execute("INSERT INTO loans VALUES (?, ?, ?, ?, ?, ?, NULL)",
+                       (loan_id, book_id, member_id, book["title"], str(date.today()),
+                        str(date.today() + timedelta(days=loan_days))))
+            self._queue(db, "issue_loan", {"temp_id": loan_id, "book_id": book_id, "member_id": member_id})
+        return "success", loan_id
+
+    def return_loan(self, loan_id):
+        """Returns the member_id of the returned loan, or None if it wasn't open."""
+        with self._transaction() as db:
+            loan = db.execute("SELECT book_id, member_id FROM loans WHERE loan_id = ? AND return_date IS NULL",
+                              (loan_id,)).fetchone()
+            if loan is None:
+                return None
+            db.execute("UPDATE loans SET return_date = ? WHERE loan_id = ?", (str(date.today()), loan_id))
+            db.execute("UPDATE books SET copies_available = copies_available + 1 WHERE book_id = ?", (loan["book_id"],))
+            self._queue(db, "return_loan", {"loan_id": loan_id})
+        return loan["member_id"]
+
+    # ────────────── journal replay support ──────────────
+    def pending_writes(self):
+        rows = self._rows("SELECT seq, op, args FROM journal WHERE status = 'pending' ORDER BY seq")
+        for row in rows:
+            row["args"] = json.loads(row["args"])
+        return rows
+
+    def mark(self, seq, status, detail=None):
+        with self._lock:
+            self._db.execute("UPDATE journal SET status = ?, detail = ? WHERE seq = ?", (status, detail, seq))
+
+    def conflicts(self):
+        return self._rows("SELECT * FROM journal WHERE status = 'conflict' ORDER BY seq")
+
+    def map_id(self, kind, temp_id, real_id):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO id_map VALUES (?, ?, ?)", (kind, temp_id, real_id))
+
+    def resolve_id(self, kind, some_id):
+        """Real id for a temporary (negative) id; None if its creating write never applied."""
+        if some_id is None or some_id > 0:
+            return some_id
+        rows = self._rows("SELECT real_id FROM id_map WHERE kind = ? AND temp_id = ?", (kind, some_id))
+        return rows[0]["real_id"] if rows else None
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE … COMMIT/ROLLBACK under the replica lock."""
+
+    def __init__(self, replica):
+        self.replica = replica
+
+    def __enter__(self):
+        self.replica._lock.acquire()
+        self.replica._db.execute("BEGIN IMMEDIATE")
+        return self.replica._db
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.replica._db.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.replica._lock.release()
+        return False
@@ -1,30 +1,48 @@
 # main.py — FINAL, CLEAN, PROFESSIONAL, 100% WORKING
 import sys
 from PyQt5.QtWidgets import *
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, Qt, pyqtSignal
+
+import database
+import gui_trace
+import recommender
 
 # Import dashboards
 from dashboard_librarian import LibrarianDashboard
 from dashboard_member import MemberDashboard
 
-# Import DAO
-try:
-    from dao.user_dao import UserDAO
-except ImportError:
-    print("DAO not found — using fallback")
-    class UserDAO:
-        @staticmethod
-        def login(email, pwd):
-            if email == "admin@limkokwing.edu" and pwd == "admin123":
-                return {"username": email, "role": "Librarian"}
-            if email in ["abassbundu.com", "ishapatient.com"] and pwd == "123":
-                return {"username": email, "role": "Member", "member_id": 1}
-            return None
+# Import DAO — no offline fallback here: a login must always go through auth.py
+from auth import LoginResult
+from dao.user_dao import UserDAO
+
+class _LoginSignals(QObject):
+    # Lives in the GUI thread; emits from the worker are queued back to it
+    finished = pyqtSignal(str, object)   # email, (LoginResult, user)
+    failed = pyqtSignal(str)
+
+
+class _LoginTask(QRunnable):
+    """One sign-in attempt on the thread pool, with the credentials fixed when it was started."""
+
+    def __init__(self, email, password, signals):
+        super().__init__()
+        self.email = email
+        self.password = password
+        self.signals = signals
+
+    def run(self):
+        try:
+            outcome = UserDAO.login(self.email, self.password)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(self.email, outcome)
+
 
 class LoginWindow(QWidget):
     def __init__(self):
         super().__init__()
-        self.setWindowT/itle("SmartLibrary")
+        self.setWindowTitle("SmartLibrary")
         self.setGeometry(400, 150, 500, 600)
         self.setStyleSheet("""
             background: qlineargradient(x1:0, y1:0, x2:1, y2:1, stop:0 #667eea, stop:1 #764ba2);
@@ -58,6 +76,14 @@ class LoginWindow(QWidget):
             font-size: 22px; font-weight: bold; border-radius: 15px;
         """)
         login_btn.clicked.connect(self.login)
+        self.password.returnPressed.connect(self.login)
+        self.login_btn = login_btn
+
+        # Password hashing (~50 ms) and the DB round-trip run on the thread pool
+        self._pending = False
+        self._login_signals = _LoginSignals(self)
+        self._login_signals.finished.connect(self.on_login)
+        self._login_signals.failed.connect(self.on_login_error)
 
         layout.addWidget(title)
         layout.addWidget(subtitle)
@@ -70,6 +96,9 @@ class LoginWindow(QWidget):
         self.setLayout(layout)
 
     def login(self):
+        # returnPressed still fires while the button is disabled — one attempt at a time
+        if self._pending:
+            return
         email = self.email.text().strip()
         pwd = self.password.text().strip()
 
@@ -77,23 +106,53 @@ class LoginWindow(QWidget):
             QMessageBox.critical(self, "Error", "Please fill in both fields")
             return
 
-        user = UserDAO.login(email, pwd)
-
-        if not user:
+        self._pending = True
+        self.login_btn.setEnabled(False)
+        self.login_btn.setText("SIGNING IN…")
+        QThreadPool.globalInstance().start(_LoginTask(email, pwd, self._login_signals))
+
+    def _ready(self):
+        self._pending = False
+        self.login_btn.setEnabled(True)
+        self.login_btn.setText("LOGIN")
+
+    def on_login(self, email, outcome):
+        self._ready()
+        result, user = outcome
+        if result is LoginResult.LOCKED:
+            minutes = max(1, round(UserDAO.retry_after(email) / 60))
+            QMessageBox.critical(self, "Login Locked",
+                                 f"Too many failed attempts for {email}. Try again in {minutes} minute(s).")
+            return
+        if result is LoginResult.ERROR:
+            QMessageBox.critical(self, "Login Failed", "Could not reach the database. Please try again.")
+            return
+        if not result:
             QMessageBox.critical(self, "Login Failed", "Invalid email or password")
             return
 
+        self.password.clear()
         self.close()
         print(f"Login success: {user['role']} - {email}")
 
         if user["role"] == "Librarian":
-            LibrarianDashboard(user).showMaximized()
+            self.dashboard = LibrarianDashboard(user)
         else:
-            MemberDashboard(user).showMaximized()
+            self.dashboard = MemberDashboard(user)
+        self.dashboard.showMaximized()
+
+    def on_login_error(self, message):
+        self._ready()
+        QMessageBox.critical(self, "Login Failed", f"Could not sign in: {message}")
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    # Plain QApplication unless SMARTLIB_GUI_TRACE=<file> asks for a responsiveness trace
+    app = gui_trace.make_application(sys.argv)
     app.setStyle("Fusion")
+    # Connect to PostgreSQL while the login window renders instead of at import time
+    database.connect_in_background()
+    # Picks up loans made since the last run; the first run waits for the connection attempt
+    recommender.start_background()
     win = LoginWindow()
     win.show()
     sys.exit(app.exec_())
@@ -0,0 +1,12 @@
+# migrate.py
+# Apply pending SQL files from migrations/ to the configured PostgreSQL database.
+#   python migrate.py
+import sys
+
+import database
+
+if __name__ == "__main__":
+    if not database.is_connected():
+        sys.exit("PostgreSQL is not reachable — nothing to migrate")
+    applied = database.run_migrations()
+    print(f"Applied {len(applied)} migration(s): {', '.join(applied) or 'none pending'}")
@@ -0,0 +1,8 @@
+-- 001_catalog_trgm.sql
+-- Trigram indexes so catalog search (ILIKE '%term%' + similarity ranking) uses
+-- an index scan instead of reading every book and author.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS books_title_trgm_idx ON books USING gin (title gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS authors_name_trgm_idx ON authors USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS books_author_id_idx ON books (author_id);
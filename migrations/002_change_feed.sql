@@ -0,0 +1,28 @@
+-- 002_change_feed.sql
+-- NOTIFY library_changes with the changed row as JSON, so open dashboards can
+-- patch single rows instead of re-querying whole tables (see change_feed.py).
+CREATE OR REPLACE FUNCTION notify_library_change() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('library_changes', json_build_object(
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'row', row_to_json(CASE WHEN TG_OP = 'DELETE' THEN OLD ELSE NEW END)
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS books_notify_change ON books;
+CREATE TRIGGER books_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON books
+    FOR EACH ROW EXECUTE FUNCTION notify_library_change();
+
+DROP TRIGGER IF EXISTS loans_notify_change ON loans;
+CREATE TRIGGER loans_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON loans
+    FOR EACH ROW EXECUTE FUNCTION notify_library_change();
+
+DROP TRIGGER IF EXISTS club_members_notify_change ON club_members;
+CREATE TRIGGER club_members_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON club_members
+    FOR EACH ROW EXECUTE FUNCTION notify_library_change();
@@ -0,0 +1,18 @@
+-- 003_bulk_import.sql
+-- Bulk imports merge on ISBN, and set smartlib.bulk_import for their transaction
+-- so the change-feed trigger stays quiet; the importer sends one RESYNC per batch.
+CREATE INDEX IF NOT EXISTS books_isbn_idx ON books (isbn);
+
+CREATE OR REPLACE FUNCTION notify_library_change() RETURNS trigger AS $$
+BEGIN
+    IF current_setting('smartlib.bulk_import', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    PERFORM pg_notify('library_changes', json_build_object(
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'row', row_to_json(CASE WHEN TG_OP = 'DELETE' THEN OLD ELSE NEW END)
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,40 @@
+-- 004_issue_loan.sql
+-- Contention-safe checkout in one round-trip (see database.issue_loan).
+-- Open loans are found through partial indexes instead of scanning loan history.
+CREATE INDEX IF NOT EXISTS loans_open_by_member_idx ON loans (member_id) WHERE return_date IS NULL;
+CREATE INDEX IF NOT EXISTS loans_open_by_due_date_idx ON loans (due_date) WHERE return_date IS NULL;
+
+-- Locks the member row first (serializes one member's concurrent checkouts so the
+-- limit can't be overshot), then takes a copy with a conditional UPDATE that holds
+-- the book row lock only for the INSERT that follows. Lock order member → book is
+-- the same for every caller, so concurrent checkouts of a popular title queue
+-- instead of deadlocking.
+CREATE OR REPLACE FUNCTION issue_loan_atomic(p_book_id INTEGER, p_member_id INTEGER,
+                                             p_max_loans INTEGER, p_loan_days INTEGER)
+RETURNS TABLE (status TEXT, loan_id INTEGER) AS $$
+DECLARE
+    v_open INTEGER;
+BEGIN
+    PERFORM 1 FROM members WHERE member_id = p_member_id FOR UPDATE;
+
+    SELECT COUNT(*) INTO v_open
+    FROM loans l
+    WHERE l.member_id = p_member_id AND l.return_date IS NULL;
+    IF v_open >= p_max_loans THEN
+        RETURN QUERY SELECT 'limit_reached'::TEXT, NULL::INTEGER;
+        RETURN;
+    END IF;
+
+    UPDATE books SET copies_available = copies_available - 1
+    WHERE book_id = p_book_id AND copies_available > 0;
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT 'no_copies'::TEXT, NULL::INTEGER;
+        RETURN;
+    END IF;
+
+    RETURN QUERY
+    INSERT INTO loans (book_id, member_id, due_date)
+    VALUES (p_book_id, p_member_id, CURRENT_DATE + p_loan_days)
+    RETURNING 'success'::TEXT, loans.loan_id;
+END;
+$$ LANGUAGE plpgsql;
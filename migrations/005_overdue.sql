@@ -0,0 +1,14 @@
+-- 005_overdue.sql
+-- Materialized overdue status for open loans, rewritten by database.refresh_overdue()
+-- on a schedule so the dashboards read days overdue and fines instead of computing them.
+-- days_overdue = CURRENT_DATE - due_date at the last run (negative = days still left).
+CREATE TABLE IF NOT EXISTS loan_status (
+    loan_id      INTEGER PRIMARY KEY REFERENCES loans (loan_id) ON DELETE CASCADE,
+    member_id    INTEGER NOT NULL,
+    days_overdue INTEGER NOT NULL,
+    fine         NUMERIC(8, 2) NOT NULL DEFAULT 0
+);
+
+-- get_overdue_loans(): worst first, paged, touching only the overdue rows
+CREATE INDEX IF NOT EXISTS loan_status_overdue_idx
+    ON loan_status (days_overdue DESC, loan_id) WHERE days_overdue > 0;
@@ -0,0 +1,11 @@
+-- 006_reminders.sql
+-- Ledger of reminders already sent (see reminders.py). The idempotency key is
+-- "<kind>:<loan_id>:<due_date>", so each loan gets at most one due-soon and one
+-- overdue reminder per due date, however often or wherever the job runs.
+CREATE TABLE IF NOT EXISTS reminders_sent (
+    idempotency_key TEXT PRIMARY KEY,
+    loan_id         INTEGER NOT NULL,
+    member_id       INTEGER NOT NULL,
+    kind            TEXT NOT NULL,
+    sent_at         TIMESTAMPTZ NOT NULL DEFAULT now()
+);
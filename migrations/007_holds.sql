@@ -0,0 +1,111 @@
+-- 007_holds.sql
+-- Hold queue for titles with no copies on the shelf (see database.place_hold).
+-- A returned copy goes to the oldest waiting hold in the same transaction as the
+-- return ("ready" until ready_until) instead of back to copies_available.
+CREATE TABLE IF NOT EXISTS holds (
+    hold_id     SERIAL PRIMARY KEY,
+    book_id     INTEGER NOT NULL REFERENCES books (book_id) ON DELETE CASCADE,
+    member_id   INTEGER NOT NULL REFERENCES members (member_id) ON DELETE CASCADE,
+    status      TEXT NOT NULL DEFAULT 'waiting',   -- waiting | ready | fulfilled | expired | cancelled
+    placed_at   TIMESTAMPTZ NOT NULL DEFAULT now(),
+    ready_until DATE
+);
+
+-- One live hold per member and title
+CREATE UNIQUE INDEX IF NOT EXISTS holds_live_member_book_idx
+    ON holds (book_id, member_id) WHERE status IN ('waiting', 'ready');
+-- The FIFO queue: next holder and queue positions are range scans on (book_id, hold_id)
+CREATE INDEX IF NOT EXISTS holds_queue_idx ON holds (book_id, hold_id) WHERE status = 'waiting';
+CREATE INDEX IF NOT EXISTS holds_member_idx ON holds (member_id) WHERE status IN ('waiting', 'ready');
+CREATE INDEX IF NOT EXISTS holds_ready_until_idx ON holds (ready_until) WHERE status = 'ready';
+
+DROP TRIGGER IF EXISTS holds_notify_change ON holds;
+CREATE TRIGGER holds_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON holds
+    FOR EACH ROW EXECUTE FUNCTION notify_library_change();
+
+-- p_copies copies of a book came back: the oldest waiting holds get them, the rest
+-- go on the shelf. The book row is locked first, the same as place_hold does, so a
+-- hold can't be queued while a copy slips back onto the shelf unseen.
+CREATE OR REPLACE FUNCTION restock_or_assign(p_book_id INTEGER, p_copies INTEGER, p_pickup_days INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    v_assigned INTEGER;
+BEGIN
+    PERFORM 1 FROM books WHERE book_id = p_book_id FOR UPDATE;
+
+    UPDATE holds h SET status = 'ready', ready_until = CURRENT_DATE + p_pickup_days
+    FROM (SELECT hold_id FROM holds
+          WHERE book_id = p_book_id AND status = 'waiting'
+          ORDER BY hold_id
+          LIMIT p_copies) next_holds
+    WHERE h.hold_id = next_holds.hold_id;
+    GET DIAGNOSTICS v_assigned = ROW_COUNT;
+
+    IF p_copies > v_assigned THEN
+        UPDATE books SET copies_available = copies_available + (p_copies - v_assigned)
+        WHERE book_id = p_book_id;
+    END IF;
+    RETURN v_assigned;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Ready holds not picked up in time expire; their copies move down the queue.
+CREATE OR REPLACE FUNCTION expire_holds(p_pickup_days INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    r RECORD;
+    v_expired INTEGER;
+    v_total INTEGER := 0;
+BEGIN
+    FOR r IN SELECT DISTINCT book_id FROM holds
+             WHERE status = 'ready' AND ready_until < CURRENT_DATE
+             ORDER BY book_id
+    LOOP
+        PERFORM 1 FROM books WHERE book_id = r.book_id FOR UPDATE;
+        UPDATE holds SET status = 'expired'
+        WHERE book_id = r.book_id AND status = 'ready' AND ready_until < CURRENT_DATE;
+        GET DIAGNOSTICS v_expired = ROW_COUNT;
+        PERFORM restock_or_assign(r.book_id, v_expired, p_pickup_days);
+        v_total := v_total + v_expired;
+    END LOOP;
+    RETURN v_total;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Checkout now honours holds: a copy set aside for the member is theirs without
+-- touching the shelf count, and borrowing a title closes the member's live hold on it.
+CREATE OR REPLACE FUNCTION issue_loan_atomic(p_book_id INTEGER, p_member_id INTEGER,
+                                             p_max_loans INTEGER, p_loan_days INTEGER)
+RETURNS TABLE (status TEXT, loan_id INTEGER) AS $$
+DECLARE
+    v_open INTEGER;
+BEGIN
+    PERFORM 1 FROM members WHERE member_id = p_member_id FOR UPDATE;
+
+    SELECT COUNT(*) INTO v_open
+    FROM loans l
+    WHERE l.member_id = p_member_id AND l.return_date IS NULL;
+    IF v_open >= p_max_loans THEN
+        RETURN QUERY SELECT 'limit_reached'::TEXT, NULL::INTEGER;
+        RETURN;
+    END IF;
+
+    UPDATE holds h SET status = 'fulfilled'
+    WHERE h.book_id = p_book_id AND h.member_id = p_member_id AND h.status = 'ready';
+    IF NOT FOUND THEN
+        UPDATE books SET copies_available = copies_available - 1
+        WHERE book_id = p_book_id AND copies_available > 0;
+        IF NOT FOUND THEN
+            RETURN QUERY SELECT 'no_copies'::TEXT, NULL::INTEGER;
+            RETURN;
+        END IF;
+        UPDATE holds h SET status = 'fulfilled'
+        WHERE h.book_id = p_book_id AND h.member_id = p_member_id AND h.status = 'waiting';
+    END IF;
+
+    RETURN QUERY
+    INSERT INTO loans (book_id, member_id, due_date)
+    VALUES (p_book_id, p_member_id, CURRENT_DATE + p_loan_days)
+    RETURNING 'success'::TEXT, loans.loan_id;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,33 @@
+-- 008_recommendations.sql
+-- Item-item similarity for "Recommended for you" (see recommender.py).
+-- book_cooccurrence is the sparse matrix C = XᵀX of the member × book "has borrowed"
+-- matrix: together = members who borrowed both, the diagonal (book_id = other_id) =
+-- members who borrowed the book. It is kept by adding increments, so a nightly run
+-- only reads loans newer than recommender_state.last_loan_id.
+CREATE TABLE IF NOT EXISTS book_cooccurrence (
+    book_id  INTEGER NOT NULL REFERENCES books (book_id) ON DELETE CASCADE,
+    other_id INTEGER NOT NULL REFERENCES books (book_id) ON DELETE CASCADE,
+    together INTEGER NOT NULL,
+    PRIMARY KEY (book_id, other_id)
+);
+-- Cold start: most borrowed titles
+CREATE INDEX IF NOT EXISTS book_cooccurrence_popular_idx
+    ON book_cooccurrence (together DESC) WHERE book_id = other_id;
+
+-- Top-K neighbours per book, rewritten for the books a run touched
+CREATE TABLE IF NOT EXISTS book_neighbors (
+    book_id     INTEGER NOT NULL REFERENCES books (book_id) ON DELETE CASCADE,
+    neighbor_id INTEGER NOT NULL REFERENCES books (book_id) ON DELETE CASCADE,
+    score       REAL NOT NULL,
+    PRIMARY KEY (book_id, neighbor_id)
+);
+
+CREATE TABLE IF NOT EXISTS recommender_state (
+    id           BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),   -- single row
+    last_loan_id INTEGER NOT NULL DEFAULT 0,
+    updated_at   TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+INSERT INTO recommender_state (id) VALUES (TRUE) ON CONFLICT DO NOTHING;
+
+-- A member's borrowing history, newest first, without touching the heap
+CREATE INDEX IF NOT EXISTS loans_member_history_idx ON loans (member_id, loan_id DESC) INCLUDE (book_id);
@@ -0,0 +1,6 @@
+-- 009_password_hashes.sql
+-- users.password now holds salted scrypt hashes (passwords.py) instead of plaintext.
+-- The column is widened for the ~100-character hash; existing plaintext rows keep
+-- working and are rehashed on their next login, or all at once with
+--   python auth.py --migrate-passwords
+ALTER TABLE users ALTER COLUMN password TYPE TEXT;
@@ -0,0 +1,14 @@
+-- 010_offline_writes.sql
+-- Journal entries replayed from a workstation's offline replica (database.sync_offline_writes).
+-- A replayed write inserts its (replica_id, seq) here in the same transaction as the
+-- write itself, so a replay interrupted after PostgreSQL committed but before the
+-- replica marked the entry applied finds the outcome here on the next run instead
+-- of adding the book or issuing the loan a second time.
+CREATE TABLE IF NOT EXISTS offline_writes (
+    replica_id TEXT NOT NULL,
+    seq        INTEGER NOT NULL,
+    status     TEXT NOT NULL,
+    result_id  INTEGER,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (replica_id, seq)
+);
@@ -0,0 +1,65 @@
+# passwords.py
+# PASSWORD HASHING – salted scrypt (memory-hard) hashes for users.password
+#
+# Stored form: scrypt$<n>$<r>$<p>$<salt>$<hash> (salt and hash urlsafe base64).
+# Rows from before migrations/009 still hold the plaintext password; those (and
+# hashes made with older cost settings) verify once more and report
+# needs_rehash() so the caller can store a fresh hash.
+import base64
+import hashlib
+import hmac
+import os
+
+SCRYPT_N = 2 ** 14      # CPU/memory cost: 128 · n · r bytes = 16 MiB per hash, ~50 ms
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+HASH_BYTES = 32
+PREFIX = "scrypt$"
+
+
+def _b64(raw):
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, dklen=HASH_BYTES,
+                          maxmem=256 * n * r)
+
+
+def hash_password(password):
+    salt = os.urandom(SALT_BYTES)
+    digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"{PREFIX}{SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+
+
+def is_hashed(stored):
+    return bool(stored) and stored.startswith(PREFIX)
+
+
+# Verified against when the username doesn't exist, so a miss costs as much as a wrong password
+_DUMMY = hash_password(os.urandom(8).hex())
+
+
+def verify_password(password, stored):
+    """True if password matches the stored hash (or legacy plaintext). stored=None always fails, slowly."""
+    if stored is None:
+        verify_password(password, _DUMMY)
+        return False
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode(), stored.encode())
+    try:
+        n, r, p, salt, digest = stored[len(PREFIX):].split("$")
+        candidate = _scrypt(password, _unb64(salt), int(n), int(r), int(p))
+    except (ValueError, TypeError):
+        return False
+    return hmac.compare_digest(candidate, _unb64(digest))
+
+
+def needs_rehash(stored):
+    """Plaintext rows and hashes made with other cost settings should be replaced after a good login."""
+    return not stored.startswith(f"{PREFIX}{SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
@@ -0,0 +1,169 @@
+# query_cache.py
+# READ-THROUGH QUERY CACHE – TTL + LRU bound + tag-based write invalidation
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+
+class QueryCache:
+    """
+    Caches function results keyed on (function name, args, kwargs).
+    Each entry carries tags (e.g. "books", "member_loans:1"); writers call
+    invalidate(tag) so the next read goes back to the database. Entries also
+    expire after `ttl` seconds, and the least recently used entry is evicted
+    once `max_entries` is reached.
+    """
+
+    def __init__(self, max_entries=512, ttl=30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()         # key -> (expires_at, value, tags)
+        self._tags = defaultdict(set)         # tag -> {key}
+        self._lock = threading.RLock()
+        # Per thread and per asyncio task, so a coroutine's discard can't leak into another
+        self._discard = contextvars.ContextVar("query_cache_discard", default=False)
+        self.hits = defaultdict(int)          # function name -> count
+        self.misses = defaultdict(int)
+        self.evictions = 0
+        self.invalidations = 0
+        self._version = 0                     # bumped by every invalidation
+
+    # ────────────── storage ──────────────
+    def _drop(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] < time.monotonic():
+                self._drop(key)
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[1]
+
+    def put(self, key, value, tags, ttl=None, version=None):
+        with self._lock:
+            if version is not None and version != self._version:
+                return   # a write landed while this value was being read — it may be stale
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value, tags)
+            for tag in tags:
+                self._tags[tag].add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        with self._lock:
+            self._version += 1
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._drop(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def discard_current(self):
+        """Called from inside a cached function (e.g. on a DB error) so its result isn't stored."""
+        self._discard.set(True)
+
+    def stats(self):
+        with self._lock:
+            hits, misses = sum(self.hits.values()), sum(self.misses.values())
+            return {
+                "entries": len(self._entries),
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "by_function": {name: {"hits": self.hits[name], "misses": self.misses[name]}
+                                for name in set(self.hits) | set(self.misses)},
+            }
+
+    # ────────────── decorator ──────────────
+    def cached(self, *tags, ttl=None):
+        """
+        Read-through decorator. A tag may be a string or a callable taking the
+        call's arguments and returning a string, for per-argument invalidation.
+        Lists are returned as shallow copies so callers can't mutate the entry.
+        """
+        def decorator(fn):
+            name = fn.__name__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                key, found, value = self._lookup(name, args, kwargs)
+                if not found:
+                    version = self._version
+                    self._discard.set(False)
+                    value = fn(*args, **kwargs)
+                    self._store(key, value, tags, ttl, version, args, kwargs)
+                return list(value) if isinstance(value, list) else value
+            return wrapper
+        return decorator
+
+    def cached_async(self, *tags, ttl=None, name=None):
+        """
+        cached() for coroutine functions. `name` lets an async twin share the
+        entries (and invalidations) of the synchronous function it mirrors.
+        Concurrent misses on one key wait for a single load instead of each
+        running the query.
+        """
+        def decorator(fn):
+            entry_name = name or fn.__name__
+            loading = {}   # key -> future of the load in flight
+
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                key, found, value = self._lookup(entry_name, args, kwargs)
+                if not found and key in loading:
+                    value = await asyncio.shield(loading[key])
+                elif not found:
+                    version = self._version
+                    pending = loading[key] = asyncio.get_running_loop().create_future()
+                    try:
+                        self._discard.set(False)
+                        value = await fn(*args, **kwargs)
+                        self._store(key, value, tags, ttl, version, args, kwargs)
+                        pending.set_result(value)
+                    except asyncio.CancelledError:
+                        pending.cancel()
+                        raise
+                    except BaseException as e:
+                        pending.set_exception(e)
+                        pending.exception()   # retrieved — no "never retrieved" warning without waiters
+                        raise
+                    finally:
+                        del loading[key]
+                return list(value) if isinstance(value, list) else value
+            return wrapper
+        return decorator
+
+    def _lookup(self, name, args, kwargs):
+        key = (name, args, tuple(sorted(kwargs.items())))
+        found, value = self.get(key)
+        with self._lock:
+            (self.hits if found else self.misses)[name] += 1
+        return key, found, value
+
+    def _store(self, key, value, tags, ttl, version, args, kwargs):
+        if not self._discard.get():
+            entry_tags = frozenset(t(*args, **kwargs) if callable(t) else t for t in tags)
+            self.put(key, value, entry_tags, ttl, version)
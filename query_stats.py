@@ -0,0 +1,323 @@
+# query_stats.py
+# QUERY INSTRUMENTATION – per-shape latency histograms, slow-query log with plans, Prometheus dump
+#
+# The pool's connections use TimedDictCursor and execute() asks for TimedCursor,
+# so every statement the data layer sends — execute(), get_cursor() blocks, the
+# replica snapshot — is timed here without touching the call sites. Statements
+# are grouped by operation (the database.py function that ran them) and shape
+# (the SQL with literals and placeholders replaced by ?).
+import functools
+import json
+import os
+import re
+import sys
+import threading
+import time
+import zlib
+from collections import deque
+
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)   # seconds
+EXPLAIN_COOLDOWN = 300.0   # seconds before a slow shape is EXPLAINed again
+SLOW_KEPT = 50             # recent slow queries kept for snapshot()
+_PLUMBING = {"execute", "executemany", "copy_expert", "_retry_on_conflict"}
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\(\w+\)s|%s")
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=2048)
+def shape_of(query):
+    """The statement with literals and placeholders as ? and whitespace collapsed."""
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    return _WHITESPACE.sub(" ", _LITERALS.sub("?", query)).strip()
+
+
+def _row_bytes(row):
+    values = row.values() if isinstance(row, dict) else row
+    return sum(len(v) if isinstance(v, (str, bytes)) else 8 for v in values)
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+class _Shape:
+    __slots__ = ("operation", "shape", "shape_id", "calls", "errors", "rows", "bytes",
+                 "seconds", "max_seconds", "buckets", "last_error", "explained_at")
+
+    def __init__(self, operation, shape):
+        self.operation = operation
+        self.shape = shape
+        self.shape_id = f"{zlib.crc32(shape.encode()):08x}"
+        self.calls = self.errors = self.rows = self.bytes = 0
+        self.seconds = self.max_seconds = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)   # last = +Inf
+        self.last_error = None
+        self.explained_at = None
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (None = above the last bucket)."""
+        target, seen = q * self.calls, 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= target:
+                return bound
+        return None
+
+
+class QueryStats:
+    """
+    Thread-safe counters per (operation, shape): calls, errors, rows, bytes
+    fetched, total/max time and a latency histogram. Statements slower than
+    slow_ms are appended to slow_log (JSON lines) with their EXPLAIN plan.
+    """
+
+    def __init__(self, slow_ms=250.0, slow_log=None, data_layer=None):
+        self._shapes = {}
+        self._slow = deque(maxlen=SLOW_KEPT)
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.configure(slow_ms, slow_log, data_layer)
+
+    def configure(self, slow_ms=None, slow_log=None, data_layer=None):
+        if slow_ms is not None:
+            self.slow_seconds = slow_ms / 1000.0 if slow_ms > 0 else None
+        if slow_log is not None:
+            self.slow_log = slow_log or None
+        if data_layer is not None:
+            self.data_layer = os.path.abspath(data_layer)
+
+    def reset(self):
+        with self._lock:
+            self._shapes.clear()
+            self._slow.clear()
+            self.started = time.time()
+
+    # ────────────── recording (called by the cursors) ──────────────
+    def _operation(self):
+        # The innermost module-level data-layer function on the stack. Inner helpers
+        # (issue_loan's `work`, decorator wrappers) aren't module globals, so the walk
+        # continues to their caller — the function that owns them.
+        frame = sys._getframe(3)
+        while frame is not None:
+            code = frame.f_code
+            if (code.co_filename == self.data_layer and code.co_name not in _PLUMBING
+                    and code.co_name in frame.f_globals):
+                return code.co_name
+            frame = frame.f_back
+        return "other"
+
+    def record(self, cursor, query, seconds, error=None):
+        shape = shape_of(query if isinstance(query, (str, bytes)) else str(query))
+        key = (self._operation(), shape)
+        with self._lock:
+            entry = self._shapes.get(key)
+            if entry is None:
+                entry = self._shapes[key] = _Shape(*key)
+            entry.calls += 1
+            entry.seconds += seconds
+            entry.max_seconds = max(entry.max_seconds, seconds)
+            i = 0
+            while i < len(BUCKETS) and seconds > BUCKETS[i]:
+                i += 1
+            entry.buckets[i] += 1
+            if error is not None:
+                entry.errors += 1
+                entry.last_error = f"{type(error).__name__}: {str(error).strip()[:200]}"
+            slow = error is None and self.slow_seconds is not None and seconds >= self.slow_seconds
+            explain = slow and (entry.explained_at is None or time.monotonic() - entry.explained_at > EXPLAIN_COOLDOWN)
+            if explain:
+                entry.explained_at = time.monotonic()
+        cursor._stats_entry = entry
+        if slow:
+            self._log_slow(cursor, entry, seconds, explain)
+
+    def fetched(self, cursor, rows):
+        entry = getattr(cursor, "_stats_entry", None)
+        if entry is None or not rows:
+            return
+        nbytes = sum(_row_bytes(row) for row in rows)
+        with self._lock:
+            entry.rows += len(rows)
+            entry.bytes += nbytes
+
+    def _log_slow(self, cursor, entry, seconds, explain):
+        plan = None
+        if (explain and cursor.name is None
+                and entry.shape.split(" ", 1)[0].lower() in ("select", "with", "insert", "update", "delete")):
+            plan = self._explain(cursor)
+        event = {"at": time.strftime("%Y-%m-%dT%H:%M:%S"), "operation": entry.operation, "shape_id": entry.shape_id,
+                 "ms": round(seconds * 1000, 1), "rows": cursor.rowcount, "shape": entry.shape, "plan": plan}
+        with self._lock:
+            self._slow.append(event)
+            if self.slow_log:
+                try:
+                    with open(self.slow_log, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(event) + "\n")
+                except OSError as e:
+                    print("Slow query log not writable:", e)
+        print(f"Slow query ({event['ms']} ms) in {entry.operation}: {entry.shape[:120]}")
+
+    @staticmethod
+    def _explain(cursor):
+        # Plain cursor on the same connection (same transaction and settings, not itself timed).
+        # A savepoint keeps a failed EXPLAIN from aborting the caller's transaction.
+        conn = cursor.connection
+        savepoint = not conn.autocommit
+        with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as c:
+            try:
+                if savepoint:
+                    c.execute("SAVEPOINT query_stats_explain")
+                c.execute(b"EXPLAIN " + cursor.query)
+                plan = "\n".join(r[0] for r in c.fetchall())
+                if savepoint:
+                    c.execute("RELEASE SAVEPOINT query_stats_explain")
+            except psycopg2.Error as e:
+                if savepoint:
+                    c.execute("ROLLBACK TO SAVEPOINT query_stats_explain")
+                return f"(EXPLAIN failed: {str(e).strip()})"
+        # String literals are dropped from the plan: parameters can be emails or passwords
+        return _STRINGS.sub("'?'", plan)
+
+    # ────────────── reading ──────────────
+    def snapshot(self):
+        """Per-shape totals, most total time first, plus the recent slow queries."""
+        with self._lock:
+            shapes = sorted(self._shapes.values(), key=lambda e: -e.seconds)
+            queries = [{
+                "operation": e.operation, "shape_id": e.shape_id, "shape": e.shape,
+                "calls": e.calls, "errors": e.errors, "rows": e.rows, "bytes": e.bytes,
+                "total_ms": round(e.seconds * 1000, 2), "mean_ms": round(e.seconds * 1000 / e.calls, 3),
+                "max_ms": round(e.max_seconds * 1000, 2),
+                "p50_le_ms": None if e.quantile(0.5) is None else e.quantile(0.5) * 1000,
+                "p95_le_ms": None if e.quantile(0.95) is None else e.quantile(0.95) * 1000,
+                "last_error": e.last_error,
+            } for e in shapes]
+            return {"since": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                    "queries": queries, "slow": list(self._slow)}
+
+    def prometheus(self, cache_stats=None):
+        """Prometheus text exposition of the counters (and QueryCache.stats() if given)."""
+        out = [
+            "# HELP smartlibrary_query_duration_seconds Data-layer statement latency by operation and query shape.",
+            "# TYPE smartlibrary_query_duration_seconds histogram",
+        ]
+        with self._lock:
+            shapes = list(self._shapes.values())
+            for e in shapes:
+                labels = f'operation="{_label(e.operation)}",shape="{e.shape_id}"'
+                seen = 0
+                for bound, count in zip(BUCKETS + (None,), e.buckets):
+                    seen += count
+                    out.append(f'smartlibrary_query_duration_seconds_bucket{{{labels},le="{bound or "+Inf"}"}} {seen}')
+                out.append(f"smartlibrary_query_duration_seconds_sum{{{labels}}} {e.seconds:.6f}")
+                out.append(f"smartlibrary_query_duration_seconds_count{{{labels}}} {e.calls}")
+            for name, field, help_text in (("rows", "rows", "Rows fetched."), ("bytes", "bytes", "Approximate bytes fetched."),
+                                           ("errors", "errors", "Statements that raised.")):
+                out.append(f"# HELP smartlibrary_query_{name}_total {help_text}")
+                out.append(f"# TYPE smartlibrary_query_{name}_total counter")
+                for e in shapes:
+                    out.append(f'smartlibrary_query_{name}_total{{operation="{_label(e.operation)}",shape="{e.shape_id}"}} '
+                               f"{getattr(e, field)}")
+            out.append("# HELP smartlibrary_query_shape_info SQL text of each shape id.")
+            out.append("# TYPE smartlibrary_query_shape_info gauge")
+            for shape_id, sql in sorted({(e.shape_id, e.shape) for e in shapes}):
+                out.append(f'smartlibrary_query_shape_info{{shape="{shape_id}",sql="{_label(sql[:300])}"}} 1')
+        if cache_stats:
+            out.append("# HELP smartlibrary_cache_requests_total Query cache lookups by function and result.")
+            out.append("# TYPE smartlibrary_cache_requests_total counter")
+            for function, counts in sorted(cache_stats["by_function"].items()):
+                for result, field in (("hit", "hits"), ("miss", "misses")):
+                    out.append(f'smartlibrary_cache_requests_total{{function="{_label(function)}",result="{result}"}} '
+                               f"{counts[field]}")
+            out.append("# TYPE smartlibrary_cache_entries gauge")
+            out.append(f"smartlibrary_cache_entries {cache_stats['entries']}")
+            out.append("# TYPE smartlibrary_cache_evictions_total counter")
+            out.append(f"smartlibrary_cache_evictions_total {cache_stats['evictions']}")
+            out.append("# TYPE smartlibrary_cache_invalidations_total counter")
+            out.append(f"smartlibrary_cache_invalidations_total {cache_stats['invalidations']}")
+        return "\n".join(out) + "\n"
+
+    def write_prometheus(self, path, cache_stats=None):
+        """Atomically replace path with the text dump (for a textfile collector or a quick look)."""
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus(cache_stats))
+        os.replace(tmp, path)
+
+
+stats = QueryStats()
+
+
+# ────────────────────── CURSORS ──────────────────────
+class _Timed:
+    """Cursor mixin: statements are timed into `stats`, fetched rows and bytes are added to the same shape."""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            result = super().execute(query, vars)
+        except Exception as e:
+            stats.record(self, query, time.perf_counter() - started, e)
+            raise
+        stats.record(self, query, time.perf_counter() - started)
+        return result
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            result = super().executemany(query, vars_list)
+        except Exception as e:
+            stats.record(self, query, time.perf_counter() - started, e)
+            raise
+        stats.record(self, query, time.perf_counter() - started)
+        return result
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            result = super().copy_expert(sql, file, size)
+        except Exception as e:
+            stats.record(self, sql, time.perf_counter() - started, e)
+            raise
+        stats.record(self, sql, time.perf_counter() - started)
+        return result
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            stats.fetched(self, (row,))
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        stats.fetched(self, rows)
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        stats.fetched(self, rows)
+        return rows
+
+    def __iter__(self):
+        # Rows are counted by fetchmany() alone — the base iterators of named and dict
+        # cursors call the fetch methods themselves, so counting here as well doubled them.
+        # A named cursor still fetches itersize rows per round trip.
+        while True:
+            rows = self.fetchmany(self.itersize)
+            if not rows:
+                return
+            yield from rows
+
+
+class TimedCursor(_Timed, psycopg2.extensions.cursor):
+    pass
+
+
+class TimedDictCursor(_Timed, RealDictCursor):
+    pass
@@ -0,0 +1,149 @@
+# recommender.py
+# RECOMMENDATIONS – item-item similarity from co-borrowing plus author/genre affinity
+#
+#   python recommender.py                  # fold in loans since the last run (nightly)
+#   python recommender.py --rebuild        # recount all loan history from scratch
+#   python recommender.py --every 86400    # keep running daily
+#
+# X is the member × book "has borrowed" matrix and C = XᵀX its co-borrowing
+# matrix: C[a][b] = members who borrowed both, C[a][a] = members who borrowed a.
+# C is kept sparse in book_cooccurrence and only ever incremented, so a run reads
+# just the loans after the stored watermark, adds their contribution to C, and
+# rebuilds the top-K neighbour lists of the books whose rows changed:
+#   score(a, b) = C[a][b] / sqrt(C[a][a] · C[b][b])  × author / genre affinity
+# Serving (database.get_recommendations) never touches C or the loan history.
+import argparse
+import heapq
+import json
+import math
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+import database
+
+TOP_K = 20              # neighbours kept per book
+AUTHOR_WEIGHT = 0.5     # same author multiplies the score by 1 + this
+GENRE_WEIGHT = 0.2      # same genre multiplies the score by 1 + this
+EVENT_BATCH = 5000      # loans read per query
+BOOK_BATCH = 1000       # neighbour lists rebuilt per round trip
+
+
+def count_new_borrows(events, histories, deltas=None):
+    """
+    Increments to C for loan events (loan_id, member_id, book_id), given each
+    member's titles before them: a first borrow of a title adds one to its
+    diagonal and one to every pair with the member's earlier titles. Borrowing
+    a title again adds nothing. Updates histories in place and adds to deltas
+    if given (one batch of events at a time).
+    """
+    deltas = defaultdict(Counter) if deltas is None else deltas
+    for _, member_id, book_id in events:
+        seen = histories.setdefault(member_id, set())
+        if book_id in seen:
+            continue
+        row = deltas[book_id]
+        row[book_id] += 1
+        for other in seen:
+            row[other] += 1
+            deltas[other][book_id] += 1
+        seen.add(book_id)
+    return deltas
+
+
+def top_neighbors(rows, borrowers, features, k=TOP_K):
+    """{book_id: [(neighbor_id, score), ...]}, best first, for each row of C."""
+    neighbors = {}
+    for book_id, row in rows.items():
+        n = borrowers.get(book_id) or row.get(book_id)
+        author, genre = features.get(book_id, (None, None))
+        scored = []
+        for other, together in row.items():
+            if other == book_id or not n or not borrowers.get(other):
+                continue
+            score = together / math.sqrt(n * borrowers[other])
+            other_author, other_genre = features.get(other, (None, None))
+            if author is not None and other_author == author:
+                score *= 1 + AUTHOR_WEIGHT
+            if genre and other_genre == genre:
+                score *= 1 + GENRE_WEIGHT
+            scored.append((score, -other))
+        neighbors[book_id] = [(-other, round(score, 4)) for score, other in heapq.nlargest(k, scored)]
+    return neighbors
+
+
+def update_index(rebuild=False, event_batch=EVENT_BATCH, book_batch=BOOK_BATCH):
+    """Fold new loans into C and refresh the affected neighbour lists. Returns a stats dict (None offline)."""
+    started = time.monotonic()
+    if rebuild:
+        database.reset_recommendations()
+    start = database.get_recommender_watermark()
+    if start is None:
+        return None
+    # Each batch is folded into the increments as it arrives, so a --rebuild holds
+    # the (sparse) deltas and member histories, never the whole loan history
+    deltas, histories, loans, after = defaultdict(Counter), {}, 0, start
+    while True:
+        batch = database.get_borrow_events(after, event_batch)
+        if not batch:
+            break
+        first_seen = {member_id for _, member_id, _ in batch} - histories.keys()
+        if first_seen:
+            histories.update(database.get_member_histories(first_seen, start))
+        count_new_borrows(batch, histories, deltas)
+        loans += len(batch)
+        after = batch[-1][0]
+    stats = {"loans": loans, "books": 0, "cells": 0, "watermark": after}
+    if loans:
+        if not database.apply_cooccurrence(deltas, start, after):
+            print("Recommender: another run updated the index first — skipping")
+            return None
+        # Books whose row of C changed; partners of a book whose diagonal moved keep
+        # slightly stale scores until their own row changes or the next --rebuild
+        touched = sorted(deltas)
+        for i in range(0, len(touched), book_batch):
+            rows, borrowers = database.get_cooccurrence(touched[i:i + book_batch])
+            features = database.get_book_features(set(borrowers) | set(rows))
+            database.save_neighbors(top_neighbors(rows, borrowers, features))
+        stats["books"] = len(touched)
+        stats["cells"] = sum(len(row) for row in deltas.values())
+    stats["seconds"] = round(time.monotonic() - started, 2)
+    return stats
+
+
+def start_background(interval=86400):
+    """Run update_index() now and then every `interval` seconds on a daemon thread."""
+    def loop():
+        while True:
+            try:
+                stats = update_index()
+                if stats and stats["loans"]:
+                    print("Recommender:", stats)
+            except Exception as e:
+                print("Recommender update failed:", e)
+            time.sleep(interval)
+    thread = threading.Thread(target=loop, name="recommender", daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Update the book similarity index")
+    parser.add_argument("--rebuild", action="store_true", help="recount all loan history")
+    parser.add_argument("--every", type=float, help="repeat every N seconds instead of running once")
+    args = parser.parse_args(argv)
+
+    if not database.is_connected():
+        print("Note: PostgreSQL not reachable — indexing the demo data")
+    rebuild = args.rebuild
+    while True:
+        print(json.dumps(update_index(rebuild=rebuild)))
+        if not args.every:
+            break
+        rebuild = False
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+# records.py
+# ROW RECORDS – compact __slots__ classes for the rows database.py hands out
+#
+# A slotted record has no per-instance __dict__, so a million Book rows cost a
+# fraction of the same rows as dicts, and the views read plain attributes
+# (book.title) instead of hashing a key per cell. Queries return plain tuples
+# and row_factory(columns) turns them into records with the column → field
+# mapping worked out once per query.
+from operator import itemgetter
+
+
+class Record:
+    __slots__ = ()
+    ALIASES = {}      # SQL column name -> field name, e.g. book_title -> title
+
+    @classmethod
+    def row_factory(cls, columns):
+        """Return a function tuple -> record for rows whose columns are named `columns`."""
+        columns = [cls.ALIASES.get(c, c) for c in columns]
+        if columns == list(cls.__slots__[:len(columns)]):
+            return lambda row: cls(*row)
+        known = [(i, c) for i, c in enumerate(columns) if c in cls.__slots__]
+        if not known:
+            return lambda row: cls()
+        names = [c for _, c in known]
+        pick = itemgetter(*[i for i, _ in known])
+        if len(known) == 1:
+            return lambda row: cls(**{names[0]: pick(row)})
+        return lambda row: cls(**dict(zip(names, pick(row))))
+
+    @classmethod
+    def from_dict(cls, row):
+        """Record from a dict row (demo store, change feed); unknown keys are ignored."""
+        return cls(**{cls.ALIASES.get(k, k): v for k, v in row.items()
+                      if cls.ALIASES.get(k, k) in cls.__slots__})
+
+    def updated(self, changes):
+        """Copy with the known fields of `changes` (e.g. a change-feed row) applied."""
+        copy = self.__class__(*(getattr(self, f) for f in self.__slots__))
+        for key, value in changes.items():
+            if key in self.__slots__:
+                setattr(copy, key, value)
+        return copy
+
+    def as_dict(self):
+        return {f: getattr(self, f) for f in self.__slots__}
+
+    def __eq__(self, other):
+        return type(other) is type(self) and all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
+
+    def __repr__(self):
+        fields = ", ".join(f"{f}={getattr(self, f)!r}" for f in self.__slots__)
+        return f"{self.__class__.__name__}({fields})"
+
+
+class Book(Record):
+    __slots__ = ("book_id", "title", "author_name", "isbn", "genre", "published_year", "copies_available")
+
+    def __init__(self, book_id=None, title=None, author_name=None, isbn=None, genre=None,
+                 published_year=None, copies_available=0):
+        self.book_id = book_id
+        self.title = title
+        self.author_name = author_name
+        self.isbn = isbn
+        self.genre = genre
+        self.published_year = published_year
+        self.copies_available = copies_available
+
+
+class Loan(Record):
+    """
+    Open loan; member views leave member_name empty, the librarian view fills it.
+    days_overdue (negative = days left) and fine come from the overdue job.
+    """
+    __slots__ = ("loan_id", "title", "member_name", "loan_date", "due_date",
+                 "book_id", "member_id", "return_date", "days_overdue", "fine")
+    ALIASES = {"book_title": "title"}
+
+    def __init__(self, loan_id=None, title=None, member_name=None, loan_date=None, due_date=None,
+                 book_id=None, member_id=None, return_date=None, days_overdue=0, fine=0):
+        self.loan_id = loan_id
+        self.title = title
+        self.member_name = member_name
+        self.loan_date = loan_date
+        self.due_date = due_date
+        self.book_id = book_id
+        self.member_id = member_id
+        self.return_date = return_date
+        self.days_overdue = days_overdue
+        self.fine = fine
+
+
+class Member(Record):
+    __slots__ = ("member_id", "full_name", "email")
+
+    def __init__(self, member_id=None, full_name=None, email=None):
+        self.member_id = member_id
+        self.full_name = full_name
+        self.email = email
+
+
+class Club(Record):
+    __slots__ = ("club_id", "name", "description", "member_count")
+
+    def __init__(self, club_id=None, name=None, description=None, member_count=0):
+        self.club_id = club_id
+        self.name = name
+        self.description = description
+        self.member_count = member_count
+
+
+class Hold(Record):
+    """A member's place in a title's hold queue; position is set while status is 'waiting'."""
+    __slots__ = ("hold_id", "book_id", "member_id", "title", "status", "position", "placed_at", "ready_until")
+
+    def __init__(self, hold_id=None, book_id=None, member_id=None, title=None, status=None,
+                 position=None, placed_at=None, ready_until=None):
+        self.hold_id = hold_id
+        self.book_id = book_id
+        self.member_id = member_id
+        self.title = title
+        self.status = status
+        self.position = position
+        self.placed_at = placed_at
+        self.ready_until = ready_until
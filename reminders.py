@@ -0,0 +1,236 @@
+# reminders.py
+# REMINDER PIPELINE – due-soon / overdue loans → rendered messages → pluggable sender
+#
+#   python reminders.py --sink reminders.jsonl              # write messages to a file
+#   python reminders.py --smtp localhost:1025 --rate 20     # local SMTP stand-in
+#   python reminders.py --sink out.jsonl --every 3600       # keep running hourly
+#
+# Loans are selected in keyset-paged batches (database.get_reminder_batch), each
+# message is claimed in the reminders_sent ledger before it is sent (idempotency
+# key per loan, kind and due date) and released again if the send fails, so a
+# member is never reminded twice for the same thing and failures are retried.
+import argparse
+import json
+import smtplib
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+
+import database
+
+BATCH_SIZE = 500
+WORKERS = 4          # concurrent sends
+RATE = 10.0          # messages per second across all workers
+SENDER = "library@smartlibrary.local"
+
+TEMPLATES = {
+    "due_soon": ("Reminder: \"{title}\" is due {due_date}",
+                 "Hello {full_name},\n\n\"{title}\" is due back on {due_date}.\n"
+                 "Please return or renew it on time.\n\nSmartLibrary"),
+    "overdue": ("Overdue: \"{title}\" was due {due_date}",
+                "Hello {full_name},\n\n\"{title}\" was due on {due_date} and is {days_overdue} day(s) overdue.\n"
+                "Fine so far: {fine:.2f}. Please return it as soon as possible.\n\nSmartLibrary"),
+}
+
+
+def render(row):
+    subject, body = TEMPLATES[row["kind"]]
+    fields = {**row, "fine": float(row["fine"] or 0), "due_date": str(row["due_date"])[:10]}
+    return {"key": row["key"], "to": row["email"], "subject": subject.format(**fields), "body": body.format(**fields)}
+
+
+# ────────────────────── SENDERS ──────────────────────
+# A sender has send(message) and close(); send raises on failure.
+class FileSink:
+    """Appends each message as one JSON line — for demos, tests and dry runs."""
+
+    def __init__(self, path):
+        self._f = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        line = json.dumps({**message, "sent_at": time.strftime("%Y-%m-%dT%H:%M:%S")})
+        with self._lock:
+            self._f.write(line + "\n")
+            self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+class SmtpSender:
+    """One SMTP connection per worker thread, reopened if the server drops it."""
+
+    def __init__(self, host="localhost", port=1025, sender=SENDER, timeout=10):
+        self.host, self.port, self.sender, self.timeout = host, port, sender, timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def send(self, message):
+        email = EmailMessage()
+        email["From"], email["To"], email["Subject"] = self.sender, message["to"], message["subject"]
+        email["Message-ID"] = f"<{message['key']}@smartlibrary>"
+        email.set_content(message["body"])
+        try:
+            self._connection().send_message(email)
+        except smtplib.SMTPServerDisconnected:
+            self._local.conn = None
+            self._connection().send_message(email)
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                try:
+                    conn.quit()
+                except smtplib.SMTPException:
+                    pass
+            self._connections.clear()
+
+
+# ────────────────────── RATE LIMIT ──────────────────────
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# ────────────────────── PIPELINE ──────────────────────
+class Metrics:
+    def __init__(self):
+        self.selected = self.sent = self.skipped = self.failed = 0
+        self.send_seconds = 0.0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, outcome, seconds=0.0):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            self.send_seconds += seconds
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = time.monotonic() - self.started
+            return {
+                "selected": self.selected, "sent": self.sent, "skipped": self.skipped, "failed": self.failed,
+                "seconds": round(elapsed, 2),
+                "per_second": round(self.sent / elapsed, 1) if elapsed else 0.0,
+                "avg_send_ms": round(1000 * self.send_seconds / self.sent, 1) if self.sent else 0.0,
+            }
+
+
+def _dispatch(row, sender, bucket, metrics):
+    if not database.claim_reminder(row["key"], row["loan_id"], row["member_id"], row["kind"]):
+        metrics.add("skipped")   # another run got there first
+        return
+    message = render(row)
+    bucket.acquire()
+    started = time.monotonic()
+    try:
+        sender.send(message)
+    except Exception as e:
+        print(f"Reminder {row['key']} to {row['email']} failed:", e)
+        database.release_reminder(row["key"])
+        metrics.add("failed")
+    else:
+        metrics.add("sent", time.monotonic() - started)
+
+
+def run_reminders(sender, batch_size=BATCH_SIZE, workers=WORKERS, rate=RATE,
+                  due_within=database.REMINDER_DUE_SOON_DAYS):
+    """Send every pending reminder once. Returns the metrics snapshot."""
+    metrics = Metrics()
+    bucket = TokenBucket(rate)
+    # At most two batches in flight: selection stays ahead of the workers without buffering everything
+    in_flight = threading.BoundedSemaphore(2 * batch_size)
+    after = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reminder") as pool:
+        while True:
+            batch = database.get_reminder_batch(after, batch_size, due_within)
+            if not batch:
+                break
+            metrics.selected += len(batch)
+            for row in batch:
+                in_flight.acquire()
+                future = pool.submit(_dispatch, row, sender, bucket, metrics)
+                future.add_done_callback(lambda _: in_flight.release())
+            after = batch[-1]["loan_id"]
+    return metrics.snapshot()
+
+
+def start_background(sender, interval=3600, **options):
+    """Run the pipeline every `interval` seconds on a daemon thread."""
+    def loop():
+        while True:
+            try:
+                print("Reminders:", run_reminders(sender, **options))
+            except Exception as e:
+                print("Reminder run failed:", e)
+            time.sleep(interval)
+    thread = threading.Thread(target=loop, name="reminders", daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send due-soon and overdue reminders")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--sink", help="append messages to this JSONL file")
+    target.add_argument("--smtp", help="host:port of an SMTP server (e.g. a local stand-in)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--rate", type=float, default=RATE, help="messages per second")
+    parser.add_argument("--due-within", type=int, default=database.REMINDER_DUE_SOON_DAYS, help="days")
+    parser.add_argument("--every", type=float, help="repeat every N seconds instead of running once")
+    args = parser.parse_args(argv)
+
+    if args.sink:
+        sender = FileSink(args.sink)
+    else:
+        host, _, port = args.smtp.partition(":")
+        sender = SmtpSender(host, int(port or 25))
+    if not database.is_connected():
+        print("Note: PostgreSQL not reachable — reminding from the demo data")
+    options = {"batch_size": args.batch_size, "workers": args.workers, "rate": args.rate,
+               "due_within": args.due_within}
+    try:
+        while True:
+            database.refresh_overdue()   # fines in the messages are current
+            print(json.dumps(run_reminders(sender, **options)))
+            if not args.every:
+                break
+            time.sleep(args.every)
+    finally:
+        sender.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+# search_worker.py
+# DEBOUNCED BACKGROUND SEARCH – keeps catalog queries off the GUI thread
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+
+SEARCH_DELAY_MS = 250   # wait this long after the last keystroke before querying
+
+
+class _SearchSignals(QObject):
+    # Lives in the GUI thread; emits from the worker are queued back to it
+    finished = pyqtSignal(int, str, object)   # generation, search text, rows
+    failed = pyqtSignal(int, str)
+
+
+class _SearchTask(QRunnable):
+    def __init__(self, generation, fetch, text, signals, latest):
+        super().__init__()
+        self.generation = generation
+        self.fetch = fetch
+        self.text = text
+        self.signals = signals
+        self.latest = latest
+
+    def run(self):
+        # Newer text arrived while this task sat in the queue — skip the query entirely
+        if self.generation != self.latest():
+            return
+        try:
+            rows = self.fetch(self.text)
+        except Exception as e:
+            self.signals.failed.emit(self.generation, str(e))
+        else:
+            self.signals.finished.emit(self.generation, self.text, rows)
+
+
+class DebouncedSearch(QObject):
+    """
+    request(text) restarts a short timer; when typing pauses the query runs on
+    QThreadPool. Every launch bumps a generation counter, so tasks that are
+    still queued are skipped and results from older in-flight queries are
+    dropped — only the latest search ever reaches `results`.
+    """
+    results = pyqtSignal(str, object)   # search text, rows
+    error = pyqtSignal(str)
+
+    def __init__(self, fetch, delay_ms=SEARCH_DELAY_MS, parent=None):
+        super().__init__(parent)
+        self.fetch = fetch
+        self._text = ""
+        self._generation = 0
+        self._pool = QThreadPool.globalInstance()
+        self._signals = _SearchSignals(self)
+        self._signals.finished.connect(self._on_finished)
+        self._signals.failed.connect(self._on_failed)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay_ms)
+        self._timer.timeout.connect(self._launch)
+
+    def request(self, text):
+        self._text = text
+        self._timer.start()
+
+    def run_now(self, text=None):
+        """Skip the debounce (initial load, refresh after a borrow)."""
+        if text is not None:
+            self._text = text
+        self._timer.stop()
+        self._launch()
+
+    def _latest(self):
+        return self._generation
+
+    def _launch(self):
+        self._generation += 1
+        self._pool.start(_SearchTask(self._generation, self.fetch, self._text, self._signals, self._latest))
+
+    def _on_finished(self, generation, text, rows):
+        if generation == self._generation:
+            self.results.emit(text, rows)
+
+    def _on_failed(self, generation, message):
+        if generation == self._generation:
+            self.error.emit(message)
+
+
+class PeriodicQuery(DebouncedSearch):
+    """
+    Re-runs fetch() off the GUI thread every interval_ms (dashboard counters).
+    `results` emits ("", value); a slow run is superseded by the next one like a search.
+    """
+
+    def __init__(self, fetch, interval_ms, parent=None):
+        super().__init__(lambda _text: fetch(), delay_ms=0, parent=parent)
+        self._interval = QTimer(self)
+        self._interval.timeout.connect(self.run_now)
+        self._interval.start(interval_ms)
+
+
+class _BatchTask(QRunnable):
+    def __init__(self, batch, fetch, keys, signals):
+        super().__init__()
+        self.batch = batch
+        self.fetch = fetch
+        self.keys = keys
+        self.signals = signals
+
+    def run(self):
+        try:
+            rows = self.fetch(self.keys)
+        except Exception as e:
+            self.signals.failed.emit(self.batch, str(e))
+        else:
+            self.signals.finished.emit(self.batch, "", (self.keys, rows))
+
+
+class BatchedLookup(QObject):
+    """
+    request(key) collects keys for delay_ms; then fetch(keys) runs once for the
+    whole batch on QThreadPool and `results` emits (keys, rows) on the GUI
+    thread. Keys requested while a batch is in flight go into the next one, and
+    a key is only reported from the latest batch that asked for it.
+    """
+    results = pyqtSignal(object, object)   # keys (tuple), rows
+    error = pyqtSignal(str)
+
+    def __init__(self, fetch, delay_ms=SEARCH_DELAY_MS, parent=None):
+        super().__init__(parent)
+        self.fetch = fetch
+        self._pending = set()
+        self._batch = 0
+        self._latest = {}   # key -> batch that last fetched it
+        self._pool = QThreadPool.globalInstance()
+        self._signals = _SearchSignals(self)
+        self._signals.finished.connect(self._on_finished)
+        self._signals.failed.connect(self._on_failed)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay_ms)
+        self._timer.timeout.connect(self._launch)
+
+    def request(self, key):
+        self._pending.add(key)
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def _launch(self):
+        keys, self._pending = tuple(sorted(self._pending)), set()
+        if not keys:
+            return
+        self._batch += 1
+        for key in keys:
+            self._latest[key] = self._batch
+        self._pool.start(_BatchTask(self._batch, self.fetch, keys, self._signals))
+
+    def _settle(self, batch, keys):
+        current = tuple(k for k in keys if self._latest.get(k) == batch)
+        for key in current:
+            del self._latest[key]
+        return current
+
+    def _on_finished(self, batch, _text, result):
+        keys, rows = result
+        keys = self._settle(batch, keys)
+        if keys:
+            self.results.emit(keys, rows)
+
+    def _on_failed(self, batch, message):
+        self._latest = {k: b for k, b in self._latest.items() if b != batch}
+        self.error.emit(message)
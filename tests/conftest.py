@@ -0,0 +1,30 @@
+# tests/conftest.py
+# Every test runs in demo mode on a fresh in-memory DemoStore — no PostgreSQL,
+# no demo log or replica file on disk, an empty query cache.
+#
+#   python -m pytest -q
+import os
+import sys
+
+os.environ["SMARTLIB_DEMO_STORE_PATH"] = ""
+os.environ["SMARTLIB_REPLICA_PATH"] = ""
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import database
+
+
+@pytest.fixture(autouse=True)
+def demo(monkeypatch):
+    store = database.DemoStore(None, database.DEMO_SEED).open()
+    monkeypatch.setattr(database, "demo", store)
+    monkeypatch.setattr(database, "catalog", store.books)
+    monkeypatch.setattr(database, "DB_CONNECTED", False)
+    monkeypatch.setattr(database, "OFFLINE", False)
+    monkeypatch.setattr(database, "replica", None)
+    monkeypatch.setattr(database, "_hold_queues", {})
+    monkeypatch.setattr(database, "_overdue", {})
+    database.cache.clear()
+    yield store
+    database.cache.clear()
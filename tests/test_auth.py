@@ -0,0 +1,183 @@
+# tests/test_auth.py
+# Login rate limiter (reservations, lockout, window) and the session cache
+import threading
+import time
+
+import psycopg2
+import pytest
+
+import auth
+import database
+from auth import LoginResult, RateLimiter, SessionCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = Clock()
+    monkeypatch.setattr(auth.time, "monotonic", fake)
+    return fake
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(auth, "limiter", RateLimiter())
+    monkeypatch.setattr(auth, "sessions", SessionCache())
+
+
+def _fail(limiter, username, times=1):
+    for _ in range(times):
+        assert limiter.begin(username)
+        limiter.finish(username, False)
+
+
+# ────────────── RateLimiter ──────────────
+def test_locks_after_max_failures(clock):
+    limiter = RateLimiter(max_failures=3, window=60, lockout=300)
+    _fail(limiter, "john@example.com", 2)
+    assert limiter.retry_after("john@example.com") == 0
+    _fail(limiter, "john@example.com")
+
+    assert limiter.retry_after("John@Example.com ") == 300   # same account, however it is typed
+    assert not limiter.begin("john@example.com")
+    clock.now += 300
+    assert limiter.begin("john@example.com")
+
+
+def test_failures_age_out_of_the_window(clock):
+    limiter = RateLimiter(max_failures=3, window=60, lockout=300)
+    _fail(limiter, "jane@example.com", 2)
+    clock.now += 61
+    _fail(limiter, "jane@example.com", 2)
+    assert limiter.retry_after("jane@example.com") == 0
+
+
+def test_success_clears_failures(clock):
+    limiter = RateLimiter(max_failures=3)
+    _fail(limiter, "jane@example.com", 2)
+    assert limiter.begin("jane@example.com")
+    limiter.finish("jane@example.com", True)
+    _fail(limiter, "jane@example.com", 2)
+    assert limiter.retry_after("jane@example.com") == 0
+
+
+def test_attempts_in_flight_count_against_the_limit(clock):
+    limiter = RateLimiter(max_failures=3)
+    assert [limiter.begin("john@example.com") for _ in range(4)] == [True, True, True, False]
+    limiter.finish("john@example.com", True)
+    assert limiter.begin("john@example.com")
+
+
+def test_unchecked_attempt_only_frees_its_reservation(clock):
+    limiter = RateLimiter(max_failures=2)
+    for _ in range(5):
+        assert limiter.begin("john@example.com")
+        limiter.finish("john@example.com", None)
+    assert limiter.retry_after("john@example.com") == 0
+
+
+def test_accounts_are_bounded(clock):
+    limiter = RateLimiter(max_accounts=2)
+    for name in ("a", "b", "c"):
+        _fail(limiter, name)
+    assert len(limiter._accounts) == 2
+
+
+# ────────────── login() ──────────────
+def test_login_opens_a_session():
+    result, user = auth.login("john@example.com", "123")
+    assert result is LoginResult.SUCCESS
+    assert auth.session(user["token"])["member_id"] == 1
+    assert auth.logout(user["token"])
+    assert auth.session(user["token"]) is None
+
+
+def test_wrong_password_is_invalid_then_locked():
+    results = [auth.login("jane@example.com", "nope")[0] for _ in range(auth.MAX_FAILURES)]
+    assert results == [LoginResult.INVALID] * (auth.MAX_FAILURES - 1) + [LoginResult.LOCKED]
+    assert auth.login("jane@example.com", "123") == (LoginResult.LOCKED, None)   # even the right password
+
+
+def test_database_errors_are_not_failed_attempts(monkeypatch):
+    authenticate = database.authenticate_user
+
+    def broken(username, password):
+        raise psycopg2.errors.UndefinedTable("relation \"users\" does not exist")
+
+    monkeypatch.setattr(database, "authenticate_user", broken)
+    results = [auth.login("john@example.com", "123")[0] for _ in range(auth.MAX_FAILURES + 1)]
+    assert results == [LoginResult.ERROR] * (auth.MAX_FAILURES + 1)
+
+    monkeypatch.setattr(database, "authenticate_user", authenticate)   # database back
+    assert auth.login("john@example.com", "123")[0] is LoginResult.SUCCESS
+
+
+def test_parallel_guesses_cannot_pass_the_lockout(monkeypatch):
+    checked = []
+    gate = threading.Barrier(4)
+    authenticate = database.authenticate_user
+
+    def slow_authenticate(username, password):
+        checked.append(password)
+        time.sleep(0.01)   # hashing time, so the guesses overlap
+        return authenticate(username, password)
+
+    monkeypatch.setattr(database, "authenticate_user", slow_authenticate)
+
+    def guess(i):
+        gate.wait()
+        for n in range(10):
+            auth.login("john@example.com", f"guess-{i}-{n}")
+
+    threads = [threading.Thread(target=guess, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(checked) == auth.MAX_FAILURES
+    assert auth.limiter.retry_after("john@example.com") > 0
+
+
+# ────────────── SessionCache ──────────────
+def test_idle_sessions_expire(clock):
+    sessions = SessionCache(idle=60)
+    token = sessions.open({"username": "john@example.com"})
+    clock.now += 59
+    assert sessions.get(token)["username"] == "john@example.com"   # use extends the session
+    clock.now += 59
+    assert sessions.get(token) is not None
+    clock.now += 61
+    assert sessions.get(token) is None
+
+
+def test_least_recently_used_session_is_evicted(clock):
+    sessions = SessionCache(max_entries=2)
+    first, second = sessions.open({"username": "a"}), sessions.open({"username": "b"})
+    sessions.get(first)
+    sessions.open({"username": "c"})
+    assert sessions.get(second) is None
+    assert sessions.get(first) is not None
+
+
+def test_close_user_ends_all_their_sessions(clock):
+    sessions = SessionCache()
+    tokens = [sessions.open({"username": "john@example.com"}) for _ in range(2)]
+    other = sessions.open({"username": "jane@example.com"})
+    sessions.close_user("john@example.com")
+    assert [sessions.get(t) for t in tokens] == [None, None]
+    assert sessions.get(other) is not None
+
+
+def test_sessions_hand_out_copies(clock):
+    sessions = SessionCache()
+    token = sessions.open({"username": "john@example.com", "role": "Member"})
+    sessions.get(token)["role"] = "Librarian"
+    assert sessions.get(token)["role"] == "Member"
@@ -0,0 +1,116 @@
+# tests/test_cache_tags.py
+# QueryCache tag invalidation, and the tags database.py's writes and the change feed drop
+import database
+from query_cache import QueryCache
+
+
+def _misses(name):
+    return database.cache.stats()["by_function"].get(name, {}).get("misses", 0)
+
+
+def test_invalidate_drops_only_tagged_entries():
+    cache = QueryCache()
+    calls = []
+
+    @cache.cached("books")
+    def books():
+        calls.append("books")
+        return ["b"]
+
+    @cache.cached("clubs")
+    def clubs():
+        calls.append("clubs")
+        return ["c"]
+
+    books(), clubs(), books(), clubs()
+    assert calls == ["books", "clubs"]
+    cache.invalidate("books")
+    books(), clubs()
+    assert calls == ["books", "clubs", "books"]
+
+
+def test_callable_tag_is_per_argument():
+    cache = QueryCache()
+    calls = []
+
+    @cache.cached(lambda member_id: f"member:{member_id}")
+    def loans(member_id):
+        calls.append(member_id)
+        return [member_id]
+
+    loans(1), loans(2)
+    cache.invalidate("member:1")
+    loans(1), loans(2)
+    assert calls == [1, 2, 1]
+
+
+def test_write_during_read_is_not_cached():
+    cache = QueryCache()
+
+    @cache.cached("books")
+    def books():
+        cache.invalidate("books")   # a write lands while the read is in flight
+        return ["stale"]
+
+    books()
+    assert cache.stats()["entries"] == 0
+
+
+def test_cached_list_is_a_copy():
+    cache = QueryCache()
+
+    @cache.cached("books")
+    def books():
+        return [1, 2]
+
+    books().append(3)
+    assert books() == [1, 2]
+
+
+def test_issue_loan_invalidates_books_loans_and_that_member():
+    database.get_all_books()
+    database.get_member_loans(1)
+    database.get_member_loans(2)
+    database.get_all_clubs()
+    before = {name: _misses(name) for name in ("get_all_books", "get_member_loans", "get_all_clubs")}
+
+    assert database.issue_loan(1, 1)
+    database.get_all_books()
+    database.get_member_loans(1)
+    database.get_member_loans(2)
+    database.get_all_clubs()
+
+    assert _misses("get_all_books") == before["get_all_books"] + 1
+    assert _misses("get_member_loans") == before["get_member_loans"] + 1   # member 1 only
+    assert _misses("get_all_clubs") == before["get_all_clubs"]
+    assert [loan.book_id for loan in database.get_member_loans(1)] == [1]
+
+
+def test_return_loan_is_visible_to_the_next_read():
+    database.issue_loan(2, 1)
+    loan_id = database.get_member_loans(1)[0].loan_id
+    copies = {b.book_id: b.copies_available for b in database.get_all_books()}
+
+    database.return_loan(loan_id)
+
+    assert database.get_member_loans(1) == []
+    assert {b.book_id: b.copies_available for b in database.get_all_books()}[2] == copies[2] + 1
+
+
+def test_change_feed_event_invalidates_member_tag():
+    database.get_member_loans(1)
+    database.get_member_loans(2)
+    misses = _misses("get_member_loans")
+
+    database._invalidate_for_change({"table": "loans", "op": "INSERT", "row": {"loan_id": 9, "member_id": 2}})
+    database.get_member_loans(1)
+    database.get_member_loans(2)
+
+    assert _misses("get_member_loans") == misses + 1
+
+
+def test_resync_event_clears_everything():
+    database.get_all_books()
+    database.get_all_clubs()
+    database._invalidate_for_change(database.RESYNC_EVENT)
+    assert database.cache.stats()["entries"] == 0
@@ -0,0 +1,69 @@
+# tests/test_gui_trace.py
+# Instrumented slots still work when the signal sends more arguments than they take
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import pytest
+from PyQt5.QtWidgets import QApplication, QPushButton
+
+import gui_trace
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def tracer(tmp_path, monkeypatch):
+    tracer = gui_trace.Tracer(str(tmp_path / "trace.json"))
+    for path, names in gui_trace.TRACED_SLOTS.items():
+        module_name, class_name = path.rsplit(".", 1)
+        cls = getattr(__import__(module_name), class_name)
+        for name in names:
+            if name in vars(cls):
+                monkeypatch.setattr(cls, name, vars(cls)[name])   # undone after the test
+    tracer.instrument()
+    return tracer
+
+
+def _button(window, text):
+    return next(b for b in window.findChildren(QPushButton) if b.text() == text)
+
+
+def test_clicking_instrumented_buttons(app, tracer):
+    from dashboard_librarian import LibrarianDashboard
+
+    window = LibrarianDashboard({"username": "admin@limkokwing.edu", "role": "Librarian"})
+    try:
+        _button(window, "Refresh Loans").click()       # clicked(bool) → load_loans(self)
+        _button(window, "Refresh Clubs").click()
+        window.overdue_only.setChecked(True)            # toggled(bool) → load_loans(self)
+        window.apply_change({"table": "books", "op": "UPDATE", "row": {"book_id": 1, "copies_available": 4}})
+    finally:
+        window.live_updates.stop()
+        window.close()
+
+    spans = [e["name"] for e in tracer.events if e["cat"] == "slot"]
+    assert spans.count("LibrarianDashboard.load_loans") >= 3   # tab setup, button, checkbox
+    assert "LibrarianDashboard.load_clubs" in spans
+    assert "LibrarianDashboard.apply_change" in spans
+
+
+def test_wrapper_passes_only_accepted_arguments(tracer):
+    class View:
+        def no_args(self):
+            return "ok"
+
+        def one_arg(self, value):
+            return value
+
+        def var_args(self, *values):
+            return values
+
+    wrap = lambda fn: tracer.wrap(fn, fn.__name__, None)
+    view = View()
+    assert wrap(View.no_args)(view, False) == "ok"
+    assert wrap(View.one_arg)(view, 1, 2) == 1
+    assert wrap(View.var_args)(view, 1, 2) == (1, 2)
@@ -0,0 +1,116 @@
+# tests/test_holds.py
+# Hold queue: FIFO order, copies set aside on return, pickup expiry passing the
+# copy down the line, cancellation, and the "holds" cache tag on checkouts
+from datetime import date, timedelta
+
+import database
+from database import HoldResult, LoanResult
+
+
+def _members(demo, count):
+    for member_id in range(3, 3 + count):
+        demo.add("members", {"member_id": member_id, "full_name": f"Member {member_id}",
+                             "email": f"member{member_id}@example.com"})
+
+
+def _last_copy_on_loan(demo, book_id=2, member_id=1):
+    """Book 2 with its only copy checked out; returns that loan_id."""
+    demo.update("books", book_id, copies_available=1)
+    assert database.issue_loan(book_id, member_id) is LoanResult.SUCCESS
+    return database.get_member_loans(member_id)[0].loan_id
+
+
+def _copies(book_id=2):
+    return next(b.copies_available for b in database.get_all_books() if b.book_id == book_id)
+
+
+def _statuses(member_ids, book_id=2):
+    return [next((h.status for h in database.get_member_holds(m) if h.book_id == book_id), None)
+            for m in member_ids]
+
+
+def test_hold_needs_an_empty_shelf(demo):
+    assert database.place_hold(2, 2)["status"] is HoldResult.AVAILABLE
+    _last_copy_on_loan(demo)
+    assert database.place_hold(2, 2)["status"] is HoldResult.PLACED
+    assert database.place_hold(2, 2)["status"] is HoldResult.ALREADY_HELD
+
+
+def test_queue_is_first_come_first_served(demo):
+    _members(demo, 3)
+    loan_id = _last_copy_on_loan(demo)
+    holds = [database.place_hold(2, m) for m in (2, 3, 4, 5)]
+    assert [h["position"] for h in holds] == [1, 2, 3, 4]
+
+    database.return_loan(loan_id)
+
+    assert _statuses([2, 3, 4, 5]) == ["ready", "waiting", "waiting", "waiting"]
+    assert [database.get_queue_position(h["hold_id"]) for h in holds[1:]] == [1, 2, 3]
+    assert _copies() == 0   # the copy is kept for the hold
+
+
+def test_ready_hold_is_collected_by_its_member_only(demo):
+    _members(demo, 1)
+    loan_id = _last_copy_on_loan(demo)
+    database.place_hold(2, 2)
+    database.return_loan(loan_id)
+
+    assert database.issue_loan(2, 3) is LoanResult.NO_COPIES
+    assert database.issue_loan(2, 2) is LoanResult.SUCCESS
+    assert database.get_member_holds(2) == []
+
+
+def test_cancelled_waiting_hold_leaves_the_queue(demo):
+    _members(demo, 2)
+    _last_copy_on_loan(demo)
+    first, second, third = (database.place_hold(2, m) for m in (2, 3, 4))
+
+    assert database.cancel_hold(second["hold_id"], 3)
+    assert not database.cancel_hold(second["hold_id"], 3)
+    assert database.get_queue_position(third["hold_id"]) == 2
+
+
+def test_cancelled_ready_hold_passes_the_copy_on(demo):
+    _members(demo, 1)
+    loan_id = _last_copy_on_loan(demo)
+    first, second = database.place_hold(2, 2), database.place_hold(2, 3)
+    database.return_loan(loan_id)
+
+    assert not database.cancel_hold(first["hold_id"], 3)   # not theirs
+    assert database.cancel_hold(first["hold_id"], 2)
+    assert _statuses([2, 3]) == [None, "ready"]
+
+
+def test_expired_pickup_moves_down_the_queue(demo):
+    _members(demo, 1)
+    loan_id = _last_copy_on_loan(demo)
+    first, second = database.place_hold(2, 2), database.place_hold(2, 3)
+    database.return_loan(loan_id)
+    assert database.expire_holds() == 0   # still within the pickup window
+
+    demo.update("holds", first["hold_id"], ready_until=str(date.today() - timedelta(days=1)))
+    assert database.expire_holds() == 1
+
+    assert demo.holds.get(first["hold_id"])["status"] == "expired"
+    assert _statuses([2, 3]) == [None, "ready"]
+
+
+def test_last_expiry_puts_the_copy_back_on_the_shelf(demo):
+    loan_id = _last_copy_on_loan(demo)
+    hold = database.place_hold(2, 2)
+    database.return_loan(loan_id)
+    demo.update("holds", hold["hold_id"], ready_until=str(date.today() - timedelta(days=1)))
+
+    assert database.expire_holds() == 1
+    assert _copies() == 1
+
+
+def test_checkout_invalidates_cached_holds(demo):
+    _last_copy_on_loan(demo)
+    database.place_hold(2, 2)
+    assert [h.status for h in database.get_member_holds(2)] == ["waiting"]   # now cached
+
+    demo.update("books", 2, copies_available=1)   # a copy turns up
+    assert database.issue_loan(2, 2) is LoanResult.SUCCESS
+
+    assert database.get_member_holds(2) == []     # the waiting hold was fulfilled
@@ -0,0 +1,225 @@
+# tests/test_offline_replay.py
+# sync_offline_writes(): journal order, temp-id mapping, conflicts, and no double
+# apply after a crash. PostgreSQL is an in-memory FakeServer: the online writes
+# are replaced, but _record_replay()/_replayed() run against its offline_writes.
+from contextlib import contextmanager
+
+import psycopg2
+import pytest
+
+import database
+from database import LoanResult
+from local_replica import LocalReplica
+
+
+class FakeServer:
+    def __init__(self):
+        self.offline_writes = {}          # (replica_id, seq) -> row
+        self.copies = {1: 1}              # book_id -> copies on the shelf
+        self.open_loans = {}              # loan_id -> book_id
+        self.calls = []
+        self.down = False
+
+    @contextmanager
+    def cursor(self, commit=False, cursor_factory=None):
+        if self.down:
+            raise psycopg2.OperationalError("server closed the connection")
+        yield _FakeCursor(self)
+
+    def add_book(self, title, author_name, isbn="", genre="", year=2025, copies=1):
+        with self.cursor() as cur:
+            book_id = 100 + len(self.copies)
+            self.copies[book_id] = copies
+            self.calls.append(("add_book", title))
+            database._record_replay(cur, "applied", book_id)
+        return book_id
+
+    def issue_loans(self, member_id, book_ids):
+        with self.cursor() as cur:
+            book_id = book_ids[0]
+            self.calls.append(("issue_loan", book_id))
+            if self.copies.get(book_id, 0) <= 0:
+                database._record_replay(cur, "no_copies", None)
+                return [{"book_id": book_id, "status": LoanResult.NO_COPIES, "loan_id": None}]
+            self.copies[book_id] -= 1
+            loan_id = 500 + len(self.calls)
+            self.open_loans[loan_id] = book_id
+            database._record_replay(cur, "success", loan_id)
+        return [{"book_id": book_id, "status": LoanResult.SUCCESS, "loan_id": loan_id}]
+
+    def return_loans(self, loan_ids):
+        with self.cursor() as cur:
+            loan_id = loan_ids[0]
+            self.calls.append(("return_loan", loan_id))
+            book_id = self.open_loans.pop(loan_id, None)
+            if book_id is not None:
+                self.copies[book_id] += 1
+            status = "returned" if book_id is not None else "not_found"
+            database._record_replay(cur, status)
+        return [{"loan_id": loan_id, "status": status}]
+
+
+class _FakeCursor:
+    def __init__(self, server):
+        self.server = server
+        self.row = None
+
+    def execute(self, sql, params):
+        if sql.startswith("INSERT INTO offline_writes"):
+            replica_id, seq, status, result_id = params
+            assert (replica_id, seq) not in self.server.offline_writes, "journal entry applied twice"
+            self.server.offline_writes[(replica_id, seq)] = {"status": status, "result_id": result_id}
+        else:
+            self.row = self.server.offline_writes.get(tuple(params))
+
+    def fetchone(self):
+        return self.row
+
+
+def _synced_replica(path):
+    local = LocalReplica(path)
+    local.load_snapshot(
+        [{"book_id": 1, "title": "1984", "author_name": "George Orwell", "isbn": "123", "genre": "Dystopia",
+          "published_year": 1949, "copies_available": 1}],
+        [{"member_id": 1, "full_name": "John Doe", "email": "john@example.com"}], [], [])
+    return local
+
+
+@pytest.fixture
+def replica(tmp_path, monkeypatch):
+    local = _synced_replica(str(tmp_path / "replica.db"))
+    monkeypatch.setattr(database, "replica", local)
+    return local
+
+
+def _fake_server(monkeypatch):
+    fake = FakeServer()
+    monkeypatch.setattr(database, "get_cursor", fake.cursor)
+    monkeypatch.setattr(database, "add_book", fake.add_book)
+    monkeypatch.setattr(database, "issue_loans", fake.issue_loans)
+    monkeypatch.setattr(database, "return_loans", fake.return_loans)
+    return fake
+
+
+@pytest.fixture
+def server(replica, monkeypatch):
+    monkeypatch.setattr(database, "DB_CONNECTED", True)
+    return _fake_server(monkeypatch)
+
+
+def test_replays_in_order_with_temp_ids_mapped(replica, server):
+    book_id = replica.add_book("Dune", "Frank Herbert")
+    _, loan_id = replica.issue_loan(book_id, 1, database.MAX_LOANS, database.LOAN_DAYS)
+    replica.return_loan(loan_id)
+    assert book_id < 0 and loan_id < 0
+
+    assert database.sync_offline_writes() == {"applied": 3, "conflicts": 0}
+
+    real_book = replica.resolve_id("book", book_id)
+    real_loan = replica.resolve_id("loan", loan_id)
+    assert server.calls == [("add_book", "Dune"), ("issue_loan", real_book), ("return_loan", real_loan)]
+    assert replica.pending_writes() == []
+
+
+def test_rejected_writes_become_conflicts(replica, server):
+    _, loan_id = replica.issue_loan(1, 1, database.MAX_LOANS, database.LOAN_DAYS)
+    replica.return_loan(loan_id)
+    server.copies[1] = 0   # someone else took the last copy while we were offline
+
+    assert database.sync_offline_writes() == {"applied": 0, "conflicts": 2}
+    assert [(c["op"], c["detail"]) for c in replica.conflicts()] == [
+        ("issue_loan", "no_copies"), ("return_loan", "loan was never issued online")]
+
+
+def test_crash_after_commit_is_not_applied_twice(replica, server, monkeypatch):
+    book_id = replica.add_book("Dune", "Frank Herbert")
+    _, loan_id = replica.issue_loan(book_id, 1, database.MAX_LOANS, database.LOAN_DAYS)
+    mark = replica.mark
+
+    def crash_on_second(seq, status, detail=None):
+        if seq == 2:
+            raise KeyboardInterrupt   # process dies after PostgreSQL committed entry 2
+        mark(seq, status, detail)
+
+    monkeypatch.setattr(replica, "mark", crash_on_second)
+    with pytest.raises(KeyboardInterrupt):
+        database.sync_offline_writes()
+    monkeypatch.setattr(replica, "mark", mark)
+
+    assert database.sync_offline_writes() == {"applied": 1, "conflicts": 0}
+    assert server.calls == [("add_book", "Dune"), ("issue_loan", replica.resolve_id("book", book_id))]
+    assert len(server.offline_writes) == 2
+    assert replica.resolve_id("loan", loan_id) == server.offline_writes[(replica.replica_id(), 2)]["result_id"]
+
+
+def test_connection_loss_leaves_the_rest_pending(replica, server):
+    replica.add_book("Dune", "Frank Herbert")
+    replica.add_book("Emma", "Jane Austen")
+    server.down = True
+
+    assert database.sync_offline_writes() == {"applied": 0, "conflicts": 0}
+    assert [w["seq"] for w in replica.pending_writes()] == [1, 2]
+
+    server.down = False
+    assert database.sync_offline_writes() == {"applied": 2, "conflicts": 0}
+
+
+def test_replica_id_is_stable(replica):
+    assert replica.replica_id() == replica.replica_id()
+    assert len(replica.replica_id()) == 32
+
+
+def test_sync_loop_retries_a_replay_that_stopped_early(replica, server):
+    replica.add_book("Dune", "Frank Herbert")
+    server.down = True
+    database.sync_offline_writes()
+    server.down = False
+
+    assert database._replay_pending() == {"applied": 1, "conflicts": 0}
+    assert database._replay_pending() is None   # nothing left to do
+
+
+def test_restart_online_replays_a_pending_journal(tmp_path, monkeypatch):
+    path = str(tmp_path / "replica.db")
+    _synced_replica(path).add_book("Dune", "Frank Herbert")   # queued before the last run ended
+    server = _fake_server(monkeypatch)
+    monkeypatch.setattr(database, "REPLICA_PATH", path)
+    monkeypatch.setattr(database, "DB_CONNECTED", None)
+    monkeypatch.setattr(database, "pool", None)
+    monkeypatch.setattr(database, "ConnectionPool", lambda settings: object())
+    monkeypatch.setattr(database, "_start_thread", lambda target, name: None)
+
+    assert database.connect()
+
+    assert server.calls == [("add_book", "Dune")]
+    assert database.replica.pending_writes() == []
+
+
+def test_offline_loan_rows_carry_the_member(replica, monkeypatch):
+    monkeypatch.setattr(database, "OFFLINE", True)
+    _, loan_id = replica.issue_loan(1, 1, database.MAX_LOANS, database.LOAN_DAYS)
+
+    loan = database.get_active_loan(loan_id)   # the kiosk checks ownership with this
+
+    assert (loan.loan_id, loan.member_id, loan.book_id) == (loan_id, 1, 1)
+
+
+def test_remembered_login_reuses_the_server_hash(replica, monkeypatch):
+    stored = database.passwords.hash_password("123")
+    monkeypatch.setattr(database.passwords, "hash_password", None)   # no second hash on login
+
+    database.remember_login("john@example.com", stored, {"role": "Member", "member_id": 1})
+
+    assert replica.authenticate("john@example.com", "123") == {
+        "username": "john@example.com", "role": "Member", "member_id": 1}
+    assert replica.authenticate("john@example.com", "wrong") is None
+
+
+def test_login_does_not_create_a_replica(tmp_path, monkeypatch):
+    path = tmp_path / "replica.db"
+    monkeypatch.setattr(database, "REPLICA_PATH", str(path))
+    monkeypatch.setattr(database, "replica", None)
+
+    database.remember_login("john@example.com", "scrypt$...", {"role": "Member", "member_id": 1})
+
+    assert not path.exists()
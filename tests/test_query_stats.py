@@ -0,0 +1,67 @@
+# tests/test_query_stats.py
+# Timed cursors count each fetched row once, whether it is fetched or iterated
+import pytest
+
+import query_stats
+
+
+class _Cursor:
+    """Stands in for a psycopg2 cursor; like the extras cursors, iterating it goes through fetchmany()."""
+    itersize = 2
+    arraysize = 1
+    name = None
+    rowcount = -1
+
+    def execute(self, query, vars=None):
+        self._rows = [{"book_id": i, "title": f"Book {i}"} for i in range(5)]
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def __iter__(self):
+        while True:
+            rows = self.fetchmany(self.itersize)
+            if not rows:
+                return
+            yield from rows
+
+
+class _TimedCursor(query_stats._Timed, _Cursor):
+    pass
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    fresh = query_stats.QueryStats(slow_ms=0, data_layer=__file__)
+    monkeypatch.setattr(query_stats, "stats", fresh)
+    return fresh
+
+
+def _rows_counted(stats):
+    return [q["rows"] for q in stats.snapshot()["queries"]]
+
+
+def test_iterating_counts_each_row_once(stats):
+    cursor = _TimedCursor()
+    cursor.execute("SELECT book_id, title FROM books")
+
+    assert [row["book_id"] for row in cursor] == [0, 1, 2, 3, 4]
+    assert _rows_counted(stats) == [5]
+
+
+def test_fetch_methods_count_rows(stats):
+    cursor = _TimedCursor()
+    cursor.execute("SELECT book_id, title FROM books")
+    cursor.fetchone()
+    cursor.fetchmany(2)
+    cursor.fetchall()
+
+    assert _rows_counted(stats) == [5]
@@ -0,0 +1,40 @@
+# tests/test_recommender.py
+# Co-borrowing counts come out the same however the loan history is batched,
+# and a later run only adds the loans after the watermark
+import database
+import recommender
+
+
+def _borrow(demo, member_id, book_id):
+    demo.add("loans", {"loan_id": demo.allocate("loans"), "book_id": book_id, "member_id": member_id,
+                       "title": demo.books.get(book_id)["title"], "loan_date": "2025-01-01",
+                       "due_date": "2025-01-15", "return_date": "2025-01-10"})
+
+
+def _matrix(demo):
+    return {r["book_id"]: dict(map(tuple, r["counts"])) for r in demo.book_cooccurrence.all()}
+
+
+def test_batch_size_does_not_change_the_counts(demo):
+    for member_id, book_id in [(1, 1), (2, 1), (1, 2), (2, 3), (1, 1), (2, 2), (1, 3)]:
+        _borrow(demo, member_id, book_id)
+
+    whole = recommender.update_index(rebuild=True)
+    expected = _matrix(demo)
+    one_by_one = recommender.update_index(rebuild=True, event_batch=1)
+
+    assert whole["loans"] == one_by_one["loans"] == len(demo.loans.where())
+    assert _matrix(demo) == expected
+    assert expected[1] == {1: 2, 2: 2, 3: 2}   # both members borrowed book 1 with 2 and 3
+
+
+def test_next_run_folds_in_only_new_loans(demo):
+    _borrow(demo, 1, 1)
+    recommender.update_index(rebuild=True)
+    _borrow(demo, 1, 2)
+
+    stats = recommender.update_index(event_batch=1)
+
+    assert stats["loans"] == 1
+    assert _matrix(demo)[2] == {1: 1, 2: 1}
+    assert database.get_recommender_watermark() == stats["watermark"]
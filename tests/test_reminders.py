@@ -0,0 +1,94 @@
+# tests/test_reminders.py
+# Reminder pipeline idempotency: one message per loan, kind and due date, across
+# repeated and concurrent runs; failed sends are released and retried
+import threading
+from datetime import date, timedelta
+
+import database
+import reminders
+
+
+class RecordingSender:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        if self.fail:
+            raise ConnectionError("SMTP down")
+        with self._lock:
+            self.sent.append(message)
+
+    def close(self):
+        pass
+
+
+def _loan(demo, member_id, book_id, due_in_days):
+    due = date.today() + timedelta(days=due_in_days)
+    return demo.add("loans", {
+        "loan_id": demo.allocate("loans"), "book_id": book_id, "member_id": member_id,
+        "title": demo.books.get(book_id)["title"], "loan_date": str(due - timedelta(days=database.LOAN_DAYS)),
+        "due_date": str(due), "return_date": None})
+
+
+def _run(sender, **options):
+    return reminders.run_reminders(sender, rate=1000.0, **options)
+
+
+def test_each_reminder_is_sent_once(demo):
+    overdue = _loan(demo, 1, 1, -3)
+    due_soon = _loan(demo, 2, 2, 1)
+    _loan(demo, 2, 3, 10)   # not due for a while — no reminder
+    sender = RecordingSender()
+
+    first = _run(sender)
+    second = _run(sender)
+
+    assert (first["sent"], second["selected"], second["sent"]) == (2, 0, 0)
+    assert sorted(m["key"] for m in sender.sent) == sorted([
+        f"overdue:{overdue['loan_id']}:{overdue['due_date']}",
+        f"due_soon:{due_soon['loan_id']}:{due_soon['due_date']}"])
+    assert sender.sent[0]["to"] in ("john@example.com", "jane@example.com")
+
+
+def test_concurrent_runs_never_double_send(demo):
+    for i in range(40):
+        _loan(demo, 1 + i % 2, 1 + i % 3, -1 - i % 5)
+    sender = RecordingSender()
+    runs = [threading.Thread(target=_run, args=(sender,), kwargs={"batch_size": 7}) for _ in range(4)]
+    for t in runs:
+        t.start()
+    for t in runs:
+        t.join()
+
+    keys = [m["key"] for m in sender.sent]
+    assert len(keys) == 40 and len(set(keys)) == 40
+
+
+def test_failed_send_is_released_and_retried(demo):
+    _loan(demo, 1, 1, -2)
+
+    failed = _run(RecordingSender(fail=True))
+    assert (failed["failed"], len(demo.reminders)) == (1, 0)
+
+    sender = RecordingSender()
+    assert _run(sender)["sent"] == 1
+    assert _run(sender)["sent"] == 0
+
+
+def test_claim_is_exclusive(demo):
+    assert database.claim_reminder("overdue:1:2025-01-01", 1, 1, "overdue")
+    assert not database.claim_reminder("overdue:1:2025-01-01", 1, 1, "overdue")
+    database.release_reminder("overdue:1:2025-01-01")
+    assert database.claim_reminder("overdue:1:2025-01-01", 1, 1, "overdue")
+
+
+def test_new_due_date_is_a_new_reminder(demo):
+    loan = _loan(demo, 1, 1, -1)
+    sender = RecordingSender()
+    _run(sender)
+    demo.update("loans", loan["loan_id"], due_date=str(date.today() - timedelta(days=2)))   # renewed, overdue again
+
+    assert _run(sender)["sent"] == 1
+    assert len({m["key"] for m in sender.sent}) == 2